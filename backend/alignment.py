@@ -0,0 +1,137 @@
+"""
+Linear-time alignment of GPT speaker turns to Whisper timestamps.
+
+All Whisper words (or segment text, when word timestamps are not
+available) are flattened once into a normalized token stream with a
+start/end time per token. Each turn's tokens are then matched against
+that stream in a single forward pass: the stream pointer only moves
+forward and every search is bounded, so the whole alignment is
+O(stream tokens + turn tokens).
+"""
+import re
+import unicodedata
+
+_TOKEN_RE = re.compile(r"[\w']+", re.UNICODE)
+
+# How far ahead in the stream to look for a turn's first word, and how
+# many stream tokens may be skipped inside a turn before giving up
+ANCHOR_LOOKAHEAD = 200
+MAX_SKIP = 4
+
+
+def normalize_tokens(text):
+    """Lowercase, strip accents and punctuation, split into word tokens"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return _TOKEN_RE.findall(text)
+
+
+def build_token_stream(transcript):
+    """
+    Flatten the transcript into [(token, start, end)].
+
+    Uses word-level timestamps when Whisper returned them; otherwise
+    spreads each segment's duration over its tokens by character length.
+    """
+    stream = []
+    words = getattr(transcript, 'words', None)
+    if words:
+        for word in words:
+            for token in normalize_tokens(word.word):
+                stream.append((token, word.start, word.end))
+        return stream
+
+    for segment in getattr(transcript, 'segments', None) or []:
+        tokens = normalize_tokens(segment.text)
+        if not tokens:
+            continue
+        total_chars = sum(len(t) for t in tokens)
+        duration = segment.end - segment.start
+        position = segment.start
+        for token in tokens:
+            token_duration = duration * len(token) / total_chars
+            stream.append((token, round(position, 3), round(position + token_duration, 3)))
+            position += token_duration
+    return stream
+
+
+def _find_anchor(stream, pos, tokens):
+    """First stream index >= pos where one of the turn's first tokens appears"""
+    limit = min(len(stream), pos + ANCHOR_LOOKAHEAD)
+    probes = tokens[:3]
+    for j in range(pos, limit):
+        for k, probe in enumerate(probes):
+            if stream[j][0] == probe:
+                return j, k
+    return None, None
+
+
+def segment_word_stream(segments):
+    """
+    Flatten segment text into [(token, segment id, word index)], with
+    word indices into segment.text.split() (the positions turn starts use).
+    """
+    stream = []
+    for segment_id, segment in enumerate(segments):
+        for word_index, word in enumerate(segment.text.split()):
+            for token in normalize_tokens(word):
+                stream.append((token, segment_id, word_index))
+    return stream
+
+
+def _match_turns(conversation, stream):
+    """Yield (first, last) stream indices of each turn, or (None, None) if it cannot be matched"""
+    pos = 0
+    for turn in conversation:
+        tokens = normalize_tokens(turn.get('text', ''))
+        first = last = None
+
+        j, k = _find_anchor(stream, pos, tokens) if tokens else (None, None)
+        if j is not None:
+            first = last = j
+            i = k + 1
+            j += 1
+            while i < len(tokens) and j < len(stream):
+                if stream[j][0] == tokens[i]:
+                    last = j
+                    i += 1
+                    j += 1
+                    continue
+                # Skip a few stream tokens (words GPT dropped) or one turn token (word GPT altered)
+                for skip in range(1, MAX_SKIP + 1):
+                    if j + skip < len(stream) and stream[j + skip][0] == tokens[i]:
+                        j += skip
+                        break
+                else:
+                    i += 1
+            pos = last + 1
+
+        yield first, last
+
+
+def align_turns(conversation, transcript):
+    """
+    Set 'start' and 'end' on every turn from the Whisper timestamps.
+
+    Turns are matched in order; a turn that cannot be matched is placed
+    at the end of the previous turn.
+    """
+    stream = build_token_stream(transcript)
+    previous_end = stream[0][1] if stream else 0
+
+    for turn, (first, last) in zip(conversation, _match_turns(conversation, stream)):
+        if first is not None:
+            turn['start'] = stream[first][1]
+            turn['end'] = stream[last][2]
+            previous_end = turn['end']
+        else:
+            turn['start'] = previous_end
+            turn['end'] = previous_end
+
+    return conversation
+
+
+def turn_word_starts(conversation, segments):
+    """(segment id, word index) of each turn's first aligned word, or None if it cannot be matched"""
+    stream = segment_word_stream(segments)
+    return [stream[first][1:] if first is not None else None for first, _ in _match_turns(conversation, stream)]
@@ -0,0 +1,515 @@
+"""
+ASGI entry point: the transcription, translation and SOAP endpoints
+served natively on asyncio, everything else by the Flask app.
+
+Run from backend/:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+/api/transcribe, /api/translate and /api/generate-soap keep the Flask
+contracts but await AsyncOpenAI (one shared connection pool) instead of
+holding a thread per request, so a single process can keep hundreds of
+consults in flight. Fan-out calls (segmentation windows, translation
+batches) are gathered on the event loop. Blocking work (ffmpeg, long
+audio, the disk caches, diarization) runs in a bounded thread pool.
+
+All other routes (streaming, jobs, SOAP streaming, health, metrics,
+traces, the frontend) are the Flask app mounted through a WSGI adapter.
+Configuration, caches, rate limits, metrics and traces are shared with
+server.py. The request profiler (PROFILE_SAMPLE_RATE) only covers the
+Flask routes.
+"""
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import server
+import async_pipeline
+from server import metrics, stage_timer, count_error, translation_memory, transcript_cache
+from openai_client import AsyncStageClients, create_async_client
+from translation import is_english, join_segment_translations
+from transcript_cache import audio_cache_key
+from audio_prep import normalize_audio, remap_timestamps
+from long_audio import transcribe_long_audio
+from soap import format_dialogue
+from tracing import end_trace, new_trace_id, span, start_trace, upstream_trace_id
+
+logger = logging.getLogger(__name__)
+
+# Threads for blocking work called from the event loop, and for the mounted Flask routes
+ASGI_BLOCKING_THREADS = int(os.getenv("ASGI_BLOCKING_THREADS", 32))
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", 16))
+
+# AsyncOpenAI client, created in the event loop at startup
+async_client = None
+
+stage_clients = AsyncStageClients(
+    get_client=lambda: async_client,
+    # Shared with the Flask app: one set of latency stats and hedge delays per stage
+    policies=server.stage_clients.policies,
+    limiter=server.rate_limiter,
+    count_tokens=server.count_tokens,
+    on_usage=server.record_token_usage
+)
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization,Accept,Origin,X-Requested-With,ngrok-skip-browser-warning,X-Trace-Id',
+    'Access-Control-Allow-Methods': 'GET,POST,OPTIONS,PUT,DELETE',
+    'Access-Control-Expose-Headers': 'Content-Type,Content-Length,Server-Timing,X-Trace-Id',
+    'Access-Control-Allow-Credentials': 'true',
+    'Access-Control-Max-Age': '3600',
+    'Cache-Control': 'no-cache, no-store, must-revalidate',
+    'Pragma': 'no-cache',
+    'Expires': '0'
+}
+
+
+def api_endpoint(rule):
+    """
+    Wrap an async handler with what the Flask app's request hooks do:
+    CORS preflight, the 503 without an API key, in-flight accounting,
+    metrics, the request trace and its response headers.
+    """
+    def decorator(handler):
+        async def endpoint(request):
+            started = time.perf_counter()
+            trace = None
+            metrics.add_gauge("http_requests_in_flight", 1)
+            with server.active_requests_lock:
+                server.active_requests += 1
+            try:
+                if request.method == 'OPTIONS':
+                    response = JSONResponse({})
+                elif async_client is None:
+                    response = JSONResponse({"error": "OpenAI API key not configured on the server"}, 503)
+                else:
+                    if server.TRACE_ENABLED:
+                        trace = start_trace(
+                            new_trace_id(), f"{request.method} {request.url.path}",
+                            upstream_trace_id(request.headers.get('X-Trace-Id'))
+                        )
+                        server.trace_store.add(trace)
+                    try:
+                        response = await handler(request)
+                    except Exception as e:
+                        count_error(e)
+                        logger.error(f"Server error: {e}", exc_info=True)
+                        response = JSONResponse({"error": f"Server error: {str(e)}"}, 500)
+            finally:
+                metrics.add_gauge("http_requests_in_flight", -1)
+                with server.active_requests_lock:
+                    server.active_requests -= 1
+
+            metrics.inc("http_requests_total", endpoint=rule, method=request.method, status=response.status_code)
+            metrics.observe("http_request_duration_seconds", time.perf_counter() - started, endpoint=rule)
+
+            if trace is not None:
+                trace.finish(status=response.status_code)
+                end_trace()
+                response.headers['X-Trace-Id'] = trace.id
+                if server.TRACE_SERVER_TIMING:
+                    response.headers['Server-Timing'] = trace.server_timing()
+
+            response.headers['Access-Control-Allow-Origin'] = request.headers.get('Origin') or '*'
+            response.headers.update(CORS_HEADERS)
+            return response
+
+        return Route(rule, endpoint, methods=['POST', 'OPTIONS'])
+    return decorator
+
+
+class BodyTooLarge(Exception):
+    """Raised while reading a request body that passes MAX_CONTENT_LENGTH"""
+
+
+def too_large_response(limit):
+    limit_mb = (limit - 1024 * 1024) // (1024 * 1024)
+    return JSONResponse({"error": f"File too large. Maximum size is {limit_mb}MB"}, 413)
+
+
+def request_too_large(request):
+    """413 response when the declared body exceeds the Flask app's MAX_CONTENT_LENGTH, else None"""
+    limit = server.app.config['MAX_CONTENT_LENGTH']
+    try:
+        length = int(request.headers.get('content-length', 0))
+    except ValueError:
+        length = 0
+    if length <= limit:
+        return None
+    return too_large_response(limit)
+
+
+def counted_request(request, limit):
+    """
+    The request with a receive channel that counts body bytes and raises
+    BodyTooLarge past the limit, so chunked or mislabelled uploads are
+    cut off while streaming instead of trusting Content-Length
+    """
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > limit:
+                raise BodyTooLarge()
+        return message
+
+    return Request(request.scope, receive)
+
+
+async def read_audio_form(request):
+    """Parse the multipart body; returns (form, audio UploadFile, None) or (form, None, error_response)"""
+    too_large = request_too_large(request)
+    if too_large is not None:
+        return None, None, too_large
+    limit = server.app.config['MAX_CONTENT_LENGTH']
+    request = counted_request(request, limit)
+    try:
+        with stage_timer("upload"):
+            form = await request.form(max_part_size=limit)
+    except BodyTooLarge:
+        logger.error(f"Upload passed {limit} bytes while reading")
+        return None, None, too_large_response(limit)
+    audio_file = form.get('audio')
+    if not isinstance(audio_file, UploadFile):
+        logger.error("No audio file in request")
+        return form, None, JSONResponse({"error": "No audio file provided"}, 400)
+    if not audio_file.filename:
+        return form, None, JSONResponse({"error": "No selected file"}, 400)
+    metrics.inc("upload_bytes_total", audio_file.size or 0, endpoint=request.url.path)
+    return form, audio_file, None
+
+
+async def run_transcription(audio_stream, upload, cache_key=None):
+    """
+    Async run_transcription (see server.py): Whisper, then segmentation
+    and translation of the Whisper segments concurrently, then the join.
+    Diarization runs in the thread pool from the start.
+    """
+    language = upload["language"]
+    started = time.perf_counter()
+    timings = {}
+
+    async def timed(name, coroutine):
+        offset = time.perf_counter() - started
+        try:
+            return await coroutine
+        finally:
+            timings[name] = {
+                "start": round(offset, 3),
+                "seconds": round(time.perf_counter() - started - offset, 3)
+            }
+
+    diarization_future = None
+    if server.diarizer is not None:
+        audio_stream.seek(0)
+        diarization_future = server.diarizer.submit(audio_stream.read(), upload["format"])
+
+    async def diarize():
+        if diarization_future is None:
+            return None
+        with stage_timer("diarization"):
+            return await asyncio.to_thread(server.diarizer.result, diarization_future)
+
+    async def transcribe():
+        stream = audio_stream
+        stream.seek(0)
+        long_audio = upload["long_audio"]
+        filename = upload["filename"]
+        preprocessing = None
+        offset_map = None
+        if server.AUDIO_NORMALIZE_ENABLED and (server.VAD_ENABLED or not upload.get("long_audio_requested")):
+            with stage_timer("normalize"):
+                stream, filename, preprocessing, offset_map = await asyncio.to_thread(
+                    normalize_audio,
+                    stream,
+                    filename,
+                    upload["format"],
+                    target=server.AUDIO_NORMALIZE_FORMAT,
+                    bitrate=server.AUDIO_NORMALIZE_BITRATE,
+                    vad=server.VAD_OPTIONS if server.VAD_ENABLED else None
+                )
+            if long_audio and not upload.get("long_audio_requested") and preprocessing["upload_bytes"] <= server.WHISPER_MAX_BYTES:
+                logger.info("📦 Normalized audio fits a single Whisper request")
+                long_audio = False
+
+        with stage_timer("whisper"):
+            if long_audio:
+                # Chunking needs ffmpeg and its own thread pool: keep the synchronous pipeline
+                transcript = await asyncio.to_thread(
+                    transcribe_long_audio,
+                    server.stage_clients.get("whisper"),
+                    stream,
+                    file_format=filename.split('.')[-1].lower(),
+                    language=language,
+                    chunk_seconds=server.LONG_AUDIO_CHUNK_SECONDS,
+                    overlap_seconds=server.LONG_AUDIO_OVERLAP_SECONDS,
+                    max_workers=server.LONG_AUDIO_WORKERS,
+                    word_timestamps=server.WHISPER_WORD_TIMESTAMPS
+                )
+            else:
+                logger.info("🎤 Sending to OpenAI Whisper...")
+                transcript = await stage_clients.get("whisper").audio.transcriptions.create(
+                    **server.whisper_params(filename, stream, language)
+                )
+
+        logger.info(f"✅ Transcription successful: {len(transcript.text)} characters")
+
+        if offset_map is not None:
+            remap_timestamps(transcript, offset_map, preprocessing["vad"]["original_seconds"])
+        return transcript, preprocessing
+
+    diarization = asyncio.ensure_future(timed("diarization", diarize()))
+    try:
+        transcript, preprocessing = await timed("whisper", transcribe())
+    except BaseException:
+        diarization.cancel()
+        raise
+    detected_language = getattr(transcript, 'language', 'en')
+
+    segmentation_stats = {}
+
+    async def segment():
+        with stage_timer("segmentation"):
+            conversation = await async_pipeline.segment_conversation(
+                stage_clients.get("segmentation"),
+                transcript,
+                mode=server.SEGMENTATION_MODE,
+                max_tokens=server.SEGMENTATION_MAX_TOKENS,
+                window_overlap=server.SEGMENTATION_WINDOW_OVERLAP,
+                stats=segmentation_stats
+            )
+        if "alignment_seconds" in segmentation_stats:
+            metrics.observe("stage_duration_seconds", segmentation_stats["alignment_seconds"], stage="alignment")
+        return conversation
+
+    async def translate_whisper_segments():
+        segments = getattr(transcript, 'segments', None)
+        if not server.PIPELINE_OVERLAP_ENABLED or is_english(detected_language) or not segments:
+            return None
+        with stage_timer("segment_translation"):
+            return await async_pipeline.translate_segments(
+                stage_clients.get("translation"), segments, detected_language, translation_memory,
+                batch_size=server.TRANSLATION_BATCH_SIZE
+            )
+
+    translation_stats = {}
+
+    async def translate(conversation, segment_translations):
+        if segment_translations is None:
+            translation_stats["mode"] = "turns"
+            with stage_timer("translation"):
+                return await async_pipeline.translate_conversation(
+                    stage_clients.get("translation"), conversation, detected_language, translation_memory,
+                    batch_size=server.TRANSLATION_BATCH_SIZE
+                )
+
+        with stage_timer("translation"):
+            leftover = join_segment_translations(conversation, transcript.segments, segment_translations)
+            if leftover:
+                await async_pipeline.translate_conversation(
+                    stage_clients.get("translation"), leftover, detected_language, translation_memory,
+                    batch_size=server.TRANSLATION_BATCH_SIZE
+                )
+        translation_stats.update({
+            "mode": "segments",
+            "segments": len(segment_translations),
+            "joined_turns": len(conversation) - len(leftover),
+            "retranslated_turns": len(leftover)
+        })
+        return conversation.copy()
+
+    try:
+        conversation, segment_translations = await asyncio.gather(
+            timed("segmentation", segment()),
+            timed("segment_translation", translate_whisper_segments())
+        )
+        translated_conversation = await timed("translation", translate(conversation, segment_translations))
+        speaker_turns = await diarization
+    finally:
+        diarization.cancel()
+    timings["total"] = {"start": 0.0, "seconds": round(time.perf_counter() - started, 3)}
+
+    response_data = server.transcription_response(
+        upload, transcript, preprocessing, conversation, translated_conversation,
+        speaker_turns, segmentation_stats, translation_stats, timings
+    )
+
+    if cache_key:
+        await asyncio.to_thread(transcript_cache.put, cache_key, response_data)
+
+    return response_data
+
+
+@api_endpoint('/api/transcribe')
+async def transcribe_audio(request):
+    """Transcribe audio to text"""
+    logger.info("📥 Received transcription request")
+
+    form, audio_file, error_response = await read_audio_form(request)
+    try:
+        if error_response:
+            return error_response
+
+        upload, error = server.describe_upload(audio_file.filename, audio_file.size, form)
+        if error:
+            return JSONResponse(error, 400)
+
+        logger.info(f"📄 Processing file: {upload['filename']}, Size: {upload['size']} bytes")
+
+        # Serve repeated uploads of the same audio from the transcript cache
+        with span("cache_lookup") as attrs:
+            cache_key = await asyncio.to_thread(audio_cache_key, audio_file.file, 'transcribe', upload["language"])
+            cached = await asyncio.to_thread(server.cached_transcription, cache_key, upload)
+            attrs["hit"] = cached is not None
+        if cached is not None:
+            if server.SOAP_SPECULATIVE_ENABLED and cached.get("conversation"):
+                cached["soap_key"] = server.soap_speculator.speculate(format_dialogue(cached["conversation"]))
+            return JSONResponse(cached)
+
+        try:
+            return JSONResponse(await run_transcription(audio_file.file, upload, cache_key))
+        except Exception as e:
+            error, status = server.openai_error(e)
+            return JSONResponse({"error": error}, status)
+    finally:
+        if form is not None:
+            await form.close()
+
+
+@api_endpoint('/api/translate')
+async def translate_audio(request):
+    """Translate audio to English"""
+    logger.info("🌍 Received translation request")
+
+    form, audio_file, error_response = await read_audio_form(request)
+    try:
+        if error_response:
+            return error_response
+
+        # Serve repeated uploads of the same audio from the transcript cache
+        cache_key = await asyncio.to_thread(audio_cache_key, audio_file.file, 'translate')
+        cached = await asyncio.to_thread(transcript_cache.get, cache_key)
+        if cached is not None:
+            logger.info("⚡ Transcript cache hit")
+            cached["cached"] = True
+            return JSONResponse(cached)
+
+        try:
+            logger.info("🌐 Translating with OpenAI Whisper...")
+
+            filename = audio_file.filename or 'audio.mp3'
+            audio_stream = audio_file.file
+            audio_stream.seek(0)
+            preprocessing, offset_map = None, None
+            if server.AUDIO_NORMALIZE_ENABLED:
+                with stage_timer("normalize"):
+                    audio_stream, filename, preprocessing, offset_map = await asyncio.to_thread(
+                        normalize_audio,
+                        audio_stream,
+                        filename,
+                        filename.split('.')[-1].lower(),
+                        target=server.AUDIO_NORMALIZE_FORMAT,
+                        bitrate=server.AUDIO_NORMALIZE_BITRATE,
+                        vad=server.VAD_OPTIONS if server.VAD_ENABLED else None
+                    )
+
+            with stage_timer("whisper"):
+                translation = await stage_clients.get("whisper").audio.translations.create(
+                    model="whisper-1",
+                    file=(filename, audio_stream),
+                    response_format="verbose_json"
+                )
+
+            logger.info(f"✅ Translation successful: {len(translation.text)} characters")
+
+            response_data = server.translation_response(translation, preprocessing, offset_map)
+            await asyncio.to_thread(transcript_cache.put, cache_key, response_data)
+
+            return JSONResponse(response_data)
+
+        except Exception as e:
+            count_error(e)
+            logger.error(f"Translation error: {e}")
+            return JSONResponse({"error": f"Translation failed: {str(e)}"}, 500)
+    finally:
+        if form is not None:
+            await form.close()
+
+
+@api_endpoint('/api/generate-soap')
+async def generate_soap(request):
+    """Generate SOAP notes from conversation using fine-tuned model (or update the previous notes)"""
+    logger.info("📋 Received SOAP generation request")
+
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+
+    try:
+        # May wait for speculative generation of the same dialogue
+        soap_request, error = await asyncio.to_thread(server.prepare_soap_request, data)
+        if error:
+            return JSONResponse(error[0], error[1])
+
+        result = None
+        if soap_request["cached"] is None:
+            logger.info(f"🤖 {'Updating' if soap_request['mode'] == 'incremental' else 'Generating'} SOAP notes using fine-tuned model...")
+            with stage_timer("soap"):
+                result = await async_pipeline.generate_soap_notes(
+                    stage_clients.get("soap"), soap_request["dialogue"], soap_request["messages"]
+                )
+            logger.info("✅ SOAP notes generated successfully")
+
+        return JSONResponse(await asyncio.to_thread(server.complete_soap_request, soap_request, result))
+
+    except Exception as e:
+        count_error(e)
+        logger.error(f"SOAP generation error: {e}", exc_info=True)
+        return JSONResponse({"error": f"Failed to generate SOAP notes: {str(e)}"}, 500)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global async_client
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=ASGI_BLOCKING_THREADS, thread_name_prefix="asgi-blocking")
+    )
+    if server.api_key:
+        async_client = create_async_client(
+            server.api_key,
+            max_connections=int(os.getenv("OPENAI_ASYNC_MAX_CONNECTIONS", 200)),
+            max_keepalive=int(os.getenv("OPENAI_ASYNC_MAX_KEEPALIVE", 50)),
+            keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", 60)),
+            connect_timeout=server.OPENAI_CONNECT_TIMEOUT
+        )
+    logger.info("🚀 ASGI app started (async endpoints: transcribe, translate, generate-soap)")
+    try:
+        yield
+    finally:
+        if async_client is not None:
+            await async_client.close()
+            async_client = None
+
+
+app = Starlette(
+    routes=[
+        transcribe_audio,
+        translate_audio,
+        generate_soap,
+        Mount("/", WSGIMiddleware(server.app, workers=ASGI_WSGI_THREADS))
+    ],
+    lifespan=lifespan
+)
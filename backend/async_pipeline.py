@@ -0,0 +1,151 @@
+"""
+Async counterparts of the transcription pipeline stages for the ASGI app
+(see asgi.py). Prompts, parsing, alignment and the translation memory are
+shared with the synchronous modules; only the OpenAI calls are awaited,
+and fan-out (segmentation windows, translation batches) uses
+asyncio.gather instead of thread pools.
+"""
+import asyncio
+import logging
+
+from segmentation import (
+    align_conversation,
+    fallback_conversation,
+    merge_windows,
+    parse_turn_starts,
+    parse_turns,
+    parse_window_starts,
+    plan_segmentation,
+    rebuild_turns,
+    text_turns_request,
+    turn_starts_request,
+    window_request,
+    _log_usage
+)
+from translation import (
+    apply_translations,
+    is_english,
+    parse_translations,
+    plan_translation,
+    translation_request
+)
+from soap import SOAP_MODEL, build_soap_messages, parse_soap_sections
+
+logger = logging.getLogger(__name__)
+
+
+async def segment_conversation(client, transcript, mode="text", max_tokens=None, window_overlap=4, stats=None):
+    """Async segment_conversation (see segmentation.py): windows are segmented concurrently"""
+    conversation = []
+    stats = stats if stats is not None else {}
+    stats.update({"mode": mode, "windows": 1})
+
+    try:
+        logger.info("🤖 Using GPT to identify speakers...")
+
+        windows = plan_segmentation(transcript, max_tokens, window_overlap, stats)
+        if windows:
+            async def run_window(window):
+                sub, request = window_request(transcript, window, mode)
+                return parse_window_starts(await client.chat.completions.create(**request), sub, window, mode)
+
+            window_starts = await asyncio.gather(*(run_window(window) for window in windows))
+            conversation = merge_windows(transcript, windows, window_starts)
+        elif mode == "segments" and getattr(transcript, 'segments', None):
+            gpt_response = await client.chat.completions.create(**turn_starts_request(transcript))
+            _log_usage(gpt_response, "segments")
+            starts = parse_turn_starts(gpt_response.choices[0].message.content, transcript.segments)
+            conversation = rebuild_turns(transcript.segments, starts) if starts else []
+        else:
+            gpt_response = await client.chat.completions.create(**text_turns_request(transcript))
+            _log_usage(gpt_response, "text")
+            conversation = parse_turns(gpt_response.choices[0].message.content)
+
+        align_conversation(conversation, transcript, stats)
+        logger.info(f"✅ GPT segmentation complete: {len(conversation)} turns")
+
+    except Exception as e:
+        logger.error(f"GPT segmentation failed: {e}")
+        conversation = []
+
+    if not conversation and hasattr(transcript, 'segments') and transcript.text.strip():
+        conversation = fallback_conversation(transcript)
+
+    return conversation
+
+
+async def translate_turns(client, turns, source_language, memory=None, max_attempts=3, batch_size=40):
+    """
+    Async translate_turns (see translation.py). Texts missing from the
+    translation memory are sent in batches of batch_size, concurrently.
+    """
+    unique_texts, turn_index = plan_translation(turns, source_language, memory)
+
+    translated = {}
+    pending = list(enumerate(unique_texts))
+    attempts = 0
+    while pending and attempts < max_attempts:
+        attempts += 1
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        logger.info(f"🌐 Batched translation: {len(pending)} turns in {len(batches)} batches (attempt {attempts})")
+        responses = await asyncio.gather(
+            *(client.chat.completions.create(**translation_request(batch)) for batch in batches)
+        )
+        for batch, response in zip(batches, responses):
+            translated.update(parse_translations(response, batch))
+        pending = [(i, text) for i, text in pending if i not in translated]
+
+    if pending:
+        logger.warning(f"⚠️ {len(pending)} turns left untranslated after {attempts} attempts")
+
+    apply_translations(turns, unique_texts, turn_index, translated, source_language, memory)
+    if memory and translated:
+        await asyncio.to_thread(memory.save)
+
+    return turns
+
+
+async def translate_conversation(client, conversation, detected_language, memory=None, batch_size=40):
+    """Async translate_conversation: every turn gets 'text_english'; failures keep the original text"""
+    translated_conversation = conversation.copy()
+
+    if detected_language and not is_english(detected_language):
+        logger.info(f"🌐 Translating from {detected_language} to English...")
+        try:
+            await translate_turns(client, translated_conversation, detected_language, memory, batch_size=batch_size)
+            logger.info("✅ Translation complete")
+        except Exception as e:
+            logger.error(f"Translation error: {e}")
+            for turn in translated_conversation:
+                turn['text_english'] = turn['text']
+    else:
+        for turn in translated_conversation:
+            turn['text_english'] = turn['text']
+
+    return translated_conversation
+
+
+async def translate_segments(client, segments, source_language, memory=None, batch_size=40):
+    """Async translate_segments: English text per Whisper segment, or None if the request failed"""
+    items = [{"text": segment.text.strip()} for segment in segments]
+    try:
+        await translate_turns(client, items, source_language, memory, batch_size=batch_size)
+    except Exception as e:
+        logger.error(f"Segment translation error: {e}")
+        return None
+    return [item['text_english'] for item in items]
+
+
+async def generate_soap_notes(client, dialogue_text, messages=None):
+    """Async SOAP generation with the fine-tuned model (messages: e.g. an incremental update)"""
+    soap_response = await client.chat.completions.create(
+        model=SOAP_MODEL,
+        messages=messages or build_soap_messages(dialogue_text),
+        temperature=0.3
+    )
+    soap_notes = soap_response.choices[0].message.content
+    return {
+        "soap_notes": soap_notes,
+        "soap_sections": parse_soap_sections(soap_notes),
+        "dialogue": dialogue_text
+    }
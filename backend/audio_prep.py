@@ -0,0 +1,190 @@
+"""
+Audio normalization before Whisper: decode, downmix to 16 kHz mono and
+re-encode to a compact format when that makes the upload smaller.
+
+Optionally long silences are cut down to short gaps first (frame-energy
+VAD). An OffsetMap records which original spans were kept so Whisper
+timestamps on the trimmed audio can be mapped back to recording time.
+"""
+import io
+import time
+import logging
+from bisect import bisect_left, bisect_right
+
+logger = logging.getLogger(__name__)
+
+# pydub export settings for each target format
+ENCODINGS = {
+    "opus": {"format": "ogg", "codec": "libopus", "extension": "ogg"},
+    "mp3": {"format": "mp3", "codec": None, "extension": "mp3"}
+}
+
+
+def encode_audio(audio, target="opus", bitrate="24k"):
+    """Encode a pydub AudioSegment at 16 kHz mono; returns (BytesIO, extension)"""
+    encoding = ENCODINGS[target]
+    audio = audio.set_channels(1).set_frame_rate(16000)
+    buffer = io.BytesIO()
+    export_params = {"format": encoding["format"], "bitrate": bitrate}
+    if encoding["codec"]:
+        export_params["codec"] = encoding["codec"]
+    audio.export(buffer, **export_params)
+    buffer.seek(0)
+    return buffer, encoding["extension"]
+
+
+def find_speech_ranges(samples, frame_rate, frame_ms=30, margin_db=12.0, min_silence_ms=1000, keep_silence_ms=300):
+    """
+    Return [(start_sample, end_sample)] ranges to keep from mono PCM samples.
+
+    Frames quieter than the noise floor (10th percentile frame energy) plus
+    margin_db are silent; silent runs of at least min_silence_ms are cut
+    down to keep_silence_ms.
+    """
+    import numpy as np
+
+    frame_len = max(1, int(frame_rate * frame_ms / 1000))
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return [(0, len(samples))]
+
+    frames = np.asarray(samples[:n_frames * frame_len], dtype=np.float64).reshape(n_frames, frame_len)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    db = 20 * np.log10(np.maximum(rms, 1e-10))
+
+    # Never call the loud part of the recording silent (e.g. constant background noise)
+    threshold = min(np.percentile(db, 10) + margin_db, np.percentile(db, 90) - margin_db)
+    silent = db <= threshold
+
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], silent.astype(np.int8), [0]))))
+    run_starts, run_ends = edges[0::2], edges[1::2]
+    long_runs = (run_ends - run_starts) * frame_ms >= min_silence_ms
+    run_starts, run_ends = run_starts[long_runs], run_ends[long_runs]
+    if len(run_starts) == 0:
+        return [(0, len(samples))]
+
+    keep = int(frame_rate * keep_silence_ms / 2000)
+    cut_starts = np.where(run_starts == 0, 0, run_starts * frame_len + keep)
+    cut_ends = np.where(run_ends == n_frames, len(samples), run_ends * frame_len - keep)
+
+    ranges = []
+    position = 0
+    for cut_start, cut_end in zip(cut_starts.tolist(), cut_ends.tolist()):
+        if cut_end <= cut_start:
+            continue
+        if cut_start > position:
+            ranges.append((position, cut_start))
+        position = cut_end
+    if position < len(samples):
+        ranges.append((position, len(samples)))
+    return ranges or [(0, len(samples))]
+
+
+class OffsetMap:
+    """Maps times in trimmed audio back to times in the original recording"""
+
+    def __init__(self, ranges, frame_rate):
+        self.original_starts = []
+        self.trimmed_starts = []
+        self.lengths = []
+        position = 0.0
+        for start, end in ranges:
+            self.original_starts.append(start / frame_rate)
+            self.trimmed_starts.append(position)
+            self.lengths.append((end - start) / frame_rate)
+            position += (end - start) / frame_rate
+
+    def to_original(self, t, end=False):
+        """Original time for trimmed time t; an end time on a cut belongs to the span before it"""
+        index = (bisect_left if end else bisect_right)(self.trimmed_starts, t) - 1
+        index = max(index, 0)
+        offset = min(max(t - self.trimmed_starts[index], 0.0), self.lengths[index])
+        return round(self.original_starts[index] + offset, 3)
+
+
+def trim_silence(audio, frame_ms=30, margin_db=12.0, min_silence_ms=1000, keep_silence_ms=300):
+    """Cut long silences from a mono AudioSegment; returns (audio, OffsetMap or None, stats)"""
+    import numpy as np
+
+    samples = np.array(audio.get_array_of_samples())
+    ranges = find_speech_ranges(samples, audio.frame_rate, frame_ms, margin_db, min_silence_ms, keep_silence_ms)
+    kept = sum(end - start for start, end in ranges)
+    original_seconds = len(samples) / audio.frame_rate
+    stats = {
+        "original_seconds": round(original_seconds, 3),
+        "trimmed_seconds": round(kept / audio.frame_rate, 3),
+        "removed_percent": round(100 * (1 - kept / len(samples)), 1) if len(samples) else 0.0
+    }
+    if kept == len(samples):
+        return audio, None, stats
+
+    trimmed = np.concatenate([samples[start:end] for start, end in ranges])
+    return audio._spawn(trimmed.astype(samples.dtype).tobytes()), OffsetMap(ranges, audio.frame_rate), stats
+
+
+def remap_timestamps(transcript, offset_map, original_duration=None):
+    """Map segment and word timestamps of a transcript of trimmed audio back to recording time"""
+    for item in (getattr(transcript, 'segments', None) or []) + (getattr(transcript, 'words', None) or []):
+        item.start = offset_map.to_original(item.start)
+        item.end = offset_map.to_original(item.end, end=True)
+    if original_duration is not None:
+        transcript.duration = original_duration
+    return transcript
+
+
+def normalize_audio(stream, filename, file_format, target="opus", bitrate="24k", vad=None):
+    """
+    Return (stream, filename, stats, offset_map) for the smallest of the
+    original upload and its 16 kHz mono re-encoding. On decode errors the
+    original is used.
+
+    vad, if given, is a dict of trim_silence() options; when silence is
+    removed the trimmed audio is always used and offset_map maps its
+    timestamps back to the original (otherwise offset_map is None).
+    """
+    from pydub import AudioSegment
+
+    started = time.perf_counter()
+    stream.seek(0, io.SEEK_END)
+    original_bytes = stream.tell()
+    stream.seek(0)
+
+    stats = {
+        "original_bytes": original_bytes,
+        "upload_bytes": original_bytes,
+        "normalized": False
+    }
+
+    offset_map = None
+    try:
+        audio = AudioSegment.from_file(stream, format=file_format).set_channels(1).set_frame_rate(16000)
+        if vad is not None:
+            audio, offset_map, stats["vad"] = trim_silence(audio, **vad)
+            logger.info(
+                f"🔇 VAD removed {stats['vad']['removed_percent']}% of audio "
+                f"({stats['vad']['original_seconds']}s → {stats['vad']['trimmed_seconds']}s)"
+            )
+        encoded, extension = encode_audio(audio, target, bitrate)
+    except Exception as e:
+        logger.warning(f"⚠️ Audio normalization skipped: {e}")
+        stream.seek(0)
+        stats.pop("vad", None)
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        return stream, filename, stats, None
+
+    encoded_bytes = encoded.getbuffer().nbytes
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    stream.seek(0)
+
+    if encoded_bytes >= original_bytes and offset_map is None:
+        logger.info(f"🎚️ Keeping original audio ({original_bytes} bytes, re-encode would be {encoded_bytes})")
+        return stream, filename, stats, None
+
+    saved = max(original_bytes - encoded_bytes, 0)
+    logger.info(
+        f"🎚️ Normalized audio to 16 kHz mono {target}: {original_bytes} → {encoded_bytes} bytes "
+        f"(saved {saved} bytes, {saved * 100 / original_bytes:.0f}%) in {stats['seconds']}s"
+    )
+    stats.update({"upload_bytes": encoded_bytes, "normalized": True, "format": extension})
+    base_name = filename.rsplit('.', 1)[0] if '.' in filename else filename
+    return encoded, f"{base_name}.{extension}", stats, offset_map
@@ -0,0 +1,180 @@
+"""
+Bulk transcription: audio files read one at a time from a multipart
+upload or a zip/tar archive, processed by a bounded worker pool and
+reported in completion order.
+
+Only max_pending files are read ahead of the workers, each archive
+member into a spooled buffer (memory up to spool_size, then a temporary
+file), so memory stays bounded however many files a batch holds.
+Uploaded files that are already seekable (multipart uploads, spooled by
+the form parser) are used as they are rather than copied again. Tar
+archives are read sequentially from the request stream; zip archives
+need their central directory, so they must be seekable (e.g. a spooled
+upload).
+"""
+import os
+import tarfile
+import zipfile
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+ZIP_CONTENT_TYPES = ('application/zip', 'application/x-zip-compressed')
+TAR_CONTENT_TYPES = ('application/x-tar', 'application/gzip', 'application/x-gzip',
+                     'application/x-bzip2', 'application/x-xz', 'application/x-gtar')
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class BatchFile:
+    """One file of a batch: a seekable stream of its audio, or the reason it couldn't be read"""
+
+    def __init__(self, index, filename, stream=None, error=None):
+        self.index = index
+        self.filename = filename
+        self.stream = stream
+        self.error = error
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+class TooManyFilesError(Exception):
+    """Raised when a batch holds more files than allowed"""
+
+
+def is_archive(filename):
+    return (filename or '').lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def spool(source, spool_size, max_bytes):
+    """Copy source into a rewound spooled buffer; None if it is larger than max_bytes"""
+    buffer = tempfile.SpooledTemporaryFile(max_size=spool_size, mode="rb+")
+    copied = 0
+    while True:
+        chunk = source.read(COPY_CHUNK_SIZE)
+        if not chunk:
+            break
+        copied += len(chunk)
+        if copied > max_bytes:
+            buffer.close()
+            return None
+        buffer.write(chunk)
+    buffer.seek(0)
+    return buffer
+
+
+def _stream_size(readable):
+    readable.seek(0, os.SEEK_END)
+    size = readable.tell()
+    readable.seek(0)
+    return size
+
+
+def _skipped(name):
+    # Directory metadata added by archivers (macOS resource forks, dotfiles)
+    base = os.path.basename(name)
+    return not base or base.startswith('.') or name.startswith('__MACOSX/')
+
+
+def _archive_members(fileobj, filename):
+    """Yield (name, readable) for each regular file of a zip or tar archive"""
+    if (filename or '').lower().endswith('.zip'):
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or _skipped(info.filename):
+                    continue
+                with archive.open(info) as member:
+                    yield info.filename, member
+    else:
+        # "r|*": sequential read with transparent decompression, no seeking
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for member in archive:
+                if not member.isfile() or _skipped(member.name):
+                    continue
+                yield member.name, archive.extractfile(member)
+
+
+def iter_batch_files(uploads, spool_size, max_file_bytes, max_files):
+    """
+    Yield a BatchFile per audio file in uploads, a list of (filename,
+    readable) pairs. Archives are expanded in place. Files over
+    max_file_bytes are yielded with an error instead of their audio.
+    """
+    index = 0
+    too_large = f"File too large. Maximum size is {max_file_bytes // (1024 * 1024)}MB"
+    for filename, readable in uploads:
+        if is_archive(filename):
+            members = _archive_members(readable, filename)
+        elif readable.seekable():
+            # Already spooled: no copy needed
+            if index >= max_files:
+                raise TooManyFilesError(f"Batch holds more than {max_files} files")
+            if _stream_size(readable) > max_file_bytes:
+                yield BatchFile(index, filename, error=too_large)
+            else:
+                yield BatchFile(index, filename, readable)
+            index += 1
+            continue
+        else:
+            members = [(filename, readable)]
+        for name, member in members:
+            if index >= max_files:
+                raise TooManyFilesError(f"Batch holds more than {max_files} files")
+            stream = spool(member, spool_size, max_file_bytes)
+            if stream is None:
+                yield BatchFile(index, name, error=too_large)
+            else:
+                yield BatchFile(index, name, stream)
+            index += 1
+
+
+def run_batch(files, process, max_workers=4, max_pending=8):
+    """
+    Run process(batch_file) for each file in a thread pool and yield
+    (batch_file, future) as each finishes, in completion order. At most
+    max_pending files are read from files ahead of the results; each
+    file's buffer is closed once its result has been yielded. If reading
+    files fails (e.g. a corrupt archive), the files already read are
+    finished and then the error is raised. Closing the generator early
+    cancels the files not started yet.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch")
+    files = iter(files)
+    running = {}
+    exhausted = False
+    read_error = None
+    try:
+        while True:
+            while not exhausted and len(running) < max(max_pending, max_workers):
+                try:
+                    batch_file = next(files, None)
+                except Exception as e:
+                    read_error = e
+                    batch_file = None
+                if batch_file is None:
+                    exhausted = True
+                    break
+                running[executor.submit(process, batch_file)] = batch_file
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch_file = running.pop(future)
+                try:
+                    yield batch_file, future
+                finally:
+                    batch_file.close()
+        if read_error is not None:
+            raise read_error
+    finally:
+        for future, batch_file in running.items():
+            # Files already being processed finish in the background; their results are dropped
+            future.cancel()
+            future.add_done_callback(lambda _, batch_file=batch_file: batch_file.close())
+        executor.shutdown(wait=False)
@@ -0,0 +1,105 @@
+"""
+Benchmark audio normalization on sample files: upload bytes and latency
+before and after re-encoding to 16 kHz mono.
+
+Usage (from backend/):
+    python benchmarks/make_samples.py --out samples --compressed
+    python benchmarks/audio_prep_benchmark.py samples/*.wav samples/*.m4a
+    python benchmarks/audio_prep_benchmark.py --whisper samples/visit.wav
+
+Without --whisper the upload time is estimated from --bandwidth-mbps.
+With --whisper each variant is sent to Whisper (needs OPENAI_API_KEY) and
+the measured end-to-end latency includes normalization time.
+"""
+import os
+import io
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_prep import normalize_audio
+
+
+def whisper_latency(client, filename, stream):
+    started = time.perf_counter()
+    stream.seek(0)
+    client.audio.transcriptions.create(
+        model="whisper-1",
+        file=(filename, stream),
+        response_format="verbose_json"
+    )
+    return time.perf_counter() - started
+
+
+def benchmark_file(path, args, client=None):
+    with open(path, 'rb') as f:
+        original = io.BytesIO(f.read())
+    filename = os.path.basename(path)
+    file_format = filename.split('.')[-1].lower()
+
+    stream, normalized_name, stats, _ = normalize_audio(
+        original, filename, file_format, target=args.format, bitrate=args.bitrate,
+        vad={} if args.vad else None
+    )
+
+    bytes_per_second = args.bandwidth_mbps * 1_000_000 / 8
+    row = {
+        "file": filename,
+        "before_bytes": stats["original_bytes"],
+        "after_bytes": stats["upload_bytes"],
+        "prep_seconds": stats["seconds"],
+        "before_seconds": stats["original_bytes"] / bytes_per_second,
+        "after_seconds": stats["seconds"] + stats["upload_bytes"] / bytes_per_second
+    }
+
+    if "vad" in stats:
+        row["vad_removed_percent"] = stats["vad"]["removed_percent"]
+
+    if client is not None:
+        row["before_seconds"] = whisper_latency(client, filename, original)
+        row["after_seconds"] = stats["seconds"] + whisper_latency(client, normalized_name, stream)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark audio normalization before Whisper")
+    parser.add_argument("files", nargs="+", help="Sample audio files")
+    parser.add_argument("--format", default="opus", choices=["opus", "mp3"])
+    parser.add_argument("--bitrate", default="24k")
+    parser.add_argument("--bandwidth-mbps", type=float, default=10.0,
+                        help="Uplink used to estimate upload time when --whisper is not set")
+    parser.add_argument("--vad", action="store_true", help="Also trim long silences")
+    parser.add_argument("--whisper", action="store_true", help="Measure real Whisper latency")
+    args = parser.parse_args()
+
+    client = None
+    if args.whisper:
+        from dotenv import load_dotenv
+        from openai import OpenAI
+        load_dotenv()
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    mode = "whisper end-to-end" if client else f"estimated upload at {args.bandwidth_mbps} Mbps"
+    print(f"Latency: {mode}")
+    print(f"{'file':<32} {'before':>12} {'after':>12} {'saved':>7} {'prep s':>8} {'before s':>9} {'after s':>9}")
+
+    totals = {"before_bytes": 0, "after_bytes": 0, "before_seconds": 0.0, "after_seconds": 0.0}
+    for path in args.files:
+        row = benchmark_file(path, args, client)
+        for key in totals:
+            totals[key] += row[key]
+        saved = 100 * (1 - row["after_bytes"] / row["before_bytes"]) if row["before_bytes"] else 0
+        print(f"{row['file'][:32]:<32} {row['before_bytes']:>12} {row['after_bytes']:>12} {saved:>6.0f}% "
+              f"{row['prep_seconds']:>8.2f} {row['before_seconds']:>9.2f} {row['after_seconds']:>9.2f}"
+              + (f"  (VAD removed {row['vad_removed_percent']}%)" if "vad_removed_percent" in row else ""))
+
+    if totals["before_bytes"]:
+        saved = 100 * (1 - totals["after_bytes"] / totals["before_bytes"])
+        print(f"{'TOTAL':<32} {totals['before_bytes']:>12} {totals['after_bytes']:>12} {saved:>6.0f}% "
+              f"{'':>8} {totals['before_seconds']:>9.2f} {totals['after_seconds']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
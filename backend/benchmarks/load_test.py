@@ -0,0 +1,427 @@
+"""
+Load test the API against the local stub OpenAI server: replays
+multipart uploads (and SOAP requests) at increasing concurrency levels
+and reports p50/p95/p99 latency, requests per second and server RSS.
+
+Usage (from backend/):
+    # Start the stub and the server in a given mode, then run the load
+    python benchmarks/load_test.py --launch waitress --concurrency 1,4,16 --requests 100
+    python benchmarks/load_test.py --launch flask --endpoints transcribe --stub-latency 0.5 --stub-jitter 0.3
+    python benchmarks/load_test.py --launch serve --server-env SERVER=gunicorn --server-env WORKERS=4
+    python benchmarks/load_test.py --launch asgi --concurrency 16,64,256
+
+    # Any other serving mode: a command with {port}, run from backend/
+    python benchmarks/load_test.py --server-cmd "python -m waitress --port={port} --threads=32 server:app"
+
+    # An already running server (pointed at the stub); --server-pid enables RSS sampling
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --server-pid 12345
+
+    # Keep the results and fail (exit 1) if p95 or throughput regressed by more than 20%
+    python benchmarks/load_test.py --launch waitress --json after.json --baseline before.json --max-regression 0.2
+
+Launched servers run with the transcript cache and the shared rate limiter
+off (override with --server-env KEY=VALUE), so every request does the full
+pipeline work against the stub. Without --audio a synthetic 10 s WAV is
+uploaded.
+"""
+import io
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import wave
+import shlex
+import struct
+import tempfile
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+from stub_openai import SENTENCES, LATENCY_DISTRIBUTIONS, serve
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER_PRESETS = {
+    "flask": [sys.executable, "-m", "flask", "--app", "server", "run", "--port", "{port}", "--with-threads"],
+    "waitress": [sys.executable, "-m", "waitress", "--port={port}", "--threads={threads}", "server:app"],
+    # Production launcher (SERVER, WORKERS, PRELOAD... via --server-env)
+    "serve": [sys.executable, "serve.py", "--port", "{port}", "--threads", "{threads}"],
+    # Async endpoints on uvicorn (asgi.py)
+    "asgi": [sys.executable, "-m", "uvicorn", "--port", "{port}", "--no-access-log", "asgi:app"]
+}
+
+ENDPOINTS = ("transcribe", "translate", "generate-soap")
+
+CONVERSATION = [
+    {"speaker": "Doctor" if i % 2 == 0 else "Patient", "text": text} for i, text in enumerate(SENTENCES)
+]
+
+
+def synthetic_wav(seconds=10.0, sample_rate=16000):
+    """Mono 16-bit WAV alternating two tones with short pauses (two 'speakers')"""
+    frames = bytearray()
+    for i in range(int(seconds * sample_rate)):
+        t = i / sample_rate
+        turn = int(t / 2.5)
+        if t % 2.5 > 2.2:
+            sample = 0
+        else:
+            sample = int(8000 * math.sin(2 * math.pi * (180 if turn % 2 == 0 else 260) * t))
+        frames += struct.pack("<h", sample)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def encode_multipart(fields, files):
+    """multipart/form-data body for {name: value} fields and {name: (filename, bytes)} files"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    for name, (filename, data) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode() + data + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def build_request(endpoint, audio, language=None):
+    """(path, body, content type) for one request to an endpoint"""
+    if endpoint == "generate-soap":
+        return "/api/generate-soap", json.dumps({"conversation": CONVERSATION}).encode(), "application/json"
+    filename, data = audio
+    fields = {"language": language} if language and endpoint == "transcribe" else {}
+    body, content_type = encode_multipart(fields, {"audio": (filename, data)})
+    return f"/api/{endpoint}", body, content_type
+
+
+class Client:
+    """One keep-alive HTTP connection per load-generator thread"""
+
+    def __init__(self, base_url, timeout=300):
+        url = urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.timeout = timeout
+        self.connection = None
+
+    def post(self, path, body, content_type):
+        """Returns (HTTP status, seconds); status 0 on a connection error"""
+        for attempt in range(2):
+            reused = self.connection is not None
+            if not reused:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            started = time.perf_counter()
+            try:
+                self.connection.request("POST", path, body=body, headers={
+                    "Content-Type": content_type,
+                    "Content-Length": str(len(body))
+                })
+                response = self.connection.getresponse()
+                response.read()
+                elapsed = time.perf_counter() - started
+                if response.getheader("Connection", "").lower() == "close":
+                    self.close()
+                return response.status, elapsed
+            except (OSError, http.client.HTTPException):
+                self.close()
+                # Only a kept-alive connection the server already closed is retried (once, on a fresh one)
+                if not reused or attempt:
+                    return 0, time.perf_counter() - started
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def process_tree_rss(pid):
+    """Resident memory (bytes) of a process and all its descendants (Linux /proc), or None"""
+    children = {}
+    try:
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command name may contain spaces; fields resume after the last ')'
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    except OSError:
+        return None
+
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            if current == pid:
+                return None
+        stack.extend(children.get(current, []))
+    return total
+
+
+class RssSampler:
+    """Samples the server's RSS in the background; keeps the peak"""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.pid:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            rss = process_tree_rss(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            if self._stop.wait(self.interval):
+                return
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def run_level(base_url, endpoint, concurrency, requests, audio_files, language, server_pid, timeout):
+    """Send `requests` requests with `concurrency` threads; returns one result row"""
+    payloads = [build_request(endpoint, audio, language) for audio in audio_files]
+    remaining = iter(range(requests))
+    lock = threading.Lock()
+    results = []
+
+    def worker():
+        client = Client(base_url, timeout)
+        try:
+            while True:
+                with lock:
+                    index = next(remaining, None)
+                if index is None:
+                    return
+                status, elapsed = client.post(*payloads[index % len(payloads)])
+                with lock:
+                    results.append((status, elapsed))
+        finally:
+            client.close()
+
+    with RssSampler(server_pid) as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(worker) for _ in range(concurrency)]:
+                future.result()
+        wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed for status, elapsed in results if status == 200)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": sum(1 for status, _ in results if status != 200),
+        "rps": round(len(latencies) / wall, 2) if wall else None,
+        "p50": round(percentile(latencies, 0.50), 3) if latencies else None,
+        "p95": round(percentile(latencies, 0.95), 3) if latencies else None,
+        "p99": round(percentile(latencies, 0.99), 3) if latencies else None,
+        "max": round(latencies[-1], 3) if latencies else None,
+        "rss_mb": round(rss.peak / (1024 * 1024), 1) if rss.peak else None
+    }
+
+
+def print_table(rows):
+    columns = ["endpoint", "concurrency", "requests", "errors", "rps", "p50", "p95", "p99", "max", "rss_mb"]
+    widths = {c: max(len(c), *(len(str(row[c])) for row in rows)) for c in columns}
+    print("  ".join(c.rjust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).rjust(widths[c]) for c in columns))
+
+
+def compare(rows, baseline_rows, max_regression):
+    """Regressions against a baseline run: p95 up or throughput down by more than max_regression"""
+    baseline = {(row["endpoint"], row["concurrency"]): row for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        before = baseline.get((row["endpoint"], row["concurrency"]))
+        if not before:
+            continue
+        label = f"{row['endpoint']} @ {row['concurrency']}"
+        if before["p95"] and row["p95"] and row["p95"] > before["p95"] * (1 + max_regression):
+            regressions.append(f"{label}: p95 {before['p95']}s -> {row['p95']}s")
+        if before["rps"] and row["rps"] is not None and row["rps"] < before["rps"] * (1 - max_regression):
+            regressions.append(f"{label}: {before['rps']} -> {row['rps']} req/s")
+        if row["errors"] > before["errors"]:
+            regressions.append(f"{label}: errors {before['errors']} -> {row['errors']}")
+    return regressions
+
+
+def wait_ready(base_url, process=None, timeout=60):
+    url = urlsplit(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=2)
+            connection.request("GET", "/api/ready")
+            if connection.getresponse().status == 200:
+                return
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Server not ready after {timeout}s")
+
+
+def launch_server(command, port, stub_url, workdir, extra_env):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "sk-stub",
+        "OPENAI_BASE_URL": stub_url,
+        "PORT": str(port),
+        "TRANSCRIPT_CACHE_ENABLED": "false",
+        "RATE_LIMIT_ENABLED": "false",
+        "RATE_LIMIT_DB": os.path.join(workdir, "rate_limits.sqlite"),
+        "METRICS_DIR": os.path.join(workdir, "metrics"),
+        "TRANSLATION_MEMORY_PATH": os.path.join(workdir, "translation_memory.json")
+    })
+    env.update(extra_env)
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    print(f"Starting server: {' '.join(command)} (log: {log.name})")
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API against the stub OpenAI server")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--launch", choices=sorted(SERVER_PRESETS), help="Start the server in this mode")
+    target.add_argument("--server-cmd", help="Start the server with this command ({port} is substituted)")
+    target.add_argument("--url", help="Load an already running server instead")
+    parser.add_argument("--server-pid", type=int, help="Pid of an already running server, for RSS sampling")
+    parser.add_argument("--port", type=int, default=5055, help="Port for a launched server")
+    parser.add_argument("--server-threads", type=int, default=16, help="Threads for --launch waitress")
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help=f"Comma-separated: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per endpoint and level")
+    parser.add_argument("--warmup", type=int, default=2, help="Unrecorded requests per endpoint first")
+    parser.add_argument("--audio", nargs="*", default=[], help="Audio files to upload (default: synthetic WAV)")
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Results file of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--stub-port", type=int, default=8089)
+    parser.add_argument("--stub-latency", type=float, default=0.2)
+    parser.add_argument("--stub-jitter", type=float, default=0.1)
+    parser.add_argument("--stub-latency-dist", choices=LATENCY_DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--stub-tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--stub-rpm", type=int, default=0)
+    args = parser.parse_args()
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    for endpoint in endpoints:
+        if endpoint not in ENDPOINTS:
+            parser.error(f"Unknown endpoint: {endpoint}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+    audio_files = [(os.path.basename(path), open(path, "rb").read()) for path in args.audio] or [
+        ("synthetic.wav", synthetic_wav())
+    ]
+
+    stub, process, server_pid = None, None, args.server_pid
+    if args.url:
+        base_url = args.url.rstrip("/")
+        mode = args.url
+    else:
+        stub = serve(args.stub_port, latency=args.stub_latency, jitter=args.stub_jitter,
+                     latency_dist=args.stub_latency_dist, error_rate=args.stub_error_rate,
+                     tokens_per_second=args.stub_tokens_per_second, rpm=args.stub_rpm)
+        stub_url = f"http://127.0.0.1:{args.stub_port}/v1"
+        print(f"Stub OpenAI server on {stub_url}")
+        if args.server_cmd:
+            mode = args.server_cmd
+            command = shlex.split(args.server_cmd.replace("{port}", str(args.port)))
+        else:
+            mode = args.launch or "waitress"
+            command = [part.format(port=args.port, threads=args.server_threads) for part in SERVER_PRESETS[mode]]
+        extra_env = dict(item.split("=", 1) for item in args.server_env)
+        process = launch_server(command, args.port, stub_url, tempfile.mkdtemp(prefix="load_test_"), extra_env)
+        server_pid = process.pid
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    rows = []
+    try:
+        started = time.perf_counter()
+        wait_ready(base_url, process)
+        print(f"Server ready in {time.perf_counter() - started:.2f}s")
+
+        for endpoint in endpoints:
+            if args.warmup:
+                run_level(base_url, endpoint, 1, args.warmup, audio_files, args.language, None, args.timeout)
+            for concurrency in levels:
+                print(f"▶ {endpoint} x{concurrency} ({args.requests} requests)...", flush=True)
+                rows.append(run_level(base_url, endpoint, concurrency, args.requests, audio_files,
+                                      args.language, server_pid, args.timeout))
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if stub is not None:
+            stub.shutdown()
+
+    print()
+    print_table(rows)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"mode": mode, "created": time.time(), "results": rows}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(rows, json.load(f)["results"], args.max_regression)
+        if regressions:
+            print("\n❌ Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\n✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Generate synthetic consultation recordings for audio_prep_benchmark.py:
+two alternating voices (harmonic tones with a syllable envelope at
+different pitches), short pauses between turns, occasional long silences
+(an examination, typing) and a low room-noise floor. The output is
+deterministic for a given --seed, so results can be compared across runs.
+
+Usage (from backend/):
+    python benchmarks/make_samples.py --out samples --minutes 1,5,15
+    python benchmarks/make_samples.py --out samples --minutes 5 --compressed
+    python benchmarks/audio_prep_benchmark.py samples/*
+
+WAV files are 44.1 kHz stereo 16-bit, like a desktop recorder. With
+--compressed each recording is also exported the way browsers and phones
+upload it (WebM/Opus and M4A/AAC), which needs ffmpeg.
+"""
+import os
+import sys
+import wave
+import argparse
+
+import numpy as np
+
+VOICES = [120.0, 210.0]  # fundamental frequency (Hz) of the two speakers
+
+
+def utterance(rng, seconds, f0, sample_rate):
+    """Voiced harmonics with pitch drift, shaped into syllables of 120-350 ms"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = f0 * (1 + 0.06 * np.sin(2 * np.pi * rng.uniform(0.3, 0.8) * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 11))
+
+    envelope = np.zeros_like(t)
+    position = 0
+    while position < len(t):
+        length = int(rng.uniform(0.12, 0.35) * sample_rate)
+        end = min(len(t), position + length)
+        envelope[position:end] = np.sin(np.linspace(0, np.pi, end - position)) * rng.uniform(0.5, 1.0)
+        position = end + int(rng.uniform(0.0, 0.08) * sample_rate)
+    return voiced * envelope
+
+
+def consultation(minutes, sample_rate=44100, seed=0):
+    """Mono float samples in [-1, 1] for a consultation of the given length"""
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * sample_rate)
+    parts = []
+    length = 0
+    speaker = 0
+    next_long_pause = rng.uniform(30, 60)
+    while length < total:
+        parts.append(utterance(rng, rng.uniform(1.5, 8.0), VOICES[speaker], sample_rate) * 0.3)
+        if length / sample_rate >= next_long_pause:
+            pause = rng.uniform(4.0, 12.0)
+            next_long_pause += rng.uniform(30, 60)
+        else:
+            pause = rng.uniform(0.2, 1.2)
+        parts.append(np.zeros(int(pause * sample_rate)))
+        length += len(parts[-2]) + len(parts[-1])
+        speaker = 1 - speaker if rng.random() < 0.8 else speaker
+
+    samples = np.concatenate(parts)[:total]
+    samples += rng.normal(0, 0.002, len(samples))  # room noise, about -54 dBFS
+    return np.clip(samples, -1, 1)
+
+
+def write_wav(path, samples, sample_rate=44100, channels=2):
+    pcm = (samples * 32767).astype("<i2")
+    if channels > 1:
+        pcm = np.repeat(pcm[:, None], channels, axis=1)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+
+
+def export_compressed(wav_path):
+    """WebM/Opus (browser MediaRecorder) and M4A/AAC (phone) copies of a WAV sample"""
+    from pydub import AudioSegment
+
+    audio = AudioSegment.from_wav(wav_path)
+    base = os.path.splitext(wav_path)[0]
+    audio.export(f"{base}.webm", format="webm", codec="libopus", bitrate="96k")
+    audio.export(f"{base}.m4a", format="ipod", codec="aac", bitrate="128k")
+    return [f"{base}.webm", f"{base}.m4a"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic consultation recordings")
+    parser.add_argument("--out", default="samples", help="Output directory")
+    parser.add_argument("--minutes", default="1,5,15", help="Comma-separated recording lengths")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compressed", action="store_true", help="Also write .webm and .m4a copies (needs ffmpeg)")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for minutes in [float(m) for m in args.minutes.split(",")]:
+        path = os.path.join(args.out, f"consult_{minutes:g}min.wav")
+        write_wav(path, consultation(minutes, seed=args.seed))
+        paths = [path] + (export_compressed(path) if args.compressed else [])
+        for written in paths:
+            print(f"{written}: {os.path.getsize(written)} bytes")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
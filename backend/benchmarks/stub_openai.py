@@ -0,0 +1,294 @@
+"""
+Local stub of the OpenAI endpoints the backend uses, with injected
+latency and errors, for testing timeouts, retries and hedging and for
+load tests (see load_test.py) that shouldn't spend API money.
+
+Usage (from backend/):
+    python benchmarks/stub_openai.py --port 8089 --latency 0.2 --error-rate 0.1 --slow-rate 0.05
+    python benchmarks/stub_openai.py --latency 0.8 --jitter 0.5 --latency-dist lognormal --tokens-per-second 80 --rpm 300
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=sk-stub python server.py
+
+Serves /v1/chat/completions (segmentation, translation and SOAP, with
+stream=true), /v1/audio/transcriptions and /v1/audio/translations, and
+GET /stats with request and injected-fault counters.
+
+Latency distributions (--latency is the base/median, --jitter the spread):
+uniform (latency + U(0, jitter)), lognormal (median latency, sigma
+jitter) and exponential (latency + Exp(mean jitter)). --tokens-per-second
+paces completions by their length, --rpm answers 429 with Retry-After
+once a rolling minute's budget is used, and --transcript replays a saved
+verbose_json response instead of the generated one.
+"""
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SENTENCES = [
+    "Good morning, what brings you in today?",
+    "I have had a headache for three days.",
+    "Is the pain constant or does it come and go?",
+    "It comes and goes, mostly in the afternoon.",
+    "Have you taken anything for it?",
+    "Just some ibuprofen, but it did not help much.",
+    "Let me check your blood pressure.",
+    "Okay, thank you doctor."
+]
+
+SOAP_NOTE = """S: Patient reports a three-day intermittent headache, worse in the afternoon, minimal relief from ibuprofen.
+O: Blood pressure measured during the visit.
+A: Tension-type headache, rule out hypertension.
+P: Hydration, sleep hygiene, follow up in one week if symptoms persist."""
+
+
+LATENCY_DISTRIBUTIONS = ("uniform", "lognormal", "exponential")
+
+
+class FaultConfig:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, slow_rate=0.0, slow_latency=5.0, sentences=8,
+                 latency_dist="uniform", tokens_per_second=0.0, rpm=0, transcript=None):
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_dist}")
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.sentences = sentences
+        self.latency_dist = latency_dist
+        self.tokens_per_second = tokens_per_second
+        self.rpm = rpm
+        self.transcript = transcript
+        self.counts = {"requests": 0, "errors": 0, "slow": 0, "throttled": 0}
+        self.lock = threading.Lock()
+        self._recent = deque()
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def sample_latency(self):
+        if self.latency_dist == "lognormal":
+            return random.lognormvariate(math.log(self.latency), self.jitter) if self.latency > 0 else 0.0
+        if self.latency_dist == "exponential":
+            return self.latency + (random.expovariate(1.0 / self.jitter) if self.jitter > 0 else 0.0)
+        return self.latency + random.uniform(0, self.jitter)
+
+    def throttle(self):
+        """Seconds until the rolling one-minute request budget frees up, or 0 if this request fits"""
+        if not self.rpm:
+            return 0
+        now = time.monotonic()
+        with self.lock:
+            while self._recent and self._recent[0] <= now - 60:
+                self._recent.popleft()
+            if len(self._recent) >= self.rpm:
+                return self._recent[0] + 60 - now
+            self._recent.append(now)
+            return 0
+
+
+def transcription_payload(sentences):
+    """verbose_json transcription with segment and word timestamps"""
+    texts = [SENTENCES[i % len(SENTENCES)] for i in range(sentences)]
+    segments, words, position = [], [], 0.0
+    for i, text in enumerate(texts):
+        start = position
+        for word in text.split():
+            words.append({"word": word, "start": round(position, 2), "end": round(position + 0.4, 2)})
+            position += 0.4
+        segments.append({
+            "id": i, "seek": 0, "start": round(start, 2), "end": round(position, 2), "text": " " + text,
+            "tokens": [], "temperature": 0.0, "avg_logprob": -0.2, "compression_ratio": 1.2, "no_speech_prob": 0.01
+        })
+        position += 0.6
+    return {
+        "task": "transcribe",
+        "language": "english",
+        "duration": round(position, 2),
+        "text": " ".join(texts),
+        "segments": segments,
+        "words": words
+    }
+
+
+def chat_content(body):
+    """Reply in the shape each pipeline prompt expects"""
+    messages = body.get("messages", [])
+    system = messages[0]["content"] if messages else ""
+    user = messages[-1]["content"] if messages else ""
+
+    if "translator" in system:
+        turns = json.loads(user).get("turns", [])
+        return json.dumps({"translations": [{"id": t["id"], "text": t["text"]} for t in turns]})
+
+    segment_ids = re.findall(r"^\[(\d+)\] ", user, re.M)
+    if segment_ids:
+        return json.dumps({"turns": [[int(i), 0, "D" if int(i) % 2 == 0 else "P"] for i in segment_ids]})
+
+    match = re.search(r'Transcribed conversation:\n"""(.*?)"""', user, re.S)
+    if match:
+        sentences = re.findall(r"[^.?!]+[.?!]", match.group(1))
+        return json.dumps({"conversation": [
+            {"speaker": "Doctor" if i % 2 == 0 else "Patient", "text": s.strip()} for i, s in enumerate(sentences)
+        ]})
+
+    return SOAP_NOTE
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = FaultConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject_faults(self):
+        """Sleep for the configured latency; returns True if an error response was sent"""
+        config = self.config
+        config.count("requests")
+        retry_after = config.throttle()
+        if retry_after:
+            config.count("throttled")
+            data = json.dumps({"error": {
+                "message": "Rate limit reached (stub)", "type": "requests", "code": "rate_limit_exceeded"
+            }}).encode()
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Retry-After", str(math.ceil(retry_after)))
+            self.end_headers()
+            self.wfile.write(data)
+            return True
+        delay = config.sample_latency()
+        if random.random() < config.slow_rate:
+            config.count("slow")
+            delay += config.slow_latency
+        time.sleep(delay)
+        if random.random() < config.error_rate:
+            config.count("errors")
+            self._send_json(random.choice([500, 502, 503]), {
+                "error": {"message": "Injected stub error", "type": "server_error", "code": None}
+            })
+            return True
+        return False
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.config.lock:
+                self._send_json(200, dict(self.config.counts))
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self._inject_faults():
+            return
+
+        if self.path.endswith("/chat/completions"):
+            request_body = json.loads(body or b"{}")
+            content = chat_content(request_body)
+            if self.config.tokens_per_second and not request_body.get("stream"):
+                # Generation time grows with the completion length
+                time.sleep(len(content) / 4 / self.config.tokens_per_second)
+            if request_body.get("stream"):
+                self._stream_chat(request_body, content)
+            else:
+                self._send_json(200, {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request_body.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": {"prompt_tokens": len(body) // 4, "completion_tokens": len(content) // 4,
+                              "total_tokens": (len(body) + len(content)) // 4}
+                })
+        elif self.path.endswith("/audio/transcriptions") or self.path.endswith("/audio/translations"):
+            self._send_json(200, self.config.transcript or transcription_payload(self.config.sentences))
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def _stream_chat(self, request_body, content):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_chunk(data):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+        # ~3 tokens per 12-character piece
+        pause = 3 / self.config.tokens_per_second if self.config.tokens_per_second else 0
+        for piece in re.findall(r".{1,12}", content, re.S):
+            if pause:
+                time.sleep(pause)
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request_body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+            }
+            write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def serve(port=8089, **fault_options):
+    """Start the stub in a background thread; returns the server (call shutdown() to stop)"""
+    StubHandler.config = FaultConfig(**fault_options)
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI server with injected latency and errors")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="Base latency per request (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra uniform random latency (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 5xx")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests delayed by --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=5.0)
+    parser.add_argument("--sentences", type=int, default=8, help="Sentences per stub transcript")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Completion generation speed (0: instant)")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before answering 429 (0: unlimited)")
+    parser.add_argument("--transcript", help="verbose_json file returned by the audio endpoints")
+    args = parser.parse_args()
+
+    transcript = None
+    if args.transcript:
+        with open(args.transcript) as f:
+            transcript = json.load(f)
+    server = serve(args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                   slow_rate=args.slow_rate, slow_latency=args.slow_latency, sentences=args.sentences,
+                   latency_dist=args.latency_dist, tokens_per_second=args.tokens_per_second, rpm=args.rpm,
+                   transcript=transcript)
+    print(f"Stub OpenAI server on http://127.0.0.1:{args.port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Unit tests for the pure parts of the transcription pipeline: windowed
+segmentation (plan_windows, merge_windows), turn alignment to segment
+words, and mapping timestamps back across silences cut by VAD.
+
+Usage (from backend/):
+    python -m pytest benchmarks/test_pipeline_units.py
+    python benchmarks/test_pipeline_units.py
+"""
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+import segmentation  # noqa: E402
+from segmentation import merge_windows, plan_windows  # noqa: E402
+from alignment import turn_word_starts  # noqa: E402
+from audio_prep import OffsetMap, remap_timestamps  # noqa: E402
+
+DOCTOR, PATIENT = "Doctor", "Patient"
+
+
+def transcript(texts):
+    """Transcript with one 1-second segment per text"""
+    segments = [SimpleNamespace(id=i, start=float(i), end=float(i + 1), text=text) for i, text in enumerate(texts)]
+    return SimpleNamespace(text=" ".join(texts), segments=segments, words=[], duration=float(len(texts)))
+
+
+def numbered(count):
+    return transcript([f"s{i}a s{i}b" for i in range(count)])
+
+
+def speakers(conversation):
+    return [turn["speaker"] for turn in conversation]
+
+
+class PlanWindowsTest(unittest.TestCase):
+    def test_windows_cover_every_segment_and_overlap(self):
+        with mock.patch.object(segmentation, "count_tokens", lambda text: len(text.split())):
+            windows = plan_windows(numbered(10).segments, max_tokens=8, overlap_segments=1)
+
+        self.assertEqual(windows, [(0, 4), (3, 7), (6, 10)])
+
+    def test_oversized_segment_gets_its_own_window(self):
+        segments = transcript(["a b", "one two three four five six", "c d"]).segments
+        with mock.patch.object(segmentation, "count_tokens", lambda text: len(text.split())):
+            windows = plan_windows(segments, max_tokens=3, overlap_segments=1)
+
+        self.assertEqual(windows, [(0, 1), (1, 2), (2, 3)])
+
+
+class MergeWindowsTest(unittest.TestCase):
+    windows = [(0, 6), (4, 10)]
+
+    def test_speaker_labels_swapped_across_overlap_are_reconciled(self):
+        first = [(0, 0, DOCTOR), (2, 0, PATIENT), (4, 0, DOCTOR), (5, 0, PATIENT)]
+        # The second window saw the same turns with Doctor/Patient the other way round
+        second = [(4, 0, PATIENT), (5, 0, DOCTOR), (7, 0, PATIENT)]
+
+        conversation = merge_windows(numbered(10), self.windows, [first, second])
+
+        self.assertEqual(speakers(conversation), [DOCTOR, PATIENT, DOCTOR, PATIENT, DOCTOR])
+        self.assertEqual(conversation[3]["text"], "s5a s5b s6a s6b")
+        self.assertEqual(conversation[4]["text"], "s7a s7b s8a s8b s9a s9b")
+
+    def test_agreeing_labels_are_kept(self):
+        first = [(0, 0, DOCTOR), (5, 0, PATIENT)]
+        second = [(4, 0, DOCTOR), (5, 0, PATIENT), (8, 0, DOCTOR)]
+
+        conversation = merge_windows(numbered(10), self.windows, [first, second])
+
+        self.assertEqual(speakers(conversation), [DOCTOR, PATIENT, DOCTOR])
+
+    def test_turn_spanning_the_window_boundary_is_one_turn(self):
+        # The patient starts in the first window and keeps talking past its end
+        first = [(0, 0, DOCTOR), (3, 0, PATIENT)]
+        second = [(4, 0, PATIENT), (8, 0, DOCTOR)]
+
+        conversation = merge_windows(numbered(10), self.windows, [first, second])
+
+        self.assertEqual(speakers(conversation), [DOCTOR, PATIENT, DOCTOR])
+        self.assertEqual(conversation[1]["text"], " ".join(f"s{i}a s{i}b" for i in range(3, 8)))
+
+    def test_turn_start_inside_the_overlap_is_taken_once(self):
+        # Both windows see the patient start mid-segment 4; the first window owns it (midpoint is 5)
+        first = [(0, 0, DOCTOR), (4, 1, PATIENT)]
+        second = [(4, 1, PATIENT), (8, 0, DOCTOR)]
+
+        conversation = merge_windows(numbered(10), self.windows, [first, second])
+
+        self.assertEqual(speakers(conversation), [DOCTOR, PATIENT, DOCTOR])
+        self.assertEqual(conversation[1]["text"], "s4b " + " ".join(f"s{i}a s{i}b" for i in range(5, 8)))
+
+    def test_boundary_on_a_segment_without_text(self):
+        texts = [f"s{i}a s{i}b" for i in range(10)]
+        texts[5] = ""
+        first = [(0, 0, DOCTOR), (3, 0, PATIENT)]
+        # The new turn is marked on the empty segment the windows are split at
+        second = [(4, 0, PATIENT), (5, 0, DOCTOR)]
+
+        conversation = merge_windows(transcript(texts), self.windows, [first, second])
+
+        self.assertEqual(speakers(conversation), [DOCTOR, PATIENT, DOCTOR])
+        self.assertEqual(conversation[2]["text"], "s6a s6b s7a s7b s8a s8b s9a s9b")
+        self.assertEqual(" ".join(turn["text"] for turn in conversation), " ".join(t for t in texts if t))
+
+
+class TurnWordStartsTest(unittest.TestCase):
+    segments = transcript([
+        "Hello doctor, I have",
+        "had a headache since Monday. How",
+        "long does it last? All afternoon.",
+    ]).segments
+
+    def test_turn_starts_inside_a_segment(self):
+        turns = [
+            {"speaker": PATIENT, "text": "Hello doctor, I have had a headache since Monday."},
+            {"speaker": DOCTOR, "text": "How long does it last?"},
+            {"speaker": PATIENT, "text": "All afternoon."},
+        ]
+
+        self.assertEqual(turn_word_starts(turns, self.segments), [(0, 0), (1, 5), (2, 4)])
+
+    def test_unmatched_turn_does_not_consume_the_stream(self):
+        turns = [
+            {"speaker": PATIENT, "text": "Hello doctor, I have had a headache since Monday."},
+            {"speaker": DOCTOR, "text": "Completely unrelated words"},
+            {"speaker": DOCTOR, "text": "How long does it last?"},
+        ]
+
+        self.assertEqual(turn_word_starts(turns, self.segments), [(0, 0), None, (1, 5)])
+
+    def test_reworded_turn_still_anchors(self):
+        turns = [
+            {"speaker": PATIENT, "text": "Hello doctor, I've had a headache since Monday."},
+            {"speaker": DOCTOR, "text": "How long does it usually last?"},
+        ]
+
+        self.assertEqual(turn_word_starts(turns, self.segments), [(0, 0), (1, 5)])
+
+
+class OffsetMapTest(unittest.TestCase):
+    # 16 kHz audio: speech 0-1 s and 3-4.5 s kept, the 2 s silence between them cut
+    offset_map = OffsetMap([(0, 16000), (48000, 72000)], 16000)
+
+    def test_times_inside_kept_ranges(self):
+        self.assertEqual(self.offset_map.to_original(0.5), 0.5)
+        self.assertEqual(self.offset_map.to_original(1.5), 3.5)
+
+    def test_time_on_the_cut(self):
+        # A start on the cut begins after the silence; an end on it finishes before
+        self.assertEqual(self.offset_map.to_original(1.0), 3.0)
+        self.assertEqual(self.offset_map.to_original(1.0, end=True), 1.0)
+
+    def test_times_past_the_end_are_clamped(self):
+        self.assertEqual(self.offset_map.to_original(9.0), 4.5)
+
+    def test_segment_across_the_removed_silence(self):
+        result = SimpleNamespace(
+            segments=[SimpleNamespace(start=0.8, end=1.4), SimpleNamespace(start=1.0, end=2.5)],
+            words=[SimpleNamespace(start=0.9, end=1.0), SimpleNamespace(start=1.0, end=1.2)],
+            duration=2.5
+        )
+
+        remap_timestamps(result, self.offset_map, original_duration=4.5)
+
+        self.assertEqual([(s.start, s.end) for s in result.segments], [(0.8, 3.4), (3.0, 4.5)])
+        self.assertEqual([(w.start, w.end) for w in result.words], [(0.9, 1.0), (3.0, 3.2)])
+        self.assertEqual(result.duration, 4.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+StageClient retries and hedging against the local stub OpenAI server
+(see stub_openai.py): retry counts on injected errors, when a hedge
+fires, and which request wins it.
+
+Usage (from backend/):
+    python -m pytest benchmarks/test_stage_client.py
+    python benchmarks/test_stage_client.py
+"""
+import os
+import sys
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import OpenAI
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCHMARKS_DIR, os.path.dirname(BENCHMARKS_DIR)]
+
+from stub_openai import FaultConfig, StubHandler, serve  # noqa: E402
+from openai_client import StageClients, StagePolicy  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+class SlowRequests(FaultConfig):
+    """Stub faults where the listed requests (1-based, in arrival order) take slow_latency"""
+
+    def __init__(self, slow_requests, **options):
+        super().__init__(**options)
+        self.slow_requests = slow_requests
+
+    def sample_latency(self):
+        with self.lock:
+            request = self.counts["requests"]
+        return self.slow_latency if request in self.slow_requests else self.latency
+
+
+class StageClientTest(unittest.TestCase):
+    def start_stub(self, config=None, **fault_options):
+        server = serve(0, **fault_options)
+        if config is not None:
+            StubHandler.config = config
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return OpenAI(api_key="sk-stub", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1")
+
+    def stage_client(self, client, hedge_workers=8, **policy_options):
+        policy = StagePolicy("segmentation", read_timeout=10, base_delay=0.01, max_delay=0.05, **policy_options)
+        return StageClients(lambda: client, {"segmentation": policy}, hedge_workers=hedge_workers).get("segmentation")
+
+    def create(self, stage_client):
+        return stage_client.chat.completions.create(model="gpt-4o-mini", messages=MESSAGES)
+
+    def test_retries_until_max_attempts(self):
+        stage_client = self.stage_client(self.start_stub(error_rate=1.0), max_attempts=3)
+
+        with self.assertRaises(Exception):
+            self.create(stage_client)
+
+        stats = stage_client.policy.stats()
+        self.assertEqual((stats["calls"], stats["retries"], stats["failures"]), (1, 2, 1))
+        self.assertEqual(StubHandler.config.counts["requests"], 3)
+
+    def test_success_needs_no_retry(self):
+        stage_client = self.stage_client(self.start_stub())
+
+        self.assertTrue(self.create(stage_client).choices[0].message.content)
+        stats = stage_client.policy.stats()
+        self.assertEqual((stats["retries"], stats["failures"], stats["hedged"]), (0, 0, 0))
+
+    def test_fast_primary_is_not_hedged(self):
+        stage_client = self.stage_client(self.start_stub(latency=0.05), hedge=True, hedge_delay=0.5)
+
+        self.create(stage_client)
+
+        self.assertEqual(stage_client.policy.stats()["hedged"], 0)
+        self.assertEqual(StubHandler.config.counts["requests"], 1)
+
+    def test_backup_wins_over_slow_primary(self):
+        config = SlowRequests({1}, slow_latency=2.0)
+        stage_client = self.stage_client(self.start_stub(config), hedge=True, hedge_delay=0.2)
+
+        started = time.perf_counter()
+        self.create(stage_client)
+        elapsed = time.perf_counter() - started
+
+        stats = stage_client.policy.stats()
+        self.assertEqual((stats["hedged"], stats["hedge_wins"]), (1, 1))
+        self.assertLess(elapsed, 1.5)
+
+    def test_primary_can_win_after_hedging(self):
+        config = SlowRequests({2}, latency=0.4, slow_latency=2.0)
+        stage_client = self.stage_client(self.start_stub(config), hedge=True, hedge_delay=0.2)
+
+        self.create(stage_client)
+
+        stats = stage_client.policy.stats()
+        self.assertEqual((stats["hedged"], stats["hedge_wins"]), (1, 0))
+
+    def test_concurrent_calls_do_not_hedge_spuriously(self):
+        # More concurrent calls than hedge workers, all well under the hedge delay
+        stage_client = self.stage_client(self.start_stub(latency=0.1), hedge_workers=1, hedge=True, hedge_delay=0.5)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda _: self.create(stage_client), range(16)))
+
+        stats = stage_client.policy.stats()
+        self.assertEqual((stats["calls"], stats["hedged"]), (16, 0))
+        self.assertEqual(StubHandler.config.counts["requests"], 16)
+
+
+if __name__ == "__main__":
+    unittest.main()
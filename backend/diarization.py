@@ -0,0 +1,330 @@
+"""
+Speaker diarization backends run in a separate process pool.
+
+The pool is created on first use and each worker loads its backend once,
+so torch/pyannote never load in the Flask process and model inference
+does not hold the server's GIL. Backends:
+
+- "pyannote": pyannote.audio speaker-diarization-3.1 (needs HUGGINGFACE_TOKEN)
+- "spectral": NumPy MFCC windows + spectral clustering, CPU-only and
+  dependency-free, for small boxes and tests
+
+Diarization speaker turns are merged onto Whisper segments and GPT turns
+by interval overlap.
+"""
+import io
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+
+class DiarizationBackend:
+    """Interface: load() once per worker process, then diarize() -> [(start, end, speaker)]"""
+
+    name = None
+
+    def load(self):
+        pass
+
+    def diarize(self, samples, sample_rate):
+        raise NotImplementedError
+
+
+class PyannoteBackend(DiarizationBackend):
+    name = "pyannote"
+
+    def __init__(self, hf_token=None, model="pyannote/speaker-diarization-3.1", num_speakers=None):
+        self.hf_token = hf_token
+        self.model = model
+        self.num_speakers = num_speakers or None
+        self.pipeline = None
+
+    def load(self):
+        from pyannote.audio import Pipeline
+
+        self.pipeline = Pipeline.from_pretrained(self.model, use_auth_token=self.hf_token)
+
+    def diarize(self, samples, sample_rate):
+        import torch
+
+        waveform = torch.from_numpy(samples.astype("float32") / 32768.0).unsqueeze(0)
+        params = {"num_speakers": self.num_speakers} if self.num_speakers else {}
+        annotation = self.pipeline({"waveform": waveform, "sample_rate": sample_rate}, **params)
+        return [
+            (round(turn.start, 3), round(turn.end, 3), speaker)
+            for turn, _, speaker in annotation.itertracks(yield_label=True)
+        ]
+
+
+class SpectralBackend(DiarizationBackend):
+    """
+    MFCC statistics over sliding windows, cosine affinity, normalized
+    Laplacian eigenvectors and k-means. num_speakers=0 picks the count
+    (up to max_speakers) from the largest eigengap.
+    """
+
+    name = "spectral"
+
+    def __init__(self, num_speakers=2, max_speakers=4, window_seconds=1.5, hop_seconds=0.75, max_windows=2000):
+        self.num_speakers = num_speakers
+        self.max_speakers = max_speakers
+        self.window_seconds = window_seconds
+        self.hop_seconds = hop_seconds
+        self.max_windows = max_windows
+
+    @staticmethod
+    def _mel_filterbank(n_fft, sample_rate, n_mels=24):
+        import numpy as np
+
+        def hz_to_mel(hz):
+            return 2595 * np.log10(1 + hz / 700.0)
+
+        def mel_to_hz(mel):
+            return 700 * (10 ** (mel / 2595.0) - 1)
+
+        mel_points = np.linspace(hz_to_mel(60), hz_to_mel(sample_rate / 2), n_mels + 2)
+        bins = np.floor((n_fft + 1) * mel_to_hz(mel_points) / sample_rate).astype(int)
+        filters = np.zeros((n_mels, n_fft // 2 + 1))
+        for m in range(1, n_mels + 1):
+            left, center, right = bins[m - 1], bins[m], bins[m + 1]
+            if center > left:
+                filters[m - 1, left:center] = (np.arange(left, center) - left) / (center - left)
+            if right > center:
+                filters[m - 1, center:right] = (right - np.arange(center, right)) / (right - center)
+        return filters
+
+    def _frame_features(self, samples, sample_rate):
+        """13 MFCCs (without c0) and log energy per 25 ms frame, 10 ms hop"""
+        import numpy as np
+
+        frame_len, frame_hop, n_fft = int(0.025 * sample_rate), int(0.010 * sample_rate), 512
+        x = samples.astype(np.float32) / 32768.0
+        if len(x) < frame_len:
+            return np.zeros((0, 12)), np.zeros(0)
+        frames = np.lib.stride_tricks.sliding_window_view(x, frame_len)[::frame_hop]
+        window = np.hamming(frame_len).astype(np.float32)
+        filters = self._mel_filterbank(n_fft, sample_rate).astype(np.float32)
+
+        n_mels = filters.shape[0]
+        dct = np.cos(np.pi / n_mels * (np.arange(n_mels) + 0.5)[None, :] * np.arange(13)[:, None])
+        mfccs, energies = [], []
+        for start in range(0, len(frames), 10000):
+            block = frames[start:start + 10000] * window
+            power = np.abs(np.fft.rfft(block, n=n_fft)) ** 2
+            mel = np.log(power @ filters.T + 1e-10)
+            mfccs.append(mel @ dct[1:].T)
+            energies.append(np.log(np.sum(block ** 2, axis=1) + 1e-10))
+        return np.concatenate(mfccs), np.concatenate(energies)
+
+    def _cluster(self, embeddings):
+        import numpy as np
+
+        normed = (embeddings - embeddings.mean(axis=0)) / (embeddings.std(axis=0) + 1e-8)
+        normed /= np.linalg.norm(normed, axis=1, keepdims=True) + 1e-8
+        affinity = np.clip(normed @ normed.T, 0, None)
+        np.fill_diagonal(affinity, 0)
+        degree = affinity.sum(axis=1) + 1e-8
+        laplacian = np.eye(len(affinity)) - affinity / np.sqrt(np.outer(degree, degree))
+        eigenvalues, eigenvectors = np.linalg.eigh(laplacian)
+
+        k = self.num_speakers
+        if not k:
+            gaps = np.diff(eigenvalues[:self.max_speakers + 1])
+            k = int(np.argmax(gaps[1:]) + 2) if len(gaps) > 1 else 1
+        k = max(1, min(k, len(embeddings)))
+
+        vectors = eigenvectors[:, :k]
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-8
+
+        # k-means with farthest-point initialization (deterministic)
+        centers = [vectors[0]]
+        for _ in range(1, k):
+            distances = np.min([np.sum((vectors - c) ** 2, axis=1) for c in centers], axis=0)
+            centers.append(vectors[int(np.argmax(distances))])
+        centers = np.array(centers)
+        labels = np.zeros(len(vectors), dtype=int)
+        for iteration in range(50):
+            distances = ((vectors[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+            new_labels = distances.argmin(axis=1)
+            if iteration and np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+            for c in range(k):
+                if np.any(labels == c):
+                    centers[c] = vectors[labels == c].mean(axis=0)
+        return labels
+
+    def diarize(self, samples, sample_rate):
+        import numpy as np
+
+        duration = len(samples) / sample_rate
+        mfccs, energies = self._frame_features(samples, sample_rate)
+        if len(mfccs) == 0:
+            return []
+
+        # Speech frames: louder than the noise floor by 6 dB (natural log energy: ~1.4)
+        voiced = energies > np.percentile(energies, 20) + 1.4
+
+        hop_seconds = float(max(self.hop_seconds, duration / self.max_windows))
+        frames_per_window = int(self.window_seconds / 0.010)
+        frames_per_hop = max(1, int(hop_seconds / 0.010))
+        starts = np.arange(0, max(1, len(mfccs) - frames_per_window + 1), frames_per_hop)
+
+        embeddings, centers = [], []
+        for start in starts:
+            window_voiced = voiced[start:start + frames_per_window]
+            if window_voiced.mean() < 0.3:
+                continue
+            window = mfccs[start:start + frames_per_window][window_voiced]
+            embeddings.append(np.concatenate([window.mean(axis=0), window.std(axis=0)]))
+            centers.append((start + frames_per_window / 2) * 0.010)
+
+        if not embeddings:
+            return []
+        if len(embeddings) < 2:
+            return [(0.0, round(duration, 3), "SPEAKER_00")]
+
+        labels = self._cluster(np.array(embeddings))
+
+        # Name speakers by order of first appearance
+        names = {}
+        for label in labels:
+            names.setdefault(label, f"SPEAKER_{len(names):02d}")
+
+        turns = []
+        half_hop = hop_seconds / 2
+        for center, label in zip(centers, labels):
+            start, end = max(0.0, float(center) - half_hop), min(duration, float(center) + half_hop)
+            speaker = names[label]
+            if turns and turns[-1][2] == speaker and start - turns[-1][1] <= hop_seconds:
+                turns[-1] = (turns[-1][0], round(end, 3), speaker)
+            else:
+                turns.append((round(start, 3), round(end, 3), speaker))
+        return turns
+
+
+BACKENDS = {
+    PyannoteBackend.name: PyannoteBackend,
+    SpectralBackend.name: SpectralBackend
+}
+
+# Per worker process: the backend is created and loaded on the first task
+_worker_backend = None
+
+
+def _diarize_in_worker(backend_name, options, data, file_format):
+    global _worker_backend
+    from pydub import AudioSegment
+    import numpy as np
+
+    if _worker_backend is None:
+        backend = BACKENDS[backend_name](**options)
+        backend.load()
+        _worker_backend = backend
+
+    audio = AudioSegment.from_file(io.BytesIO(data), format=file_format)
+    audio = audio.set_channels(1).set_frame_rate(SAMPLE_RATE).set_sample_width(2)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.int16)
+    return _worker_backend.diarize(samples, SAMPLE_RATE)
+
+
+class Diarizer:
+    """Submits diarization to a lazily started process pool"""
+
+    def __init__(self, backend, options=None, workers=1, timeout=300):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown diarization backend: {backend}")
+        self.backend = backend
+        self.options = options or {}
+        self.workers = workers
+        self.timeout = timeout
+        self.error = None
+        self.completed = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return self.error is None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: workers start clean, without the server's threads or imported modules
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                logger.info(f"🗣️ Started {self.workers} {self.backend} diarization worker(s)")
+            return self._pool
+
+    def submit(self, data, file_format):
+        """Start diarizing encoded audio bytes; returns a future, or None when unavailable"""
+        if not self.available:
+            return None
+        try:
+            return self._get_pool().submit(_diarize_in_worker, self.backend, self.options, data, file_format)
+        except BrokenProcessPool:
+            with self._lock:
+                self._pool = None
+            return self._get_pool().submit(_diarize_in_worker, self.backend, self.options, data, file_format)
+
+    def result(self, future):
+        """Speaker turns from a submitted future, or None if diarization failed"""
+        if future is None:
+            return None
+        try:
+            turns = future.result(timeout=self.timeout)
+            self.completed += 1
+            return turns
+        except BrokenProcessPool as e:
+            # A worker died (e.g. out of memory); start a fresh pool next time
+            logger.warning(f"⚠️ Diarization worker crashed: {e}")
+            with self._lock:
+                self._pool = None
+        except (ImportError, OSError) as e:
+            # Missing model dependencies or credentials will not fix themselves
+            logger.warning(f"⚠️ Diarization disabled: {e}")
+            self.error = str(e)
+        except Exception as e:
+            logger.warning(f"⚠️ Diarization failed: {e}")
+        return None
+
+    def stats(self):
+        return {
+            "backend": self.backend,
+            "available": self.available,
+            "started": self._pool is not None,
+            "completed": self.completed,
+            "error": self.error
+        }
+
+
+def assign_speakers(items, speaker_turns, key="speaker_id"):
+    """
+    Set items[i][key] to the diarized speaker overlapping each item's
+    start/end interval the most. Both lists are swept once in time order.
+    """
+    turns = sorted(speaker_turns, key=lambda t: t[0])
+    first = 0
+    for item in sorted(items, key=lambda i: i.get('start', 0)):
+        start, end = item.get('start', 0), item.get('end', 0)
+        # Turns ending before this item can't overlap any later item either
+        while first < len(turns) and turns[first][1] <= start:
+            first += 1
+        overlaps = {}
+        j = first
+        while j < len(turns) and turns[j][0] < end:
+            overlap = min(end, turns[j][1]) - max(start, turns[j][0])
+            if overlap > 0:
+                overlaps[turns[j][2]] = overlaps.get(turns[j][2], 0) + overlap
+            j += 1
+        if overlaps:
+            item[key] = max(overlaps, key=overlaps.get)
+    return items
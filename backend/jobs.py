@@ -0,0 +1,205 @@
+"""
+Asynchronous job queue with a bounded worker pool and per-stage progress
+"""
+import os
+import math
+import time
+import uuid
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room; carries a Retry-After estimate"""
+
+    def __init__(self, retry_after):
+        super().__init__("Job queue is full")
+        self.retry_after = retry_after
+
+
+class Job:
+    """One queued unit of work and its progress"""
+
+    def __init__(self, kind, func, args=(), kwargs=None, cleanup=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.cleanup = cleanup
+        self.created = time.time()
+        self.status = "queued"
+        self.stage = "queued"
+        self.stages = [{"stage": "queued", "at": self.created}]
+        self.result = None
+        self.error = None
+        self.error_status = None
+        self.started = None
+        self.finished = None
+        self.version = 0
+        self.changed = threading.Condition()
+
+    def set_stage(self, stage):
+        """Progress callback passed to the job function"""
+        with self.changed:
+            self.stage = stage
+            self.stages.append({"stage": stage, "at": time.time()})
+            self.version += 1
+            self.changed.notify_all()
+
+    def _finish(self, status, result=None, error=None, error_status=None):
+        with self.changed:
+            self.status = status
+            self.stage = status
+            self.result = result
+            self.error = error
+            self.error_status = error_status
+            self.finished = time.time()
+            self.stages.append({"stage": status, "at": self.finished})
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait_for_change(self, version, timeout):
+        """Block until the job changes past version (or timeout); returns the new version"""
+        with self.changed:
+            if self.version == version and self.status not in ("completed", "failed"):
+                self.changed.wait(timeout)
+            return self.version
+
+    def to_dict(self, include_result=True):
+        with self.changed:
+            data = {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "stage": self.stage,
+                "stages": [
+                    {"stage": s["stage"], "elapsed": round(s["at"] - self.created, 3)} for s in self.stages
+                ],
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished
+            }
+            if self.status == "completed" and include_result:
+                data["result"] = self.result
+            if self.status == "failed":
+                data["error"] = self.error
+                data["error_status"] = self.error_status
+            return data
+
+
+class JobQueue:
+    """Fixed-size worker pool fed by a bounded queue"""
+
+    def __init__(self, workers=2, max_queue=20, result_ttl=3600, error_handler=None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.error_handler = error_handler
+        self.jobs = {}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._running = 0
+        self._avg_duration = None
+        self._threads = []
+        self._pid = None
+
+    def _ensure_workers(self):
+        """Start the worker threads on first use (threads don't survive into forked worker processes)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind, func, args=(), kwargs=None, cleanup=None):
+        """Queue func(*args, progress=job.set_stage, **kwargs). Raises QueueFullError when full."""
+        self._ensure_workers()
+        self._expire()
+        job = Job(kind, func, args, kwargs, cleanup)
+        with self._lock:
+            self.jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self.jobs[job.id]
+            raise QueueFullError(self.retry_after())
+        logger.info(f"🗂️ Queued {kind} job {job.id} (depth {self._queue.qsize()})")
+        return job
+
+    def completed(self, kind, result):
+        """Register an already finished job (e.g. a cache hit)"""
+        job = Job(kind, None)
+        job._finish("completed", result=result)
+        with self._lock:
+            self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def idle(self):
+        """True when no job is queued or running"""
+        with self._lock:
+            return self._running == 0 and self._queue.empty()
+
+    def retry_after(self):
+        """Seconds until a queue slot is likely to free up (one job finishes every avg/workers seconds)"""
+        average = self._avg_duration or 30.0
+        return max(1, math.ceil(average / max(1, self.workers)))
+
+    def stats(self):
+        with self._lock:
+            statuses = {}
+            for job in self.jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self._queue.qsize(),
+                "running": self._running,
+                "jobs": statuses,
+                "avg_duration": round(self._avg_duration, 3) if self._avg_duration else None
+            }
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            for job_id in [jid for jid, job in self.jobs.items() if job.finished and job.finished < cutoff]:
+                del self.jobs[job_id]
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._running += 1
+            job.started = time.time()
+            with job.changed:
+                job.status = "running"
+            try:
+                result = job.func(*job.args, progress=job.set_stage, **job.kwargs)
+                job._finish("completed", result=result)
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                error, status = self.error_handler(e) if self.error_handler else (str(e), 500)
+                job._finish("failed", error=error, error_status=status)
+            finally:
+                if job.cleanup:
+                    try:
+                        job.cleanup()
+                    except Exception as e:
+                        logger.warning(f"⚠️ Job cleanup failed: {e}")
+                duration = time.time() - job.started
+                with self._lock:
+                    self._running -= 1
+                    self._avg_duration = duration if self._avg_duration is None else 0.8 * self._avg_duration + 0.2 * duration
+                self._queue.task_done()
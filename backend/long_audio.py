@@ -0,0 +1,191 @@
+"""
+Long-audio mode: split recordings at silence boundaries into overlapping
+chunks, transcribe them concurrently with Whisper and stitch the
+verbose_json segments back together.
+"""
+import io
+import logging
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import bind
+
+logger = logging.getLogger(__name__)
+
+
+def find_cut_point(audio, target_ms, search_ms=30000, min_silence_ms=300, seek_step=10):
+    """Return the silence midpoint closest to target_ms, or target_ms if none is found"""
+    from pydub.silence import detect_silence
+
+    window_start = max(0, target_ms - search_ms)
+    window_end = min(len(audio), target_ms + search_ms)
+    window = audio[window_start:window_end]
+    silence_thresh = (audio.dBFS if audio.dBFS != float('-inf') else -60) - 16
+
+    silences = detect_silence(
+        window,
+        min_silence_len=min_silence_ms,
+        silence_thresh=silence_thresh,
+        seek_step=seek_step
+    )
+    if not silences:
+        return target_ms
+
+    midpoints = [window_start + (start + end) // 2 for start, end in silences]
+    return min(midpoints, key=lambda point: abs(point - target_ms))
+
+
+def plan_chunks(audio, chunk_ms=600000, overlap_ms=2000, search_ms=30000):
+    """
+    Plan chunk boundaries.
+
+    Returns a list of dicts with the padded audio range to send to Whisper
+    ("start_ms", "end_ms") and the range of original time the chunk owns
+    ("own_start_ms", "own_end_ms"). Owned ranges tile the recording exactly.
+    """
+    total_ms = len(audio)
+    cuts = [0]
+    while total_ms - cuts[-1] > chunk_ms:
+        target = cuts[-1] + chunk_ms
+        cut = find_cut_point(audio, target, search_ms=min(search_ms, chunk_ms // 4))
+        if cut <= cuts[-1]:
+            cut = target
+        if total_ms - cut < chunk_ms // 4:
+            # Let the last chunk absorb a short tail instead of sending a sliver
+            break
+        cuts.append(cut)
+    cuts.append(total_ms)
+
+    chunks = []
+    for own_start, own_end in zip(cuts, cuts[1:]):
+        chunks.append({
+            "start_ms": max(0, own_start - overlap_ms),
+            "end_ms": min(total_ms, own_end + overlap_ms),
+            "own_start_ms": own_start,
+            "own_end_ms": own_end
+        })
+    return chunks
+
+
+def _dedupe_overlap(previous_text, text, max_words=12):
+    """Drop leading words of text that repeat the trailing words of previous_text"""
+    prev_words = previous_text.split()
+    words = text.split()
+    normalize = lambda w: w.strip('.,!?;:"\'').lower()
+    for n in range(min(max_words, len(prev_words), len(words)), 0, -1):
+        if [normalize(w) for w in prev_words[-n:]] == [normalize(w) for w in words[:n]]:
+            return " ".join(words[n:])
+    return text
+
+
+def stitch_words(chunk_results):
+    """Merge per-chunk word timestamps, keeping each word in the chunk that owns it"""
+    stitched = []
+    for chunk, transcript in chunk_results:
+        offset = chunk["start_ms"] / 1000.0
+        own_start = chunk["own_start_ms"] / 1000.0
+        own_end = chunk["own_end_ms"] / 1000.0
+        for word in getattr(transcript, 'words', None) or []:
+            start = word.start + offset
+            end = word.end + offset
+            if own_start <= (start + end) / 2 < own_end:
+                stitched.append(SimpleNamespace(word=word.word, start=round(start, 3), end=round(end, 3)))
+    return stitched
+
+
+def stitch_segments(chunk_results):
+    """
+    Merge per-chunk Whisper segments into one timeline.
+
+    Each segment is shifted by its chunk offset and kept only by the chunk
+    that owns its midpoint, so overlapping audio is transcribed once.
+    Words repeated across the seam are removed.
+    """
+    stitched = []
+    for chunk, transcript in chunk_results:
+        offset = chunk["start_ms"] / 1000.0
+        own_start = chunk["own_start_ms"] / 1000.0
+        own_end = chunk["own_end_ms"] / 1000.0
+        first_in_chunk = True
+
+        for segment in getattr(transcript, 'segments', None) or []:
+            start = segment.start + offset
+            end = segment.end + offset
+            midpoint = (start + end) / 2
+            if midpoint < own_start or midpoint >= own_end:
+                continue
+
+            text = segment.text
+            if first_in_chunk and stitched:
+                text = _dedupe_overlap(stitched[-1].text, text)
+                # Keep the leading space Whisper puts on segment text
+                if text and segment.text.startswith(' ') and not text.startswith(' '):
+                    text = ' ' + text
+            first_in_chunk = False
+            if not text.strip():
+                continue
+
+            stitched.append(SimpleNamespace(
+                id=len(stitched),
+                start=round(start, 3),
+                end=round(end, 3),
+                text=text
+            ))
+    return stitched
+
+
+def transcribe_long_audio(client, source, file_format=None, language='', chunk_seconds=600, overlap_seconds=2,
+                          max_workers=4, chunk_format='mp3', chunk_bitrate='64k', word_timestamps=False):
+    """
+    Transcribe a recording of any length from a path or file object.
+
+    Returns an object shaped like a Whisper verbose_json transcript
+    (text, language, duration, segments).
+    """
+    from pydub import AudioSegment
+
+    audio = AudioSegment.from_file(source, format=file_format)
+    # Whisper works at 16 kHz mono; downmixing keeps chunks well under the upload limit
+    audio = audio.set_channels(1).set_frame_rate(16000)
+
+    chunks = plan_chunks(audio, chunk_ms=int(chunk_seconds * 1000), overlap_ms=int(overlap_seconds * 1000))
+    logger.info(f"✂️ Long-audio mode: {len(audio) / 1000:.1f}s split into {len(chunks)} chunks")
+
+    def transcribe_chunk(index):
+        chunk = chunks[index]
+        buffer = io.BytesIO()
+        audio[chunk["start_ms"]:chunk["end_ms"]].export(buffer, format=chunk_format, bitrate=chunk_bitrate)
+        buffer.seek(0)
+        buffer.name = f"chunk_{index}.{chunk_format}"
+
+        whisper_params = {
+            "model": "whisper-1",
+            "file": buffer,
+            "response_format": "verbose_json"
+        }
+        if language:
+            whisper_params["language"] = language
+        if word_timestamps:
+            whisper_params["timestamp_granularities"] = ["segment", "word"]
+
+        logger.info(f"🎤 Transcribing chunk {index + 1}/{len(chunks)}")
+        return client.audio.transcriptions.create(**whisper_params)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        transcripts = list(executor.map(bind(transcribe_chunk), range(len(chunks))))
+
+    chunk_results = list(zip(chunks, transcripts))
+    segments = stitch_segments(chunk_results)
+    words = stitch_words(chunk_results)
+
+    languages = [getattr(t, 'language', None) for t in transcripts if getattr(t, 'language', None)]
+    detected_language = max(set(languages), key=languages.count) if languages else (language or 'en')
+
+    return SimpleNamespace(
+        text="".join(segment.text for segment in segments).strip(),
+        language=detected_language,
+        duration=len(audio) / 1000.0,
+        segments=segments,
+        words=words,
+        chunks=len(chunks)
+    )
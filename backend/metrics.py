@@ -0,0 +1,214 @@
+"""
+Prometheus-style metrics: counters, gauges and histograms kept in memory
+and rendered in the text exposition format.
+
+Updates are a dict lookup and an add under one lock, cheap enough to
+stay on under load. With several worker processes each process flushes a
+snapshot to `directory` every flush_interval seconds; a scrape of any
+worker merges the snapshots of all live workers with its own live values.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Metrics:
+    """Metric registry for one process, optionally merged with sibling worker processes"""
+
+    def __init__(self, prefix="", directory=None, flush_interval=5.0, buckets=LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self.descriptions = {}
+        self._lock = threading.Lock()
+        self._reset()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._start_flusher()
+            if hasattr(os, "register_at_fork"):
+                # Preloaded app forked into workers: start from zero in each child
+                os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self._start_flusher()
+
+    def describe(self, name, metric_type, help_text):
+        self.descriptions[self.prefix + name] = (metric_type, help_text)
+
+    def inc(self, name, value=1, **labels):
+        key = (self.prefix + name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def add_gauge(self, name, delta, **labels):
+        key = (self.prefix + name, _label_key(labels))
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + delta
+
+    def observe(self, name, value, **labels):
+        key = (self.prefix + name, _label_key(labels))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # per-bucket counts (+Inf last), sum, count
+                histogram = self.histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def time(self, name, in_progress=None, **labels):
+        """Observe the duration of the with-block; optionally track it in an in-progress gauge"""
+        if in_progress:
+            self.add_gauge(in_progress, 1, **labels)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+            if in_progress:
+                self.add_gauge(in_progress, -1, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": [[name, list(map(list, key)), value] for (name, key), value in self.counters.items()],
+                "gauges": [[name, list(map(list, key)), value] for (name, key), value in self.gauges.items()],
+                "histograms": [
+                    [name, list(map(list, key)), list(h[0]), h[1], h[2]] for (name, key), h in self.histograms.items()
+                ]
+            }
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.directory, f"metrics_{pid}.json")
+
+    def flush(self):
+        """Write this process's snapshot for sibling workers to merge"""
+        path = self._snapshot_path(self._pid)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _start_flusher(self):
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except OSError as e:
+                    logger.warning(f"⚠️ Metrics flush failed: {e}")
+        threading.Thread(target=run, name="metrics-flush", daemon=True).start()
+
+    def _collect(self):
+        """Own live snapshot plus the latest snapshots of other live worker processes"""
+        snapshots = [self.snapshot()]
+        if not self.directory:
+            return snapshots
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith("metrics_") and filename.endswith(".json")):
+                continue
+            try:
+                pid = int(filename[len("metrics_"):-len(".json")])
+            except ValueError:
+                continue
+            path = os.path.join(self.directory, filename)
+            if pid == self._pid:
+                continue
+            if not _pid_alive(pid):
+                # Exited worker: drop its series (counters appear reset, as after a restart)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        counters, gauges, histograms = {}, {}, {}
+        for snapshot in self._collect():
+            for name, key, value in snapshot["counters"]:
+                k = (name, tuple(map(tuple, key)))
+                counters[k] = counters.get(k, 0) + value
+            for name, key, value in snapshot["gauges"]:
+                k = (name, tuple(map(tuple, key)))
+                gauges[k] = gauges.get(k, 0) + value
+            for name, key, bucket_counts, total, count in snapshot["histograms"]:
+                k = (name, tuple(map(tuple, key)))
+                merged = histograms.setdefault(k, [[0] * len(bucket_counts), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], bucket_counts)]
+                merged[1] += total
+                merged[2] += count
+
+        lines = []
+        for series, metric_type in ((counters, "counter"), (gauges, "gauge"), (histograms, "histogram")):
+            by_name = {}
+            for (name, key), value in series.items():
+                by_name.setdefault(name, []).append((key, value))
+            for name in sorted(by_name):
+                described_type, help_text = self.descriptions.get(name, (metric_type, ""))
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {described_type}")
+                for key, value in sorted(by_name[name]):
+                    if metric_type != "histogram":
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+                        continue
+                    bucket_counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                        cumulative += bucket_count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                    lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,381 @@
+"""
+OpenAI client layer: one pooled HTTP client shared by every stage, with
+per-stage timeouts, jittered exponential retries, optional hedging and
+an optional shared rate limiter (see rate_limit.py) in front of every
+HTTP request. Each call is recorded as a span of the active request
+trace (see tracing.py).
+
+StageClients.get(stage) returns an object exposing the same
+chat.completions.create / audio.transcriptions.create /
+audio.translations.create calls the pipeline already uses, so stage
+functions keep taking a plain "client" argument. AsyncStageClients is
+the AsyncOpenAI equivalent for the ASGI app (see asgi.py), sharing the
+same stage policies and rate limiter.
+"""
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from types import SimpleNamespace
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from openai import (
+    OpenAI,
+    AsyncOpenAI,
+    DefaultHttpxClient,
+    DefaultAsyncHttpxClient,
+    Timeout,
+    DEFAULT_CONNECTION_LIMITS,
+    APIConnectionError,
+    APIStatusError,
+    RateLimitError
+)
+
+from tracing import bind, span
+
+logger = logging.getLogger(__name__)
+
+# Limits class of the HTTP library the SDK is built on
+Limits = type(DEFAULT_CONNECTION_LIMITS)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def create_client(api_key, max_connections=50, max_keepalive=20, keepalive_expiry=60.0, connect_timeout=5.0):
+    """OpenAI client with an explicitly sized, keep-alive connection pool (SDK retries off)"""
+    http_client = DefaultHttpxClient(
+        limits=Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        ),
+        timeout=Timeout(60.0, connect=connect_timeout)
+    )
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+def create_async_client(api_key, max_connections=200, max_keepalive=50, keepalive_expiry=60.0, connect_timeout=5.0):
+    """AsyncOpenAI client with its own keep-alive connection pool (SDK retries off); create it inside the event loop"""
+    http_client = DefaultAsyncHttpxClient(
+        limits=Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        ),
+        timeout=Timeout(60.0, connect=connect_timeout)
+    )
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+def is_retryable(e):
+    if isinstance(e, (APIConnectionError, RateLimitError)):
+        return True
+    return isinstance(e, APIStatusError) and e.status_code in RETRYABLE_STATUS
+
+
+def _rewind_files(kwargs):
+    """Uploads are streams; rewind them so a retried request sends the whole file"""
+    file = kwargs.get("file")
+    stream = file[1] if isinstance(file, tuple) else file
+    if hasattr(stream, "seek"):
+        stream.seek(0)
+
+
+class StagePolicy:
+    """Timeouts, retry and hedging settings for one pipeline stage"""
+
+    def __init__(self, name, read_timeout=60.0, connect_timeout=5.0, max_attempts=3, base_delay=0.5,
+                 max_delay=8.0, hedge=False, hedge_delay=2.0, hedge_min_samples=20):
+        self.name = name
+        self.timeout = Timeout(read_timeout, connect=connect_timeout)
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = deque(maxlen=200)
+        self.counts = {"calls": 0, "retries": 0, "hedged": 0, "hedge_wins": 0, "failures": 0}
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def current_hedge_delay(self):
+        """p95 of recent latencies once enough samples exist, else the configured delay"""
+        with self._lock:
+            if len(self.latencies) < self.hedge_min_samples:
+                return self.hedge_delay
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def record(self, latency=None, **increments):
+        with self._lock:
+            if latency is not None:
+                self.latencies.append(latency)
+            for key, value in increments.items():
+                self.counts[key] += value
+
+    def stats(self):
+        with self._lock:
+            ordered = sorted(self.latencies)
+            data = dict(self.counts)
+        data["p50"] = round(ordered[len(ordered) // 2], 3) if ordered else None
+        data["p95"] = round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3) if ordered else None
+        return data
+
+
+class BaseStageClient:
+    """Client facade for one stage: same create() calls, wrapped in the stage policy"""
+
+    def __init__(self, client, policy, limiter=None, count_tokens=None, on_usage=None):
+        self.policy = policy
+        self._limiter = limiter
+        self._on_usage = on_usage
+        self._count_tokens = count_tokens or (lambda text: len(text) // 4)
+        self._client = client.with_options(timeout=policy.timeout, max_retries=0)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=self._wrap(self._client.chat.completions.create, hedgeable=True)
+        ))
+        self.audio = SimpleNamespace(
+            transcriptions=SimpleNamespace(create=self._wrap(self._client.audio.transcriptions.create)),
+            translations=SimpleNamespace(create=self._wrap(self._client.audio.translations.create))
+        )
+
+    def _wrap(self, create, hedgeable=False):
+        def call(**kwargs):
+            # Streamed completions are consumed by the caller and are never hedged
+            hedge = hedgeable and self.policy.hedge and not kwargs.get("stream")
+            return self._call_with_retries(create, kwargs, hedge)
+        return call
+
+    def _estimate_tokens(self, kwargs):
+        """Prompt tokens plus expected completion (max_tokens, else about the prompt size)"""
+        messages = kwargs.get("messages")
+        if not messages:
+            return 0
+        prompt = sum(self._count_tokens(str(message.get("content", ""))) for message in messages)
+        return prompt + (kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or prompt)
+
+    def _settle(self, kwargs, estimate, result):
+        """Report the usage the API returned and correct the token bucket with it"""
+        usage = getattr(result, "usage", None)
+        if getattr(usage, "total_tokens", None) is None:
+            return
+        if self._on_usage is not None:
+            self._on_usage(self.policy.name, kwargs.get("model"), usage)
+        if self._limiter is not None and estimate:
+            self._limiter.adjust(kwargs.get("model"), usage.total_tokens - estimate)
+
+
+class StageClient(BaseStageClient):
+    """Synchronous stage client; hedge backups run in the shared executor"""
+
+    def __init__(self, client, policy, executor, limiter=None, count_tokens=None, on_usage=None):
+        super().__init__(client, policy, limiter, count_tokens, on_usage)
+        self._executor = executor
+
+    def _acquire(self, kwargs):
+        """Wait for rate-limit budget before an HTTP request; returns the token estimate"""
+        if self._limiter is None:
+            return 0
+        estimate = self._estimate_tokens(kwargs)
+        with span("rate_limit", model=kwargs.get("model")) as attrs:
+            attrs["waited"] = round(self._limiter.acquire(kwargs.get("model"), estimate), 3)
+        return estimate
+
+    def _send(self, create, kwargs, estimate):
+        result = create(**kwargs)
+        self._settle(kwargs, estimate, result)
+        return result
+
+    def _call_with_retries(self, create, kwargs, hedge):
+        policy = self.policy
+        policy.record(calls=1)
+        with span(f"openai.{policy.name}", model=kwargs.get("model")) as attrs:
+            for attempt in range(policy.max_attempts):
+                attrs["attempts"] = attempt + 1
+                estimate = self._acquire(kwargs)
+                started = time.perf_counter()
+                try:
+                    _rewind_files(kwargs)
+                    if hedge:
+                        result = self._hedged(create, kwargs, estimate, attrs)
+                    else:
+                        result = self._send(create, kwargs, estimate)
+                    policy.record(latency=time.perf_counter() - started)
+                    return result
+                except Exception as e:
+                    if not is_retryable(e) or attempt + 1 >= policy.max_attempts:
+                        policy.record(failures=1)
+                        raise
+                    delay = policy.backoff(attempt)
+                    policy.record(retries=1)
+                    logger.warning(f"🔁 {policy.name} request failed ({e.__class__.__name__}), retry {attempt + 1} in {delay:.2f}s")
+                    time.sleep(delay)
+
+    def _hedged(self, create, kwargs, estimate, attrs):
+        """Send a duplicate request if the first is slower than the hedge delay; first success wins"""
+        # The primary starts at once on its own thread: queued in the bounded
+        # hedge pool under load, it would hedge before it was even sent.
+        # Only backups use the pool.
+        primary = Future()
+
+        def run_primary():
+            try:
+                primary.set_result(self._send(create, kwargs, estimate))
+            except BaseException as e:
+                primary.set_exception(e)
+
+        threading.Thread(target=bind(run_primary), name=f"{self.policy.name}-primary", daemon=True).start()
+        done, _ = wait([primary], timeout=self.policy.current_hedge_delay())
+        if done:
+            return primary.result()
+
+        self.policy.record(hedged=1)
+        attrs["hedged"] = True
+        logger.info(f"🏁 Hedging slow {self.policy.name} request")
+        backup = self._executor.submit(bind(lambda: self._send(create, kwargs, self._acquire(kwargs))))
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        self.policy.record(hedge_wins=1)
+                        attrs["hedge_won"] = True
+                    return future.result()
+                error = future.exception()
+        raise error
+
+
+class StageClients:
+    """Builds (and caches) a StageClient per stage for the current underlying client"""
+
+    def __init__(self, get_client, policies, hedge_workers=8, limiter=None, count_tokens=None, on_usage=None):
+        self.get_client = get_client
+        self.policies = policies
+        self.limiter = limiter
+        self.count_tokens = count_tokens
+        self.on_usage = on_usage
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="hedge")
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, stage):
+        client = self.get_client()
+        with self._lock:
+            cached = self._cache.get(stage)
+            if cached is None or cached[0] is not client:
+                cached = (client, StageClient(client, self.policies[stage], self._executor,
+                                              self.limiter, self.count_tokens, self.on_usage))
+                self._cache[stage] = cached
+            return cached[1]
+
+    def stats(self):
+        return {name: policy.stats() for name, policy in self.policies.items()}
+
+
+class AsyncStageClient(BaseStageClient):
+    """
+    AsyncOpenAI stage client: the same policy with awaitable create() calls.
+    Retries and rate-limit waits sleep without blocking the event loop, and
+    a hedged call cancels the slower request once one succeeds.
+    """
+
+    async def _acquire(self, kwargs):
+        if self._limiter is None:
+            return 0
+        estimate = self._estimate_tokens(kwargs)
+        with span("rate_limit", model=kwargs.get("model")) as attrs:
+            # Reserving is a short SQLite transaction; keep it off the event loop
+            wait = await asyncio.to_thread(self._limiter.reserve, kwargs.get("model"), estimate)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            attrs["waited"] = round(wait, 3)
+        return estimate
+
+    async def _send(self, create, kwargs, estimate):
+        result = await create(**kwargs)
+        self._settle(kwargs, estimate, result)
+        return result
+
+    async def _call_with_retries(self, create, kwargs, hedge):
+        policy = self.policy
+        policy.record(calls=1)
+        with span(f"openai.{policy.name}", model=kwargs.get("model")) as attrs:
+            for attempt in range(policy.max_attempts):
+                attrs["attempts"] = attempt + 1
+                estimate = await self._acquire(kwargs)
+                started = time.perf_counter()
+                try:
+                    _rewind_files(kwargs)
+                    if hedge:
+                        result = await self._hedged(create, kwargs, estimate, attrs)
+                    else:
+                        result = await self._send(create, kwargs, estimate)
+                    policy.record(latency=time.perf_counter() - started)
+                    return result
+                except Exception as e:
+                    if not is_retryable(e) or attempt + 1 >= policy.max_attempts:
+                        policy.record(failures=1)
+                        raise
+                    delay = policy.backoff(attempt)
+                    policy.record(retries=1)
+                    logger.warning(f"🔁 {policy.name} request failed ({e.__class__.__name__}), retry {attempt + 1} in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+
+    async def _hedged(self, create, kwargs, estimate, attrs):
+        primary = asyncio.ensure_future(self._send(create, kwargs, estimate))
+        done, _ = await asyncio.wait({primary}, timeout=self.policy.current_hedge_delay())
+        if done:
+            return primary.result()
+
+        self.policy.record(hedged=1)
+        attrs["hedged"] = True
+        logger.info(f"🏁 Hedging slow {self.policy.name} request")
+
+        async def send_backup():
+            return await self._send(create, kwargs, await self._acquire(kwargs))
+
+        backup = asyncio.ensure_future(send_backup())
+        pending = {primary, backup}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is backup:
+                            self.policy.record(hedge_wins=1)
+                            attrs["hedge_won"] = True
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class AsyncStageClients:
+    """Builds (and caches) an AsyncStageClient per stage for the current AsyncOpenAI client"""
+
+    def __init__(self, get_client, policies, limiter=None, count_tokens=None, on_usage=None):
+        self.get_client = get_client
+        self.policies = policies
+        self.limiter = limiter
+        self.count_tokens = count_tokens
+        self.on_usage = on_usage
+        self._cache = {}
+
+    def get(self, stage):
+        client = self.get_client()
+        cached = self._cache.get(stage)
+        if cached is None or cached[0] is not client:
+            cached = (client, AsyncStageClient(client, self.policies[stage], self.limiter, self.count_tokens, self.on_usage))
+            self._cache[stage] = cached
+        return cached[1]
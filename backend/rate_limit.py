@@ -0,0 +1,168 @@
+"""
+Token-bucket rate limiter for OpenAI requests-per-minute and
+tokens-per-minute budgets, shared by every thread and worker process
+through a SQLite file.
+
+Each call reserves its requests/tokens up front, letting the bucket go
+negative, and then sleeps until the bucket would have refilled to cover
+it. Reservations are made one transaction at a time, so callers are
+served in arrival order instead of racing each other.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitWaitExceeded(Exception):
+    """Raised when a call would have to wait longer than max_wait; carries a Retry-After estimate"""
+
+    def __init__(self, model, retry_after):
+        super().__init__(f"Rate limit budget for {model} exhausted, retry in {retry_after}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    limits: {model: {"rpm": requests per minute, "tpm": tokens per minute}}.
+    A missing or zero budget is not limited; models without limits pass through.
+    """
+
+    def __init__(self, path, limits, max_wait=120.0):
+        self.path = path
+        self.limits = limits
+        self.max_wait = max_wait
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.delayed = {}
+        self.waited = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if hasattr(os, "register_at_fork"):
+            # SQLite connections must not be shared with forked worker processes
+            os.register_at_fork(after_in_child=self._after_fork)
+        with self._connection() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS buckets (
+                model TEXT PRIMARY KEY,
+                requests REAL NOT NULL,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )""")
+
+    def _after_fork(self):
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def _budget(self, model):
+        limit = self.limits.get(model) or {}
+        return float(limit.get("rpm") or 0), float(limit.get("tpm") or 0)
+
+    @staticmethod
+    def _refill(level, capacity, elapsed):
+        return min(capacity, level + capacity / 60.0 * elapsed)
+
+    def _reserve(self, model, requests, tokens):
+        """Reserve capacity; returns seconds to wait before the call may start"""
+        rpm, tpm = self._budget(model)
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = db.execute("SELECT requests, tokens, updated FROM buckets WHERE model = ?", (model,)).fetchone()
+            level_requests, level_tokens = (rpm, tpm) if row is None else (
+                self._refill(row[0], rpm, now - row[2]),
+                self._refill(row[1], tpm, now - row[2])
+            )
+            level_requests -= requests if rpm else 0
+            level_tokens -= tokens if tpm else 0
+
+            wait = 0.0
+            if rpm and level_requests < 0:
+                wait = max(wait, -level_requests / (rpm / 60.0))
+            if tpm and level_tokens < 0:
+                wait = max(wait, -level_tokens / (tpm / 60.0))
+            if wait > self.max_wait:
+                db.execute("ROLLBACK")
+                raise RateLimitWaitExceeded(model, int(wait) + 1)
+
+            db.execute(
+                "INSERT OR REPLACE INTO buckets (model, requests, tokens, updated) VALUES (?, ?, ?, ?)",
+                (model, level_requests, level_tokens, now)
+            )
+            db.execute("COMMIT")
+            return wait
+        except RateLimitWaitExceeded:
+            raise
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def reserve(self, model, tokens=0):
+        """Reserve one request of `tokens` tokens; returns the seconds to wait before sending it"""
+        rpm, tpm = self._budget(model)
+        if not rpm and not tpm:
+            return 0.0
+        wait = self._reserve(model, 1, tokens)
+        if wait > 0:
+            logger.info(f"⏳ Rate limit: delaying {model} call by {wait:.2f}s")
+            with self._stats_lock:
+                self.delayed[model] = self.delayed.get(model, 0) + 1
+                self.waited[model] = self.waited.get(model, 0.0) + wait
+        return wait
+
+    def acquire(self, model, tokens=0):
+        """Block until one request of `tokens` tokens fits the model's budget"""
+        wait = self.reserve(model, tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def adjust(self, model, tokens):
+        """Correct the token bucket once actual usage is known (positive: more tokens used than reserved)"""
+        _, tpm = self._budget(model)
+        if not tpm or not tokens:
+            return
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("UPDATE buckets SET tokens = MIN(?, tokens - ?) WHERE model = ?", (tpm, tokens, model))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def levels(self):
+        """Current bucket levels per limited model (shared across processes)"""
+        now = time.time()
+        rows = {
+            row[0]: row[1:]
+            for row in self._connection().execute("SELECT model, requests, tokens, updated FROM buckets")
+        }
+        levels = {}
+        for model in self.limits:
+            rpm, tpm = self._budget(model)
+            requests, tokens, updated = rows.get(model, (rpm, tpm, now))
+            with self._stats_lock:
+                delayed, waited = self.delayed.get(model, 0), self.waited.get(model, 0.0)
+            levels[model] = {
+                "rpm": rpm or None,
+                "tpm": tpm or None,
+                "requests_available": round(self._refill(requests, rpm, now - updated), 2) if rpm else None,
+                "tokens_available": round(self._refill(tokens, tpm, now - updated)) if tpm else None,
+                "delayed_calls": delayed,
+                "delayed_seconds": round(waited, 3)
+            }
+        return levels
@@ -9,6 +9,7 @@ import time
 import webbrowser
 from pyngrok import ngrok, conf
 from dotenv import load_dotenv
+from serve import wait_until_ready
 
 # Load environment variables
 load_dotenv()
@@ -42,21 +43,15 @@ def start_flask_app():
         creationflags=subprocess.CREATE_NEW_CONSOLE if sys.platform == 'win32' else 0
     )
     
-    # Wait for server to start
+    # Wait until the server reports ready (polls /api/ready)
     print("⏳ Waiting for Flask server to start...")
-    time.sleep(5)
+    waited = wait_until_ready("http://localhost:5000", timeout=60, process=flask_process)
     
-    # Check if server is responding
-    import socket
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    result = sock.connect_ex(('localhost', 5000))
-    sock.close()
-    
-    if result == 0:
-        print("✅ Flask backend is running on http://localhost:5000")
+    if waited is not None:
+        print(f"✅ Flask backend is running on http://localhost:5000 (ready after {waited:.1f}s)")
         return flask_process
     else:
-        print("❌ Flask server failed to start on port 5000")
+        print("❌ Flask server did not become ready on port 5000 (check OPENAI_API_KEY in .env and the server output)")
         flask_process.terminate()
         return None
 
@@ -0,0 +1,453 @@
+"""
+GPT-based speaker segmentation of Whisper transcripts
+"""
+import json
+import time
+import logging
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+from alignment import align_turns, turn_word_starts
+from tracing import bind, span
+
+logger = logging.getLogger(__name__)
+
+# Token counting for window sizing (tiktoken is optional; fall back to ~4 chars per token).
+# The encoding is loaded on first use: it takes a while and may be downloaded.
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("o200k_base")
+                except Exception:
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+SEGMENTATION_MODEL = "gpt-4o-mini"  # Fast and cost-effective
+SEGMENTATION_SYSTEM_PROMPT = "You are an expert at analyzing medical conversations and identifying speakers. Always respond with valid JSON only."
+
+# Compact speaker codes used in segment-id mode
+SPEAKER_CODES = {"D": "Doctor", "P": "Patient"}
+
+
+def _format_context(previous_turns):
+    """Earlier turns given to GPT for speaker continuity (streaming windows)"""
+    if not previous_turns:
+        return ""
+    context_lines = "\n".join(f"{turn.get('speaker', 'Unknown')}: {turn.get('text', '')}" for turn in previous_turns)
+    return f"""The conversation so far ended with these turns (for speaker continuity only, do NOT include them in your answer):
+\"\"\"{context_lines}\"\"\"
+
+"""
+
+
+def build_segmentation_prompt(text, previous_turns=None):
+    """Create a prompt for GPT to segment the conversation"""
+    context = _format_context(previous_turns)
+
+    return f"""You are analyzing a doctor-patient conversation. Read the following transcribed text and identify which parts are spoken by the Doctor and which parts are spoken by the Patient.
+
+{context}Transcribed conversation:
+\"\"\"{text}\"\"\"
+
+Please segment this conversation into turns between Doctor and Patient. Format your response as a JSON array where each object has:
+- "speaker": either "Doctor" or "Patient"
+- "text": the exact words they said
+
+Rules:
+1. The doctor typically asks questions, gives medical advice, and discusses treatment
+2. The patient typically describes symptoms, answers questions, and responds to advice
+3. Maintain the exact order and words from the original text
+4. Do not add, remove, or modify any words
+5. Return ONLY the JSON array, no other text
+
+Example format:
+[
+  {{"speaker": "Doctor", "text": "How are you feeling today?"}},
+  {{"speaker": "Patient", "text": "I've been having knee pain."}}
+]"""
+
+
+def parse_turns(gpt_content):
+    """Parse the GPT response, handling a bare array or an array wrapped in an object"""
+    try:
+        parsed = json.loads(gpt_content)
+    except (json.JSONDecodeError, TypeError):
+        return []
+
+    if isinstance(parsed, dict) and 'conversation' in parsed:
+        conversation = parsed['conversation']
+    elif isinstance(parsed, dict) and 'turns' in parsed:
+        conversation = parsed['turns']
+    elif isinstance(parsed, list):
+        conversation = parsed
+    else:
+        conversation = []
+        # Try to extract array from object
+        for key in parsed:
+            if isinstance(parsed[key], list):
+                conversation = parsed[key]
+                break
+
+    return [turn for turn in conversation if isinstance(turn, dict) and 'text' in turn]
+
+
+def fallback_conversation(transcript):
+    """Single unlabelled turn covering the whole transcript"""
+    segments = getattr(transcript, 'segments', None)
+    return [{
+        "speaker": "Unknown",
+        "text": transcript.text,
+        "start": segments[0].start if segments else 0,
+        "end": getattr(transcript, 'duration', 0)
+    }]
+
+
+def build_labelling_prompt(segments, previous_turns=None):
+    """Prompt asking only for where each speaker turn starts, by segment id"""
+    numbered = "\n".join(f"[{i}] {segment.text.strip()}" for i, segment in enumerate(segments))
+
+    return f"""You are analyzing a doctor-patient conversation. The transcript below is split into numbered segments. Identify where each speaker turn begins.
+
+{_format_context(previous_turns)}Segments:
+{numbered}
+
+Respond with a JSON object {{"turns": [[segment_id, word_index, speaker], ...]}} where each entry marks the start of a new turn:
+- segment_id: the number of the segment where the turn starts
+- word_index: 0 if the turn starts at the beginning of the segment, otherwise the index of the first word of the new turn within that segment (words split on spaces, counting from 0)
+- speaker: "D" for Doctor or "P" for Patient
+
+Rules:
+1. The doctor typically asks questions, gives medical advice, and discusses treatment
+2. The patient typically describes symptoms, answers questions, and responds to advice
+3. List entries in order; the first entry must be [0, 0, speaker]
+4. Only add an entry when the speaker changes
+5. Do not repeat any transcript text
+
+Example:
+{{"turns": [[0, 0, "D"], [1, 0, "P"], [3, 4, "D"]]}}"""
+
+
+def parse_turn_starts(gpt_content, segments):
+    """Parse and validate turn starts into sorted [(segment_id, word_index, speaker)]"""
+    try:
+        parsed = json.loads(gpt_content)
+    except (json.JSONDecodeError, TypeError):
+        return []
+
+    entries = parsed.get("turns", []) if isinstance(parsed, dict) else parsed
+    starts = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if isinstance(entry, dict):
+            entry = [entry.get("segment_id", entry.get("id")), entry.get("word_index", 0), entry.get("speaker")]
+        if not isinstance(entry, (list, tuple)) or len(entry) < 2:
+            continue
+        if len(entry) == 2:
+            entry = [entry[0], 0, entry[1]]
+        try:
+            segment_id = int(entry[0])
+            word_index = max(0, int(entry[1]))
+        except (TypeError, ValueError):
+            continue
+        speaker = SPEAKER_CODES.get(str(entry[2]).strip()[:1].upper())
+        if speaker is None or not 0 <= segment_id < len(segments):
+            continue
+        word_index = min(word_index, max(0, len(segments[segment_id].text.split()) - 1))
+        starts[(segment_id, word_index)] = speaker
+
+    ordered = [(seg, word, speaker) for (seg, word), speaker in sorted(starts.items())]
+    if ordered and ordered[0][:2] != (0, 0):
+        ordered.insert(0, (0, 0, ordered[0][2]))
+    return ordered
+
+
+def rebuild_turns(segments, starts):
+    """Rebuild turns locally from the original segment text, so turn text is exact"""
+    conversation = []
+    boundaries = {(seg, word): speaker for seg, word, speaker in starts}
+    current = None
+    pending = None
+
+    for segment_id, segment in enumerate(segments):
+        words = segment.text.split()
+        # A turn start on a segment without words takes effect at the next word
+        if not words and (segment_id, 0) in boundaries:
+            pending = boundaries[(segment_id, 0)]
+        for word_index, word in enumerate(words):
+            speaker = boundaries.get((segment_id, word_index)) or pending
+            pending = None
+            if speaker and (current is None or speaker != current["speaker"]):
+                current = {"speaker": speaker, "text": word}
+                conversation.append(current)
+            elif current is not None:
+                current["text"] += " " + word
+
+    return conversation
+
+
+def turn_starts_request(transcript, previous_turns=None):
+    """Chat completion arguments for a segment-id mode request"""
+    return {
+        "model": SEGMENTATION_MODEL,
+        "messages": [
+            {"role": "system", "content": SEGMENTATION_SYSTEM_PROMPT},
+            {"role": "user", "content": build_labelling_prompt(transcript.segments, previous_turns)}
+        ],
+        "temperature": 0.3,
+        "response_format": {"type": "json_object"}
+    }
+
+
+def request_turn_starts(client, transcript, previous_turns=None):
+    """Segment-id mode request: returns validated turn starts for transcript.segments"""
+    gpt_response = client.chat.completions.create(**turn_starts_request(transcript, previous_turns))
+    _log_usage(gpt_response, "segments")
+
+    return parse_turn_starts(gpt_response.choices[0].message.content, transcript.segments)
+
+
+def label_segments(client, transcript, previous_turns=None):
+    """Segment-id mode: GPT returns only turn starts; turns are rebuilt from the segments"""
+    starts = request_turn_starts(client, transcript, previous_turns)
+    return rebuild_turns(transcript.segments, starts) if starts else []
+
+
+def text_turns_request(transcript, previous_turns=None):
+    """Chat completion arguments for a text mode request"""
+    return {
+        "model": SEGMENTATION_MODEL,
+        "messages": [
+            {"role": "system", "content": SEGMENTATION_SYSTEM_PROMPT},
+            {"role": "user", "content": build_segmentation_prompt(transcript.text, previous_turns)}
+        ],
+        "temperature": 0.3,
+        "response_format": {"type": "json_object"}
+    }
+
+
+def request_text_turns(client, transcript, previous_turns=None):
+    """Text mode request: GPT echoes the transcript as speaker turns"""
+    gpt_response = client.chat.completions.create(**text_turns_request(transcript, previous_turns))
+    _log_usage(gpt_response, "text")
+
+    return parse_turns(gpt_response.choices[0].message.content)
+
+
+def _log_usage(response, mode):
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        logger.info(f"📊 Segmentation ({mode} mode): {usage.prompt_tokens} prompt / {usage.completion_tokens} completion tokens")
+
+
+def count_tokens(text):
+    """Number of model tokens in text (estimated when tiktoken is unavailable)"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return max(1, len(text) // 4)
+
+
+def plan_windows(segments, max_tokens, overlap_segments=4):
+    """Split segments into [start, end) windows of at most max_tokens, overlapping by a few segments"""
+    counts = [count_tokens(segment.text) for segment in segments]
+    windows = []
+    start = 0
+    while start < len(segments):
+        end = start
+        total = 0
+        while end < len(segments) and (end == start or total + counts[end] <= max_tokens):
+            total += counts[end]
+            end += 1
+        windows.append((start, end))
+        if end >= len(segments):
+            break
+        start = max(start + 1, end - overlap_segments)
+    return windows
+
+
+def _sub_transcript(transcript, start, end):
+    """Transcript view over segments[start:end], with window-local segment ids"""
+    segments = transcript.segments[start:end]
+    t_start, t_end = segments[0].start, segments[-1].end
+    words = [w for w in (getattr(transcript, 'words', None) or []) if t_start <= w.start < t_end]
+    return SimpleNamespace(
+        text="".join(segment.text for segment in segments).strip(),
+        segments=segments,
+        words=words,
+        duration=t_end
+    )
+
+
+def _turns_to_starts(turns, segments):
+    """Convert text-mode turns to (segment, word index, speaker) starts at each turn's aligned first word"""
+    starts = []
+    for turn, position in zip(turns, turn_word_starts(turns, segments)):
+        speaker = turn.get('speaker')
+        # Unmatched turns stay with the previous speaker
+        if speaker in ('Doctor', 'Patient') and position is not None:
+            starts.append((*position, speaker))
+    return starts
+
+
+def _segment_labels(starts, count):
+    """Expand turn starts to one speaker per segment (the speaker at the segment's first word)"""
+    by_segment = {}
+    for segment_id, word_index, speaker in sorted(starts):
+        by_segment.setdefault(segment_id, []).append((word_index, speaker))
+
+    labels = []
+    current = None
+    for i in range(count):
+        entries = by_segment.get(i, [])
+        if entries and (entries[0][0] == 0 or current is None):
+            current = entries[0][1]
+        labels.append(current)
+        if entries:
+            current = entries[-1][1]
+    return labels
+
+
+def _swap(speaker):
+    return {"Doctor": "Patient", "Patient": "Doctor"}.get(speaker, speaker)
+
+
+def window_request(transcript, window, mode="text"):
+    """(sub-transcript, chat completion arguments) for one window of a long transcript"""
+    sub = _sub_transcript(transcript, *window)
+    return sub, turn_starts_request(sub) if mode == "segments" else text_turns_request(sub)
+
+
+def parse_window_starts(gpt_response, sub, window, mode="text"):
+    """Turn starts, in whole-transcript segment ids, from one window's response"""
+    _log_usage(gpt_response, mode)
+    content = gpt_response.choices[0].message.content
+    if mode == "segments":
+        local = parse_turn_starts(content, sub.segments)
+    else:
+        local = _turns_to_starts(parse_turns(content), sub.segments)
+    return [(window[0] + seg, word, speaker) for seg, word, speaker in local]
+
+
+def segment_windowed(client, transcript, windows, mode="text", max_workers=4):
+    """Segment windows of a long transcript concurrently and merge them"""
+    def run_window(window):
+        sub, request = window_request(transcript, window, mode)
+        return parse_window_starts(client.chat.completions.create(**request), sub, window, mode)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows)))) as executor:
+        window_starts = list(executor.map(bind(run_window), windows))
+
+    return merge_windows(transcript, windows, window_starts)
+
+
+def merge_windows(transcript, windows, window_starts):
+    """
+    Merge per-window turn starts into one conversation.
+
+    Labels in each window's overlap are compared with the previous
+    window; if most disagree, the window's Doctor/Patient labels are
+    swapped so speakers stay consistent. Each overlap is then split at
+    its midpoint, and turns are rebuilt from the original segment text.
+    """
+    segments = transcript.segments
+    merged = []
+    previous_labels = None
+    for k, ((start, end), starts) in enumerate(zip(windows, window_starts)):
+        labels = dict(zip(range(start, end), _segment_labels([(s - start, w, sp) for s, w, sp in starts], end - start)))
+
+        # Overlap reconciliation: keep Doctor/Patient consistent with the previous window
+        if previous_labels:
+            overlap = [i for i in range(start, windows[k - 1][1]) if labels.get(i) and previous_labels.get(i)]
+            disagreements = sum(1 for i in overlap if labels[i] != previous_labels[i])
+            if overlap and disagreements * 2 > len(overlap):
+                logger.info(f"🔁 Window {k}: swapping speaker labels to match previous window")
+                starts = [(s, w, _swap(sp)) for s, w, sp in starts]
+                labels = {i: _swap(sp) for i, sp in labels.items()}
+
+        # Ownership: each window keeps its turn starts up to the middle of the next overlap
+        own_start = 0 if k == 0 else (start + windows[k - 1][1]) // 2
+        own_end = len(segments) if k == len(windows) - 1 else (windows[k + 1][0] + end) // 2
+        owned = [entry for entry in starts if own_start <= entry[0] < own_end]
+        if labels.get(own_start) and not any(entry[:2] == (own_start, 0) for entry in owned):
+            owned.insert(0, (own_start, 0, labels[own_start]))
+        merged.extend(owned)
+        previous_labels = labels
+
+    merged.sort()
+    return rebuild_turns(segments, merged) if merged else []
+
+
+def plan_segmentation(transcript, max_tokens, window_overlap, stats):
+    """Windows to segment separately if the transcript is over max_tokens, else None"""
+    if not max_tokens or not getattr(transcript, 'segments', None):
+        return None
+    stats["tokens"] = count_tokens(transcript.text)
+    if stats["tokens"] <= max_tokens:
+        return None
+    windows = plan_windows(transcript.segments, max_tokens, window_overlap)
+    if len(windows) <= 1:
+        return None
+    logger.info(f"🪟 Windowed segmentation: {stats['tokens']} tokens in {len(windows)} windows")
+    stats["windows"] = len(windows)
+    return windows
+
+
+def align_conversation(conversation, transcript, stats):
+    """Add timestamps by aligning turn words to the Whisper word stream"""
+    if hasattr(transcript, 'segments') and conversation:
+        started = time.perf_counter()
+        with span("alignment"):
+            align_turns(conversation, transcript)
+        stats["alignment_seconds"] = round(time.perf_counter() - started, 4)
+
+
+def segment_conversation(client, transcript, previous_turns=None, mode="text", max_tokens=None,
+                         window_overlap=4, max_workers=4, stats=None):
+    """
+    Use GPT to split a Whisper transcript into Doctor/Patient turns with timestamps.
+
+    mode "text" asks GPT to echo the transcript as turns; mode "segments"
+    sends numbered Whisper segments and asks only for turn starts.
+    Transcripts above max_tokens are split into overlapping windows of
+    segments that are segmented concurrently. stats, if given, is filled
+    with the mode, token count, number of windows and alignment time.
+    Falls back to a single "Unknown" turn if segmentation fails or returns nothing.
+    """
+    conversation = []
+    stats = stats if stats is not None else {}
+    stats.update({"mode": mode, "windows": 1})
+
+    try:
+        logger.info("🤖 Using GPT to identify speakers...")
+
+        windows = plan_segmentation(transcript, max_tokens, window_overlap, stats)
+        if windows:
+            conversation = segment_windowed(client, transcript, windows, mode, max_workers)
+        elif mode == "segments" and getattr(transcript, 'segments', None):
+            conversation = label_segments(client, transcript, previous_turns)
+        else:
+            # Call GPT for intelligent segmentation
+            conversation = request_text_turns(client, transcript, previous_turns)
+
+        align_conversation(conversation, transcript, stats)
+        logger.info(f"✅ GPT segmentation complete: {len(conversation)} turns")
+
+    except Exception as e:
+        logger.error(f"GPT segmentation failed: {e}")
+        conversation = []
+
+    # If GPT segmentation didn't work and conversation is empty, use fallback
+    if not conversation and hasattr(transcript, 'segments') and transcript.text.strip():
+        conversation = fallback_conversation(transcript)
+
+    return conversation
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Production launcher: waitress or gunicorn with several worker processes
+and threads, the app preloaded (imported and warmed up) once before the
+workers are forked, graceful draining on SIGTERM and a cold-start report.
+
+Usage (from backend/):
+    python serve.py                                   # waitress, 1 worker x 8 threads
+    python serve.py --server gunicorn --workers 4 --threads 8
+    SERVER=waitress WORKERS=2 THREADS=16 python serve.py
+
+Point load balancers / orchestrators at GET /api/ready: it answers 503
+until a worker has warmed up and again once it starts draining.
+
+On SIGTERM each worker stops accepting connections and reports not
+ready, then exits once its in-flight requests and queued jobs are done
+(or after GRACEFUL_TIMEOUT seconds). Multiple waitress workers need
+os.fork (Linux/macOS); on Windows waitress runs a single process.
+
+Transcription jobs (/api/jobs), live streaming sessions (/api/stream)
+and stored traces (/api/traces) live in the memory of the worker that
+created them: with several workers a follow-up request can reach
+another worker and get a 404. Run one worker (with more threads) when
+clients use them, or route each client to the same worker.
+"""
+import os
+import sys
+import time
+
+# Everything below, including importing the app, counts towards the cold start
+LAUNCHED_AT = time.time()
+
+import signal
+import socket
+import logging
+import argparse
+import threading
+import _thread
+import http.client
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("serve")
+
+
+def wait_until_ready(base_url, timeout=60, process=None, interval=0.25):
+    """Poll GET /api/ready until it answers 200; returns seconds waited, or None on timeout / exit"""
+    url = urlsplit(base_url)
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if process is not None and process.poll() is not None:
+            return None
+        connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=2)
+        try:
+            connection.request("GET", "/api/ready")
+            if connection.getresponse().status == 200:
+                return time.monotonic() - started
+        except (OSError, http.client.HTTPException):
+            pass
+        finally:
+            connection.close()
+        time.sleep(interval)
+    return None
+
+
+def load_app():
+    """Import and warm up the app in this process"""
+    os.environ["SERVER_LAUNCHED_AT"] = str(LAUNCHED_AT)
+    os.environ["WARM_UP_IN_BACKGROUND"] = "false"
+    import server
+
+    server.warm_up()
+    return server
+
+
+def warn_per_worker_state(workers):
+    """Log that in-memory jobs, stream sessions and traces aren't shared between workers"""
+    if workers > 1:
+        logger.warning(
+            f"⚠️ {workers} workers: jobs (/api/jobs), streaming sessions (/api/stream) and traces "
+            f"(/api/traces) are kept per worker, so polling them can hit another worker and get 404. "
+            f"Use WORKERS=1 (more THREADS) or sticky routing if clients rely on them."
+        )
+
+
+def report_cold_start(host, port):
+    """Log how long after launch the server first answered /api/ready"""
+    probe_host = "127.0.0.1" if host in ("0.0.0.0", "") else host
+    waited = wait_until_ready(f"http://{probe_host}:{port}", timeout=120)
+    if waited is None:
+        logger.warning("⚠️ Server did not become ready within 120s")
+    else:
+        logger.info(f"✅ Serving on http://{host}:{port} (cold start {time.time() - LAUNCHED_AT:.2f}s)")
+
+
+def run_waitress_worker(app_module, sock, threads, graceful_timeout):
+    """Serve on an already bound socket until SIGTERM/SIGINT, then drain"""
+    from waitress import create_server
+
+    server = create_server(app_module.app, sockets=[sock], threads=threads)
+
+    def drain():
+        server.accepting = False
+        app_module.begin_draining()
+        if not app_module.wait_until_idle(graceful_timeout):
+            logger.warning(f"⚠️ Worker {os.getpid()}: work still running after {graceful_timeout}s, exiting")
+        # Runs on_signal in the main thread, which now ends server.run()
+        _thread.interrupt_main(signal.SIGTERM)
+
+    def on_signal(signum, frame):
+        if app_module.startup["draining"]:
+            # Drained, or a second signal (e.g. Ctrl+C again): server.run() returns on KeyboardInterrupt
+            raise KeyboardInterrupt
+        threading.Thread(target=drain, name="drain", daemon=True).start()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    server.run()
+
+
+def serve_waitress(host, port, workers, threads, preload, graceful_timeout):
+    sock = socket.create_server((host, port), backlog=1024)
+    sock.set_inheritable(True)
+
+    if workers > 1 and not hasattr(os, "fork"):
+        logger.warning("⚠️ Multiple waitress workers need os.fork; running a single worker")
+        workers = 1
+    warn_per_worker_state(workers)
+
+    app_module = load_app() if preload or workers == 1 else None
+
+    if workers == 1:
+        logger.info(f"🚀 waitress: 1 worker x {threads} threads on {host}:{port}")
+        threading.Thread(target=report_cold_start, args=(host, port), daemon=True).start()
+        run_waitress_worker(app_module, sock, threads, graceful_timeout)
+        return
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_waitress_worker(app_module or load_app(), sock, threads, graceful_timeout)
+            except Exception:
+                logger.exception("Worker crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        return pid
+
+    logger.info(f"🚀 waitress: {workers} workers x {threads} threads on {host}:{port} (preload: {preload})")
+    children = {spawn() for _ in range(workers)}
+    stopping = threading.Event()
+    threading.Thread(target=report_cold_start, args=(host, port), daemon=True).start()
+
+    def on_signal(signum, frame):
+        if stopping.is_set():
+            return
+        stopping.set()
+        logger.info(f"🛑 Stopping {len(children)} worker(s) (grace {graceful_timeout}s)")
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    deadline = None
+    while children:
+        if stopping.is_set() and deadline is None:
+            deadline = time.monotonic() + graceful_timeout + 5
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            if deadline is not None and time.monotonic() > deadline:
+                for pid in children:
+                    os.kill(pid, signal.SIGKILL)
+                deadline = float("inf")
+            time.sleep(0.2)
+            continue
+        children.discard(pid)
+        if not stopping.is_set():
+            logger.warning(f"⚠️ Worker {pid} exited (status {status}), restarting")
+            children.add(spawn())
+    logger.info("✅ All workers stopped")
+
+
+def serve_gunicorn(host, port, workers, threads, preload, graceful_timeout):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit("❌ gunicorn is not installed (pip install gunicorn; Linux/macOS only)")
+    warn_per_worker_state(workers)
+
+    def post_worker_init(worker):
+        # Report not ready as soon as the worker is told to stop; gunicorn then finishes in-flight requests
+        handle_exit = signal.getsignal(signal.SIGTERM)
+
+        def on_term(signum, frame):
+            sys.modules["server"].begin_draining()
+            handle_exit(signum, frame)
+
+        signal.signal(signal.SIGTERM, on_term)
+
+    def worker_exit(arbiter, worker):
+        # Let queued transcription jobs finish before the worker process goes away
+        app_module = sys.modules.get("server")
+        if app_module is not None and not app_module.wait_until_idle(graceful_timeout):
+            logger.warning(f"⚠️ Worker {worker.pid}: jobs still running after {graceful_timeout}s")
+
+    def when_ready(arbiter):
+        threading.Thread(target=report_cold_start, args=(host, port), daemon=True).start()
+
+    class Application(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"{host}:{port}",
+                "workers": workers,
+                "threads": threads,
+                "worker_class": "gthread",
+                "preload_app": preload,
+                "graceful_timeout": int(graceful_timeout),
+                # Transcriptions can take minutes; the gthread heartbeat doesn't depend on request length
+                "timeout": 120,
+                "post_worker_init": post_worker_init,
+                "worker_exit": worker_exit,
+                "when_ready": when_ready
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return load_app().app
+
+    logger.info(f"🚀 gunicorn: {workers} workers x {threads} threads on {host}:{port} (preload: {preload})")
+    Application().run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with waitress or gunicorn")
+    parser.add_argument("--server", choices=["waitress", "gunicorn"], default=os.getenv("SERVER", "waitress"))
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 5000)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", 1)))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("THREADS", 8)))
+    parser.add_argument("--no-preload", dest="preload", action="store_false",
+                        default=os.getenv("PRELOAD", "true").lower() == "true",
+                        help="Import the app in each worker instead of once before forking")
+    parser.add_argument("--graceful-timeout", type=float, default=float(os.getenv("GRACEFUL_TIMEOUT", 30)))
+    args = parser.parse_args()
+
+    # Run from backend/ like server.py (relative paths, `import server`)
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(backend_dir)
+    sys.path.insert(0, backend_dir)
+
+    serve = serve_gunicorn if args.server == "gunicorn" else serve_waitress
+    serve(args.host, args.port, max(1, args.workers), max(1, args.threads), args.preload, args.graceful_timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,41 @@
 import os
-import sys
-from flask import Flask, request, jsonify, send_from_directory
+import time
+
+# Cold start is measured from here, or from the launcher's start (SERVER_LAUNCHED_AT, see serve.py)
+MODULE_LOAD_STARTED = time.time()
+
+from flask import Flask, Request, Response, g, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 import openai
-from openai import OpenAI, AuthenticationError, RateLimitError, APIError
+from openai import AuthenticationError, RateLimitError, APIError
 from dotenv import load_dotenv
+from werkzeug.exceptions import RequestEntityTooLarge
+import json
+import shutil
+import tarfile
+import zipfile
 import tempfile
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from translation import TranslationMemory, is_english, join_segment_translations, translate_conversation, translate_segments
+from segmentation import count_tokens, segment_conversation
+from streaming import StreamSessionManager
+from jobs import JobQueue, QueueFullError
+from soap import SOAP_MODEL, SoapStreamParser, build_soap_messages, build_soap_update_messages, format_dialogue, parse_soap_sections
+from transcript_cache import TranscriptCache, audio_cache_key
+from soap_cache import SoapSpeculator, extend_soap_cache_key, soap_cache_key
+from long_audio import transcribe_long_audio
+from audio_prep import normalize_audio, remap_timestamps
+from diarization import Diarizer, assign_speakers
+from openai_client import StagePolicy, StageClients, create_client
+from rate_limit import RateLimiter, RateLimitWaitExceeded
+from metrics import Metrics
+from tracing import RequestProfiler, TraceStore, bind, end_trace, new_trace_id, span, start_trace, upstream_trace_id
+from pipeline import StageGraph
+from static_assets import StaticAssets
+from batch import TAR_CONTENT_TYPES, ZIP_CONTENT_TYPES, TooManyFilesError, iter_batch_files, run_batch, spool
 
 # Load environment variables
 load_dotenv()
@@ -16,16 +44,124 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Uploads up to this size stay in memory; larger ones spill to a temporary file
+UPLOAD_MEMORY_THRESHOLD = int(os.getenv("UPLOAD_MEMORY_THRESHOLD_MB", 32)) * 1024 * 1024
+
+# Bulk transcription (/api/transcribe/batch): request size limit and per-file memory before spilling
+BATCH_PATH = '/api/transcribe/batch'
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_MB", 4096)) * 1024 * 1024
+BATCH_MEMORY_THRESHOLD = int(os.getenv("BATCH_MEMORY_THRESHOLD_MB", 4)) * 1024 * 1024
+
+class UploadRequest(Request):
+    """Request that spools file uploads in memory up to UPLOAD_MEMORY_THRESHOLD"""
+    
+    @property
+    def max_content_length(self):
+        # A batch is many uploads in one request
+        if self.path == BATCH_PATH:
+            return BATCH_MAX_BYTES
+        return super().max_content_length
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        threshold = BATCH_MEMORY_THRESHOLD if self.path == BATCH_PATH else UPLOAD_MEMORY_THRESHOLD
+        return tempfile.SpooledTemporaryFile(max_size=threshold, mode="rb+")
+
 # Initialize Flask app
 app = Flask(__name__, static_folder='../frontend', static_url_path='')
+app.request_class = UploadRequest
+
+# Prometheus-style metrics served at /api/metrics (worker processes share snapshots through METRICS_DIR)
+metrics = Metrics(
+    prefix="meddialog_",
+    directory=os.getenv("METRICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "metrics")),
+    flush_interval=float(os.getenv("METRICS_FLUSH_SECONDS", 5))
+)
+metrics.describe("http_requests_total", "counter", "HTTP requests by endpoint, method and status")
+metrics.describe("http_request_duration_seconds", "histogram", "Time to response (first byte for streams) by endpoint")
+metrics.describe("http_requests_in_flight", "gauge", "Requests currently being handled")
+metrics.describe("stage_duration_seconds", "histogram", "Pipeline stage latency")
+metrics.describe("stages_in_progress", "gauge", "Pipeline stages currently running")
+metrics.describe("errors_total", "counter", "Failed requests by exception class")
+metrics.describe("upload_bytes_total", "counter", "Audio bytes received by endpoint")
+metrics.describe("openai_tokens_total", "counter", "OpenAI token usage by stage, model and kind")
+metrics.describe("soap_cache_total", "counter", "SOAP note requests by source (cache, speculative, generated, incremental)")
+metrics.describe("soap_speculations_total", "counter", "Speculative SOAP generations by outcome")
+
+# Per-request traces: stage and OpenAI call spans, kept in memory and served at /api/traces/<id>
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+TRACE_SERVER_TIMING = os.getenv("TRACE_SERVER_TIMING", "true").lower() == "true"
+TRACE_SKIP_PATHS = ("/api/traces", "/api/metrics", "/api/health", "/api/ready")
+trace_store = TraceStore(capacity=int(os.getenv("TRACE_BUFFER_SIZE", 200)))
+
+# Opt-in profiling of a sampled fraction of traced requests (report attached to the trace)
+profiler = RequestProfiler(
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 0)),
+    mode=os.getenv("PROFILE_MODE", "cprofile").lower()
+)
+
+@contextmanager
+def stage_timer(stage):
+    """Time a pipeline stage into the stage latency histogram and the request trace"""
+    with metrics.time("stage_duration_seconds", in_progress="stages_in_progress", stage=stage), span(stage):
+        yield
+
+def count_error(e):
+    metrics.inc("errors_total", exception=e.__class__.__name__)
+
+def record_token_usage(stage, model, usage):
+    metrics.inc("openai_tokens_total", usage.prompt_tokens or 0, stage=stage, model=model, kind="prompt")
+    metrics.inc("openai_tokens_total", usage.completion_tokens or 0, stage=stage, model=model, kind="completion")
+
+def metrics_endpoint():
+    """Bounded endpoint label: the matched route pattern, not the raw path"""
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+# Requests in flight in this process (waited for when draining)
+active_requests = 0
+active_requests_lock = threading.Lock()
+
+@app.before_request
+def track_request_start():
+    global active_requests
+    g.request_started = time.perf_counter()
+    g.in_flight = True
+    metrics.add_gauge("http_requests_in_flight", 1)
+    with active_requests_lock:
+        active_requests += 1
+    
+    if (TRACE_ENABLED and request.path.startswith('/api/') and request.method != 'OPTIONS'
+            and not request.path.startswith(TRACE_SKIP_PATHS)):
+        g.trace = start_trace(
+            new_trace_id(), f"{request.method} {request.path}",
+            upstream_trace_id(request.headers.get('X-Trace-Id'))
+        )
+        trace_store.add(g.trace)
+        g.profile = profiler.start()
+
+@app.teardown_request
+def track_request_end(error=None):
+    global active_requests
+    if g.pop("in_flight", False):
+        metrics.add_gauge("http_requests_in_flight", -1)
+        with active_requests_lock:
+            active_requests -= 1
+    
+    # Runs after streamed responses finish, so the trace covers the whole stream
+    trace = g.pop("trace", None)
+    if trace is not None:
+        profile = g.pop("profile", None)
+        if profile is not None:
+            trace.profile = profiler.stop(profile)
+        trace.finish(status=500 if error else None)
+        end_trace()
 
 # Configure CORS - VERY IMPORTANT for ngrok
 CORS(app, resources={
     r"/*": {
         "origins": ["*"],  # Allow all origins for testing
         "methods": ["GET", "POST", "OPTIONS", "PUT", "DELETE"],
-        "allow_headers": ["Content-Type", "Authorization", "Accept", "Origin", "X-Requested-With", "ngrok-skip-browser-warning"],
-        "expose_headers": ["Content-Type", "Content-Length"],
+        "allow_headers": ["Content-Type", "Authorization", "Accept", "Origin", "X-Requested-With", "ngrok-skip-browser-warning", "X-Trace-Id"],
+        "expose_headers": ["Content-Type", "Content-Length", "Server-Timing", "X-Trace-Id"],
         "supports_credentials": True,
         "max_age": 3600
     }
@@ -34,14 +170,28 @@ CORS(app, resources={
 # Handle CORS preflight requests
 @app.after_request
 def after_request(response):
+    started = g.get("request_started")
+    if started is not None:
+        endpoint = metrics_endpoint()
+        metrics.inc("http_requests_total", endpoint=endpoint, method=request.method, status=response.status_code)
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - started, endpoint=endpoint)
+    
+    trace = g.get("trace")
+    if trace is not None:
+        trace.status = response.status_code
+        response.headers['X-Trace-Id'] = trace.id
+        if TRACE_SERVER_TIMING:
+            response.headers['Server-Timing'] = trace.server_timing()
+    
     origin = request.headers.get('Origin')
     if origin:
         response.headers['Access-Control-Allow-Origin'] = origin
     else:
         response.headers['Access-Control-Allow-Origin'] = '*'
     
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization,Accept,Origin,X-Requested-With,ngrok-skip-browser-warning'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization,Accept,Origin,X-Requested-With,ngrok-skip-browser-warning,X-Trace-Id'
     response.headers['Access-Control-Allow-Methods'] = 'GET,POST,OPTIONS,PUT,DELETE'
+    response.headers['Access-Control-Expose-Headers'] = 'Content-Type,Content-Length,Server-Timing,X-Trace-Id'
     response.headers['Access-Control-Allow-Credentials'] = 'true'
     response.headers['Access-Control-Max-Age'] = '3600'
     
@@ -56,31 +206,255 @@ def after_request(response):
 # Configure OpenAI
 api_key = os.getenv("OPENAI_API_KEY")
 if not api_key or api_key == "your_actual_openai_api_key_here":
+    # Keep importing: /api/health and /api/ready report the problem, OpenAI endpoints answer 503
     logger.error("❌ OPENAI_API_KEY not set in .env file!")
-    sys.exit(1)
-
-# Initialize OpenAI client
-client = OpenAI(api_key=api_key)
-
-# Initialize diarization pipeline (optional, non-blocking)
-diarization_pipeline = None
-logger.info("Speaker diarization: Disabled (to enable, set HUGGINGFACE_TOKEN in .env)")
-
-# Uncomment below to enable speaker diarization (requires HuggingFace token)
-# try:
-#     hf_token = os.getenv("HUGGINGFACE_TOKEN")
-#     if hf_token:
-#         try:
-#             from pyannote.audio import Pipeline
-#             diarization_pipeline = Pipeline.from_pretrained(
-#                 "pyannote/speaker-diarization-3.1",
-#                 token=hf_token
-#             )
-#             logger.info("✅ Speaker diarization enabled")
-#         except Exception as e:
-#             logger.warning(f"⚠️ Diarization failed: {e}")
-# except Exception as e:
-#     logger.warning(f"⚠️ Could not import diarization: {e}")
+    api_key = None
+
+# Initialize OpenAI client with an explicitly sized keep-alive connection pool
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", 5))
+client = create_client(
+    api_key,
+    max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", 50)),
+    max_keepalive=int(os.getenv("OPENAI_MAX_KEEPALIVE", 20)),
+    keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", 60)),
+    connect_timeout=OPENAI_CONNECT_TIMEOUT
+) if api_key else None
+
+@app.before_request
+def require_openai():
+    if client is None and request.method == 'POST' and request.path.startswith('/api/'):
+        return jsonify({"error": "OpenAI API key not configured on the server"}), 503
+
+# Per-stage timeouts and retries; the short segmentation/translation calls can be hedged
+# (a duplicate request is sent once the first is slower than the stage's p95 latency)
+OPENAI_MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", 3))
+OPENAI_HEDGE_ENABLED = os.getenv("OPENAI_HEDGE_ENABLED", "false").lower() == "true"
+OPENAI_HEDGE_DELAY = float(os.getenv("OPENAI_HEDGE_DELAY", 3))
+
+def stage_policy(name, default_timeout, hedge=False):
+    return StagePolicy(
+        name,
+        read_timeout=float(os.getenv(f"OPENAI_TIMEOUT_{name.upper()}", default_timeout)),
+        connect_timeout=OPENAI_CONNECT_TIMEOUT,
+        max_attempts=OPENAI_MAX_ATTEMPTS,
+        hedge=hedge and OPENAI_HEDGE_ENABLED,
+        hedge_delay=OPENAI_HEDGE_DELAY
+    )
+
+# Shared RPM/TPM budgets per model (SQLite file shared by all threads and worker processes).
+# OPENAI_RATE_LIMITS (JSON) overrides these defaults, e.g. {"gpt-4o-mini": {"rpm": 500, "tpm": 200000}}
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMITS = {
+    "whisper-1": {"rpm": 500},
+    "gpt-4o-mini": {"rpm": 5000, "tpm": 2000000},
+    SOAP_MODEL: {"rpm": 500, "tpm": 200000}
+}
+RATE_LIMITS.update(json.loads(os.getenv("OPENAI_RATE_LIMITS", "{}")))
+rate_limiter = RateLimiter(
+    path=os.getenv("RATE_LIMIT_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "rate_limits.sqlite")),
+    limits=RATE_LIMITS,
+    max_wait=float(os.getenv("RATE_LIMIT_MAX_WAIT", 120))
+) if RATE_LIMIT_ENABLED else None
+
+stage_clients = StageClients(
+    limiter=rate_limiter,
+    count_tokens=count_tokens,
+    on_usage=record_token_usage,
+    get_client=lambda: client,
+    policies={
+        "whisper": stage_policy("whisper", 300),
+        "segmentation": stage_policy("segmentation", 60, hedge=True),
+        "translation": stage_policy("translation", 30, hedge=True),
+        "soap": stage_policy("soap", 120)
+    }
+)
+
+# Translation memory shared by all requests (persisted to disk, LRU-bounded)
+translation_memory = TranslationMemory(
+    path=os.getenv("TRANSLATION_MEMORY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "translation_memory.json")),
+    max_entries=int(os.getenv("TRANSLATION_MEMORY_SIZE", 5000)),
+    save_interval=float(os.getenv("TRANSLATION_MEMORY_SAVE_SECONDS", 30))
+)
+
+# Texts per translation request (sync and async pipelines); a consult's batches are sent concurrently
+TRANSLATION_BATCH_SIZE = int(os.getenv("TRANSLATION_BATCH_SIZE", 40))
+TRANSLATION_WORKERS = int(os.getenv("TRANSLATION_WORKERS", 4))
+
+# Transcript cache for repeated uploads of the same audio
+transcript_cache = TranscriptCache(
+    directory=os.getenv("TRANSCRIPT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "transcripts")),
+    max_bytes=int(os.getenv("TRANSCRIPT_CACHE_MAX_MB", 200)) * 1024 * 1024,
+    ttl_seconds=int(os.getenv("TRANSCRIPT_CACHE_TTL", 7 * 24 * 3600)),
+    enabled=os.getenv("TRANSCRIPT_CACHE_ENABLED", "true").lower() == "true"
+)
+
+# SOAP notes cached by a hash of the formatted dialogue; with SOAP_SPECULATIVE_ENABLED, transcription
+# starts generating them in the background so /api/generate-soap can return without waiting
+soap_cache = TranscriptCache(
+    directory=os.getenv("SOAP_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "soap")),
+    max_bytes=int(os.getenv("SOAP_CACHE_MAX_MB", 20)) * 1024 * 1024,
+    ttl_seconds=int(os.getenv("SOAP_CACHE_TTL", 24 * 3600)),
+    enabled=os.getenv("SOAP_CACHE_ENABLED", "true").lower() == "true"
+)
+SOAP_SPECULATIVE_ENABLED = os.getenv("SOAP_SPECULATIVE_ENABLED", "false").lower() == "true" and soap_cache.enabled
+
+# Incremental SOAP updates: revise the previous note with only the new turns, and regenerate from the
+# whole dialogue once the turns added incrementally exceed SOAP_INCREMENTAL_MAX_DRIFT x those it covered
+SOAP_INCREMENTAL_ENABLED = os.getenv("SOAP_INCREMENTAL_ENABLED", "true").lower() == "true"
+SOAP_INCREMENTAL_MAX_DRIFT = float(os.getenv("SOAP_INCREMENTAL_MAX_DRIFT", 1.0))
+
+# Whisper upload limit and long-audio mode (chunked, parallel transcription)
+WHISPER_MAX_BYTES = 25 * 1024 * 1024
+LONG_AUDIO_ENABLED = os.getenv("LONG_AUDIO_ENABLED", "true").lower() == "true"
+LONG_AUDIO_MAX_BYTES = int(os.getenv("LONG_AUDIO_MAX_MB", 500)) * 1024 * 1024
+LONG_AUDIO_CHUNK_SECONDS = int(os.getenv("LONG_AUDIO_CHUNK_SECONDS", 600))
+LONG_AUDIO_OVERLAP_SECONDS = float(os.getenv("LONG_AUDIO_OVERLAP_SECONDS", 2))
+LONG_AUDIO_WORKERS = int(os.getenv("LONG_AUDIO_WORKERS", 4))
+
+# Downmix to 16 kHz mono and re-encode (opus or mp3) before Whisper when that shrinks the upload
+AUDIO_NORMALIZE_ENABLED = os.getenv("AUDIO_NORMALIZE_ENABLED", "true").lower() == "true"
+AUDIO_NORMALIZE_FORMAT = os.getenv("AUDIO_NORMALIZE_FORMAT", "opus").lower()
+AUDIO_NORMALIZE_BITRATE = os.getenv("AUDIO_NORMALIZE_BITRATE", "24k")
+
+# Optional VAD during normalization: silences longer than VAD_MIN_SILENCE_MS are cut to VAD_KEEP_SILENCE_MS
+VAD_ENABLED = os.getenv("VAD_ENABLED", "false").lower() == "true"
+VAD_OPTIONS = {
+    "min_silence_ms": int(os.getenv("VAD_MIN_SILENCE_MS", 1000)),
+    "keep_silence_ms": int(os.getenv("VAD_KEEP_SILENCE_MS", 300)),
+    "margin_db": float(os.getenv("VAD_MARGIN_DB", 12))
+}
+
+# Enforce the upload limit while the request body is read (plus room for multipart headers)
+app.config['MAX_CONTENT_LENGTH'] = (LONG_AUDIO_MAX_BYTES if LONG_AUDIO_ENABLED else WHISPER_MAX_BYTES) + 1024 * 1024
+
+# Speaker segmentation mode: "text" (GPT echoes turns) or "segments" (GPT labels segment ids)
+SEGMENTATION_MODE = os.getenv("SEGMENTATION_MODE", "text").lower()
+
+# Transcripts above this many tokens are segmented in overlapping windows, concurrently
+SEGMENTATION_MAX_TOKENS = int(os.getenv("SEGMENTATION_MAX_TOKENS", 6000))
+SEGMENTATION_WINDOW_OVERLAP = int(os.getenv("SEGMENTATION_WINDOW_OVERLAP", 4))
+SEGMENTATION_WORKERS = int(os.getenv("SEGMENTATION_WORKERS", 4))
+
+# Translate Whisper segments concurrently with segmentation (non-English audio), then join them onto the turns
+PIPELINE_OVERLAP_ENABLED = os.getenv("PIPELINE_OVERLAP_ENABLED", "true").lower() == "true"
+
+# Request word-level timestamps from Whisper for accurate turn alignment
+WHISPER_WORD_TIMESTAMPS = os.getenv("WHISPER_WORD_TIMESTAMPS", "true").lower() == "true"
+
+# Live streaming transcription sessions (timesliced uploads while recording)
+stream_sessions = StreamSessionManager(
+    get_client=stage_clients.get,
+    translation_memory=translation_memory,
+    window_seconds=float(os.getenv("STREAM_WINDOW_SECONDS", 15)),
+    max_workers=int(os.getenv("STREAM_WORKERS", 4)),
+    max_bytes=LONG_AUDIO_MAX_BYTES,
+    word_timestamps=WHISPER_WORD_TIMESTAMPS,
+    segmentation_mode=SEGMENTATION_MODE
+)
+
+# Asynchronous transcription jobs (bounded worker pool with backpressure)
+job_queue = JobQueue(
+    workers=int(os.getenv("JOB_WORKERS", 2)),
+    max_queue=int(os.getenv("JOB_QUEUE_SIZE", 20)),
+    result_ttl=int(os.getenv("JOB_RESULT_TTL", 3600)),
+    error_handler=lambda e: openai_error(e)
+)
+
+# Bulk transcription: files processed concurrently per batch, and read ahead of the workers
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 4))
+BATCH_MAX_PENDING = int(os.getenv("BATCH_MAX_PENDING", 8))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", 1000))
+
+# Background SOAP generation started by transcriptions (see SOAP_SPECULATIVE_ENABLED)
+soap_speculator = SoapSpeculator(
+    generate=lambda dialogue_text: generate_soap_notes(dialogue_text),
+    store=soap_cache,
+    model=SOAP_MODEL,
+    workers=int(os.getenv("SOAP_SPECULATIVE_WORKERS", 2)),
+    max_pending=int(os.getenv("SOAP_SPECULATIVE_MAX_PENDING", 8)),
+    on_outcome=lambda outcome: metrics.inc("soap_speculations_total", outcome=outcome)
+)
+
+# Speaker diarization (optional): "pyannote" (needs HUGGINGFACE_TOKEN) or "spectral" (NumPy, CPU-only).
+# Runs in a separate process pool started on first use, concurrently with Whisper.
+DIARIZATION_BACKEND = os.getenv("DIARIZATION_BACKEND", "none").lower()
+DIARIZATION_SPEAKERS = int(os.getenv("DIARIZATION_SPEAKERS", 2))
+diarizer = None
+if DIARIZATION_BACKEND == "pyannote":
+    diarizer = Diarizer(
+        "pyannote",
+        {"hf_token": os.getenv("HUGGINGFACE_TOKEN"), "num_speakers": DIARIZATION_SPEAKERS},
+        workers=int(os.getenv("DIARIZATION_WORKERS", 1)),
+        timeout=int(os.getenv("DIARIZATION_TIMEOUT", 300))
+    )
+elif DIARIZATION_BACKEND == "spectral":
+    diarizer = Diarizer(
+        "spectral",
+        {"num_speakers": DIARIZATION_SPEAKERS},
+        workers=int(os.getenv("DIARIZATION_WORKERS", 1)),
+        timeout=int(os.getenv("DIARIZATION_TIMEOUT", 300))
+    )
+logger.info(f"Speaker diarization: {DIARIZATION_BACKEND if diarizer else 'Disabled (set DIARIZATION_BACKEND in .env)'}")
+
+# Startup state for /api/ready. warm_up() loads what the first requests would otherwise wait for;
+# serve.py runs it once before forking workers, otherwise it runs in the background after import.
+startup = {
+    "started_at": float(os.getenv("SERVER_LAUNCHED_AT", 0)) or MODULE_LOAD_STARTED,
+    "imported_at": time.time(),
+    "ready_at": None,
+    "warm_up_seconds": None,
+    "draining": False
+}
+warm_up_lock = threading.Lock()
+
+def warm_up():
+    """Load the tokenizer and open the rate-limit database; safe to call more than once"""
+    with warm_up_lock:
+        if startup["ready_at"] is not None:
+            return
+        started = time.perf_counter()
+        count_tokens("warm up")
+        if rate_limiter is not None:
+            rate_limiter.levels()
+        startup["warm_up_seconds"] = round(time.perf_counter() - started, 3)
+        startup["ready_at"] = time.time()
+        logger.info(
+            f"🚀 Warmed up {startup['ready_at'] - startup['started_at']:.2f}s after start "
+            f"(imports {startup['imported_at'] - startup['started_at']:.2f}s, warm-up {startup['warm_up_seconds']:.2f}s)"
+        )
+
+def begin_draining():
+    """Report not ready so load balancers stop routing here; in-flight work carries on"""
+    if not startup["draining"]:
+        startup["draining"] = True
+        logger.info(f"🛑 Draining: {active_requests} request(s) in flight, jobs idle: {job_queue.idle()}")
+
+def wait_until_idle(timeout):
+    """Wait for in-flight requests and queued jobs to finish; returns False on timeout"""
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            if active_requests == 0 and job_queue.idle():
+                return True
+            time.sleep(0.1)
+        return False
+    finally:
+        # Workers may leave with os._exit, which skips atexit
+        translation_memory.flush()
+
+if os.getenv("WARM_UP_IN_BACKGROUND", "true").lower() == "true":
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+# Frontend files are precompressed and content-hashed in memory and answered before Flask's
+# request hooks run (no metrics, traces or CORS headers); the routes below are the fallback
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend')
+if os.getenv("STATIC_ASSETS_ENABLED", "true").lower() == "true" and os.path.isdir(FRONTEND_DIR):
+    static_assets = StaticAssets(
+        FRONTEND_DIR,
+        extra_headers={'ngrok-skip-browser-warning': '1'},
+        check_interval=float(os.getenv("STATIC_ASSETS_CHECK_SECONDS", 0))
+    )
+    app.wsgi_app = static_assets.wsgi(app.wsgi_app)
 
 # Serve frontend files
 @app.route('/')
@@ -106,9 +480,408 @@ def health_check():
         "status": "healthy",
         "service": "OpenAI Whisper STT API",
         "timestamp": datetime.now().isoformat(),
-        "openai_configured": bool(api_key)
+        "openai_configured": bool(api_key),
+        "ready": startup["ready_at"] is not None and not startup["draining"],
+        "translation_memory": translation_memory.stats(),
+        "transcript_cache": transcript_cache.stats(),
+        "soap_cache": dict(soap_cache.stats(), speculative=soap_speculator.stats() if SOAP_SPECULATIVE_ENABLED else None),
+        "jobs": job_queue.stats(),
+        "diarization": diarizer.stats() if diarizer else None,
+        "openai": stage_clients.stats(),
+        "rate_limits": rate_limiter.levels() if rate_limiter else None
     })
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 200 once warmed up with an API key configured, 503 while starting or draining"""
+    reason = None
+    if startup["draining"]:
+        reason = "draining"
+    elif client is None:
+        reason = "OpenAI API key not configured"
+    elif startup["ready_at"] is None:
+        reason = "warming up"
+    
+    data = {
+        "ready": reason is None,
+        "reason": reason,
+        "pid": os.getpid(),
+        "cold_start_seconds": round(startup["ready_at"] - startup["started_at"], 3) if startup["ready_at"] else None,
+        "import_seconds": round(startup["imported_at"] - startup["started_at"], 3),
+        "warm_up_seconds": startup["warm_up_seconds"],
+        "active_requests": active_requests
+    }
+    return jsonify(data), 200 if reason is None else 503
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_export():
+    """Prometheus text-format metrics (merged across worker processes)"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/traces', methods=['GET'])
+def list_traces():
+    """Most recent request traces, newest first"""
+    return jsonify({"traces": trace_store.recent(request.args.get('limit', 50, type=int))})
+
+@app.route('/api/traces/<trace_id>', methods=['GET'])
+def get_trace(trace_id):
+    """Span waterfall (and profiler report, if sampled) of a recent request"""
+    trace = trace_store.get(trace_id)
+    if trace is None:
+        return jsonify({"error": "Unknown or expired trace"}), 404
+    return jsonify(trace.to_dict())
+
+# Allowed upload extensions
+ALLOWED_EXTENSIONS = ['mp3', 'mp4', 'mpeg', 'mpga', 'm4a', 'wav', 'webm', 'ogg']
+
+def validate_upload():
+    """
+    Validate the uploaded audio file in the current request.
+    
+    Returns (audio_file, upload, None) on success, or (None, None, error_response).
+    """
+    # Check if audio file is present (reading the body enforces MAX_CONTENT_LENGTH)
+    try:
+        with stage_timer("upload"):
+            files = request.files
+    except RequestEntityTooLarge as e:
+        return None, None, request_too_large(e)
+    
+    if 'audio' not in files:
+        logger.error("No audio file in request")
+        return None, None, (jsonify({"error": "No audio file provided"}), 400)
+    
+    audio_file = files['audio']
+    
+    # Validate file
+    if audio_file.filename == '':
+        return None, None, (jsonify({"error": "No selected file"}), 400)
+    
+    # Check file size (OpenAI limit is 25MB, larger files use long-audio mode)
+    audio_file.seek(0, os.SEEK_END)
+    file_size = audio_file.tell()
+    metrics.inc("upload_bytes_total", file_size, endpoint=metrics_endpoint())
+    audio_file.seek(0)
+    
+    upload, error = describe_upload(audio_file.filename, file_size, request.form)
+    if error:
+        return None, None, (jsonify(error), 400)
+    return audio_file, upload, None
+
+def describe_upload(filename, file_size, form):
+    """
+    Check an uploaded file's size and extension against the limits.
+    
+    Returns (upload, None) on success, or (None, error payload).
+    Shared with the ASGI app (asgi.py).
+    """
+    long_audio_requested = (form.get('long_audio') or '').lower() == 'true'
+    long_audio = long_audio_requested or file_size > WHISPER_MAX_BYTES
+    if long_audio and not LONG_AUDIO_ENABLED:
+        return None, {"error": "File too large. Maximum size is 25MB"}
+    if file_size > LONG_AUDIO_MAX_BYTES:
+        return None, {"error": f"File too large. Maximum size is {LONG_AUDIO_MAX_BYTES // (1024 * 1024)}MB"}
+    
+    file_extension = filename.split('.')[-1].lower()
+    
+    if file_extension not in ALLOWED_EXTENSIONS:
+        return None, {
+            "error": f"Unsupported file format: .{file_extension}",
+            "supported_formats": ALLOWED_EXTENSIONS
+        }
+    
+    upload = {
+        "filename": filename,
+        "size": file_size,
+        "format": file_extension,
+        # Get language from request
+        "language": (form.get('language') or '').strip(),
+        "long_audio": long_audio,
+        "long_audio_requested": long_audio_requested
+    }
+    return upload, None
+
+def openai_error(e):
+    """Map an exception from the OpenAI pipeline to (error message, HTTP status)"""
+    count_error(e)
+    if isinstance(e, AuthenticationError):
+        logger.error(f"OpenAI authentication error: {e}")
+        return "Invalid OpenAI API key. Please check your .env file.", 401
+    if isinstance(e, RateLimitError):
+        logger.error(f"OpenAI rate limit: {e}")
+        return "OpenAI API rate limit exceeded. Please try again later.", 429
+    if isinstance(e, RateLimitWaitExceeded):
+        logger.error(f"Rate limit queue: {e}")
+        return f"Server is at its OpenAI capacity. Please retry in {e.retry_after} seconds.", 429
+    if isinstance(e, APIError):
+        logger.error(f"OpenAI API error: {e}")
+        return f"OpenAI API error: {str(e)}", 500
+    logger.error(f"OpenAI processing error: {e}")
+    return f"Transcription failed: {str(e)}", 500
+
+def cached_transcription(cache_key, upload):
+    """Return the cached response for an upload, or None"""
+    cached = transcript_cache.get(cache_key)
+    if cached is not None:
+        logger.info("⚡ Transcript cache hit")
+        cached["file_info"] = {
+            "filename": upload["filename"],
+            "size": upload["size"],
+            "format": upload["format"]
+        }
+        cached["cached"] = True
+    return cached
+
+def detach_upload(audio_file):
+    """Copy an upload into a spooled buffer that outlives the request (for queued jobs)"""
+    buffer = tempfile.SpooledTemporaryFile(max_size=UPLOAD_MEMORY_THRESHOLD, mode="rb+")
+    audio_file.stream.seek(0)
+    shutil.copyfileobj(audio_file.stream, buffer)
+    buffer.seek(0)
+    return buffer
+
+def run_transcription(audio_stream, upload, cache_key=None, progress=None):
+    """
+    Run the transcription pipeline on an uploaded audio stream and return
+    the response payload.
+    
+    The stages run as a graph: once Whisper returns, GPT segmentation and
+    (for non-English audio, with PIPELINE_OVERLAP_ENABLED) translation of
+    the Whisper segments run concurrently; the segment translations are
+    then joined onto the aligned speaker turns. Per-stage start offsets
+    and durations are returned under "timings".
+    
+    progress, if given, is called with the name of each stage as it starts.
+    OpenAI errors propagate to the caller.
+    """
+    progress = progress or (lambda stage: None)
+    language = upload["language"]
+    
+    # Diarize the original recording in the worker pool while Whisper runs
+    diarization_future = None
+    if diarizer is not None:
+        audio_stream.seek(0)
+        diarization_future = diarizer.submit(audio_stream.read(), upload["format"])
+    
+    def transcribe(inputs):
+        progress("transcribing")
+        stream = audio_stream
+        stream.seek(0)
+        long_audio = upload["long_audio"]
+        filename = upload["filename"]
+        preprocessing = None
+        offset_map = None
+        # Oversized uploads (e.g. 44.1 kHz stereo WAV) often fit a single Whisper call once normalized;
+        # explicitly chunked uploads are only normalized for silence trimming
+        if AUDIO_NORMALIZE_ENABLED and (VAD_ENABLED or not upload.get("long_audio_requested")):
+            with stage_timer("normalize"):
+                stream, filename, preprocessing, offset_map = normalize_audio(
+                    stream,
+                    filename,
+                    upload["format"],
+                    target=AUDIO_NORMALIZE_FORMAT,
+                    bitrate=AUDIO_NORMALIZE_BITRATE,
+                    vad=VAD_OPTIONS if VAD_ENABLED else None
+                )
+            if long_audio and not upload.get("long_audio_requested") and preprocessing["upload_bytes"] <= WHISPER_MAX_BYTES:
+                logger.info("📦 Normalized audio fits a single Whisper request")
+                long_audio = False
+        
+        with stage_timer("whisper"):
+            if long_audio:
+                # Split at silences and transcribe chunks in parallel
+                transcript = transcribe_long_audio(
+                    stage_clients.get("whisper"),
+                    stream,
+                    file_format=filename.split('.')[-1].lower(),
+                    language=language,
+                    chunk_seconds=LONG_AUDIO_CHUNK_SECONDS,
+                    overlap_seconds=LONG_AUDIO_OVERLAP_SECONDS,
+                    max_workers=LONG_AUDIO_WORKERS,
+                    word_timestamps=WHISPER_WORD_TIMESTAMPS
+                )
+            else:
+                # Transcribe with OpenAI Whisper, sending the in-memory upload as a named file
+                logger.info("🎤 Sending to OpenAI Whisper...")
+                transcript = stage_clients.get("whisper").audio.transcriptions.create(**whisper_params(filename, stream, language))
+        
+        logger.info(f"✅ Transcription successful: {len(transcript.text)} characters")
+        
+        if offset_map is not None:
+            # Whisper saw the trimmed audio; report timestamps in original recording time
+            remap_timestamps(transcript, offset_map, preprocessing["vad"]["original_seconds"])
+        return transcript, preprocessing
+    
+    segmentation_stats = {}
+    
+    def segment(inputs):
+        # Use GPT to intelligently segment the conversation
+        progress("segmenting")
+        transcript, _ = inputs["whisper"]
+        with stage_timer("segmentation"):
+            conversation = segment_conversation(
+                stage_clients.get("segmentation"),
+                transcript,
+                mode=SEGMENTATION_MODE,
+                max_tokens=SEGMENTATION_MAX_TOKENS,
+                window_overlap=SEGMENTATION_WINDOW_OVERLAP,
+                max_workers=SEGMENTATION_WORKERS,
+                stats=segmentation_stats
+            )
+        if "alignment_seconds" in segmentation_stats:
+            metrics.observe("stage_duration_seconds", segmentation_stats["alignment_seconds"], stage="alignment")
+        return conversation
+    
+    def translate_whisper_segments(inputs):
+        # Speaker labels aren't needed to translate: start on the Whisper segments right away
+        transcript, _ = inputs["whisper"]
+        detected_language = getattr(transcript, 'language', 'en')
+        segments = getattr(transcript, 'segments', None)
+        if not PIPELINE_OVERLAP_ENABLED or is_english(detected_language) or not segments:
+            return None
+        progress("translating")
+        with stage_timer("segment_translation"):
+            return translate_segments(stage_clients.get("translation"), segments, detected_language, translation_memory,
+                                      batch_size=TRANSLATION_BATCH_SIZE, max_workers=TRANSLATION_WORKERS)
+    
+    translation_stats = {}
+    
+    def translate(inputs):
+        # Translate conversation to English if not already in English
+        transcript, _ = inputs["whisper"]
+        conversation = inputs["segmentation"]
+        segment_translations = inputs["segment_translation"]
+        detected_language = getattr(transcript, 'language', 'en')
+        if segment_translations is None:
+            translation_stats["mode"] = "turns"
+            progress("translating")
+            with stage_timer("translation"):
+                return translate_conversation(stage_clients.get("translation"), conversation, detected_language, translation_memory,
+                                              batch_size=TRANSLATION_BATCH_SIZE, max_workers=TRANSLATION_WORKERS)
+        
+        # Turns whose words span whole segments take the joined segment translations; the rest are translated
+        with stage_timer("translation"):
+            leftover = join_segment_translations(conversation, transcript.segments, segment_translations)
+            if leftover:
+                translate_conversation(stage_clients.get("translation"), leftover, detected_language, translation_memory,
+                                       batch_size=TRANSLATION_BATCH_SIZE, max_workers=TRANSLATION_WORKERS)
+        translation_stats.update({
+            "mode": "segments",
+            "segments": len(segment_translations),
+            "joined_turns": len(conversation) - len(leftover),
+            "retranslated_turns": len(leftover)
+        })
+        return conversation.copy()
+    
+    def diarize(inputs):
+        if diarization_future is None:
+            return None
+        progress("diarizing")
+        with stage_timer("diarization"):
+            return diarizer.result(diarization_future)
+    
+    graph = StageGraph(max_workers=4)
+    graph.add("whisper", transcribe)
+    graph.add("segmentation", segment, after=["whisper"])
+    graph.add("segment_translation", translate_whisper_segments, after=["whisper"])
+    graph.add("translation", translate, after=["whisper", "segmentation", "segment_translation"])
+    graph.add("diarization", diarize)
+    results = graph.run()
+    
+    transcript, preprocessing = results["whisper"]
+    response_data = transcription_response(
+        upload, transcript, preprocessing, results["segmentation"], results["translation"],
+        results["diarization"], segmentation_stats, translation_stats, graph.timings
+    )
+    
+    if cache_key:
+        transcript_cache.put(cache_key, response_data)
+    
+    return response_data
+
+def whisper_params(filename, stream, language):
+    """Keyword arguments of a Whisper transcription request"""
+    params = {
+        "model": "whisper-1",
+        "file": (filename, stream),
+        "response_format": "verbose_json"
+    }
+    
+    if language:
+        params["language"] = language
+    
+    if WHISPER_WORD_TIMESTAMPS:
+        params["timestamp_granularities"] = ["segment", "word"]
+    return params
+
+def transcription_response(upload, transcript, preprocessing, conversation, translated_conversation,
+                           speaker_turns, segmentation_stats, translation_stats, timings):
+    """Assemble the /api/transcribe payload from the pipeline's stage results"""
+    detected_language = getattr(transcript, 'language', 'en')
+    
+    # The conversation is final here (diarization only adds speaker_id): start on its SOAP notes
+    soap_key = soap_speculator.speculate(format_dialogue(conversation)) if SOAP_SPECULATIVE_ENABLED else None
+    
+    if speaker_turns:
+        assign_speakers(conversation, speaker_turns)
+    
+    response_data = {
+        "success": True,
+        "text": transcript.text,
+        "language": detected_language,
+        "duration": getattr(transcript, 'duration', 0),
+        "conversation": conversation,
+        "conversation_english": translated_conversation,
+        "diarization_available": bool(speaker_turns),
+        "chunks": getattr(transcript, 'chunks', 1),
+        "segmentation": segmentation_stats,
+        "translation": translation_stats,
+        "preprocessing": preprocessing,
+        "timings": timings,
+        "soap_key": soap_key,
+        "file_info": {
+            "filename": upload["filename"],
+            "size": upload["size"],
+            "format": upload["format"]
+        }
+    }
+    
+    # Add segments if available (legacy support)
+    if hasattr(transcript, 'segments'):
+        response_data["segments"] = [
+            {
+                "id": segment.id,
+                "start": segment.start,
+                "end": segment.end,
+                "text": segment.text
+            } for segment in transcript.segments
+        ]
+        if speaker_turns:
+            assign_speakers(response_data["segments"], speaker_turns, key="speaker")
+    
+    return response_data
+
+def translation_response(translation, preprocessing=None, offset_map=None):
+    """Assemble the /api/translate payload, in original recording time if silence was trimmed"""
+    if offset_map is not None:
+        remap_timestamps(translation, offset_map, preprocessing["vad"]["original_seconds"])
+    
+    return {
+        "success": True,
+        "text": translation.text,
+        "language": "en",
+        "duration": getattr(translation, 'duration', 0),
+        "preprocessing": preprocessing,
+        "segments": [
+            {
+                "id": segment.id,
+                "start": segment.start,
+                "end": segment.end,
+                "text": segment.text
+            } for segment in getattr(translation, 'segments', None) or []
+        ]
+    }
+
 @app.route('/api/transcribe', methods=['POST', 'OPTIONS'])
 def transcribe_audio():
     """Transcribe audio to text"""
@@ -118,242 +891,240 @@ def transcribe_audio():
     try:
         logger.info("📥 Received transcription request")
         
-        # Check if audio file is present
-        if 'audio' not in request.files:
-            logger.error("No audio file in request")
-            return jsonify({"error": "No audio file provided"}), 400
-        
-        audio_file = request.files['audio']
-        
-        # Validate file
-        if audio_file.filename == '':
-            return jsonify({"error": "No selected file"}), 400
-        
-        # Check file size (OpenAI limit is 25MB)
-        audio_file.seek(0, os.SEEK_END)
-        file_size = audio_file.tell()
-        audio_file.seek(0)
+        audio_file, upload, error_response = validate_upload()
+        if error_response:
+            return error_response
         
-        if file_size > 25 * 1024 * 1024:  # 25MB
-            return jsonify({"error": "File too large. Maximum size is 25MB"}), 400
+        logger.info(f"📄 Processing file: {upload['filename']}, Size: {upload['size']} bytes")
         
-        # Allowed extensions
-        allowed_extensions = ['mp3', 'mp4', 'mpeg', 'mpga', 'm4a', 'wav', 'webm', 'ogg']
-        file_extension = audio_file.filename.split('.')[-1].lower()
-        
-        if file_extension not in allowed_extensions:
-            return jsonify({
-                "error": f"Unsupported file format: .{file_extension}",
-                "supported_formats": allowed_extensions
-            }), 400
-        
-        logger.info(f"📄 Processing file: {audio_file.filename}, Size: {file_size} bytes")
-        
-        # Save file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file_extension}') as tmp_file:
-            audio_file.save(tmp_file.name)
-            tmp_path = tmp_file.name
+        # Serve repeated uploads of the same audio from the transcript cache
+        with span("cache_lookup") as attrs:
+            cache_key = audio_cache_key(audio_file.stream, 'transcribe', upload["language"])
+            cached = cached_transcription(cache_key, upload)
+            attrs["hit"] = cached is not None
+        if cached is not None:
+            if SOAP_SPECULATIVE_ENABLED and cached.get("conversation"):
+                cached["soap_key"] = soap_speculator.speculate(format_dialogue(cached["conversation"]))
+            return jsonify(cached)
         
         try:
-            # Transcribe with OpenAI Whisper
-            with open(tmp_path, 'rb') as audio:
-                logger.info("🎤 Sending to OpenAI Whisper...")
-                
-                # Get language from request
-                language = request.form.get('language', '').strip()
-                whisper_params = {
-                    "model": "whisper-1",
-                    "file": audio,
-                    "response_format": "verbose_json"
-                }
-                
-                if language:
-                    whisper_params["language"] = language
-                
-                transcript = client.audio.transcriptions.create(**whisper_params)
-            
-            logger.info(f"✅ Transcription successful: {len(transcript.text)} characters")
-            
-            # Use GPT to intelligently segment the conversation
-            conversation = []
-            
-            try:
-                logger.info("🤖 Using GPT to identify speakers...")
-                
-                # Create a prompt for GPT to segment the conversation
-                segmentation_prompt = f"""You are analyzing a doctor-patient conversation. Read the following transcribed text and identify which parts are spoken by the Doctor and which parts are spoken by the Patient.
-
-Transcribed conversation:
-\"\"\"{transcript.text}\"\"\"
-
-Please segment this conversation into turns between Doctor and Patient. Format your response as a JSON array where each object has:
-- "speaker": either "Doctor" or "Patient"
-- "text": the exact words they said
-
-Rules:
-1. The doctor typically asks questions, gives medical advice, and discusses treatment
-2. The patient typically describes symptoms, answers questions, and responds to advice
-3. Maintain the exact order and words from the original text
-4. Do not add, remove, or modify any words
-5. Return ONLY the JSON array, no other text
-
-Example format:
-[
-  {{"speaker": "Doctor", "text": "How are you feeling today?"}},
-  {{"speaker": "Patient", "text": "I've been having knee pain."}}
-]"""
-
-                # Call GPT for intelligent segmentation
-                gpt_response = client.chat.completions.create(
-                    model="gpt-4o-mini",  # Fast and cost-effective
-                    messages=[
-                        {"role": "system", "content": "You are an expert at analyzing medical conversations and identifying speakers. Always respond with valid JSON only."},
-                        {"role": "user", "content": segmentation_prompt}
-                    ],
-                    temperature=0.3,
-                    response_format={"type": "json_object"}
-                )
-                
-                # Parse the GPT response
-                import json
-                gpt_content = gpt_response.choices[0].message.content
-                
-                # Handle if GPT wraps the array in an object
-                try:
-                    parsed = json.loads(gpt_content)
-                    if isinstance(parsed, dict) and 'conversation' in parsed:
-                        conversation = parsed['conversation']
-                    elif isinstance(parsed, dict) and 'turns' in parsed:
-                        conversation = parsed['turns']
-                    elif isinstance(parsed, list):
-                        conversation = parsed
-                    else:
-                        # Try to extract array from object
-                        for key in parsed:
-                            if isinstance(parsed[key], list):
-                                conversation = parsed[key]
-                                break
-                except:
-                    conversation = []
-                
-                # Add timestamps by matching text to segments
-                if hasattr(transcript, 'segments') and conversation:
-                    for turn in conversation:
-                        turn_text = turn['text'].lower().strip()
-                        # Find matching segment(s) for this turn
-                        start_time = 0
-                        end_time = 0
-                        
-                        for segment in transcript.segments:
-                            segment_text = segment.text.lower().strip()
-                            if segment_text in turn_text or turn_text in segment_text:
-                                if start_time == 0:
-                                    start_time = segment.start
-                                end_time = segment.end
-                        
-                        turn['start'] = start_time
-                        turn['end'] = end_time
-                
-                logger.info(f"✅ GPT segmentation complete: {len(conversation)} turns")
+            return jsonify(run_transcription(audio_file.stream, upload, cache_key))
+        except Exception as e:
+            error, status = openai_error(e)
+            return jsonify({"error": error}), status
                 
-            except Exception as e:
-                logger.error(f"GPT segmentation failed: {e}")
-                # Fallback: create simple conversation without speaker detection
-                if hasattr(transcript, 'segments'):
-                    conversation = [{
-                        "speaker": "Unknown",
-                        "text": transcript.text,
-                        "start": 0,
-                        "end": getattr(transcript, 'duration', 0)
-                    }]
-            
-            # If GPT segmentation didn't work and conversation is empty, use fallback
-            if not conversation and hasattr(transcript, 'segments'):
-                conversation = [{
-                    "speaker": "Unknown", 
-                    "text": transcript.text,
-                    "start": 0,
-                    "end": getattr(transcript, 'duration', 0)
-                }]
-            
-            # Translate conversation to English if not already in English
-            detected_language = getattr(transcript, 'language', 'en')
-            translated_conversation = conversation.copy()
-            
-            if detected_language and detected_language != 'en':
-                logger.info(f"🌐 Translating from {detected_language} to English...")
+    except Exception as e:
+        count_error(e)
+        logger.error(f"Server error: {e}", exc_info=True)
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+def transcribe_batch_file(batch_file, options):
+    """Transcribe one file of a batch; returns (payload, HTTP status) instead of raising"""
+    if batch_file.error:
+        return {"error": batch_file.error}, 400
+    
+    stream = batch_file.stream
+    stream.seek(0, os.SEEK_END)
+    file_size = stream.tell()
+    stream.seek(0)
+    metrics.inc("upload_bytes_total", file_size, endpoint=BATCH_PATH)
+    
+    upload, error = describe_upload(batch_file.filename, file_size, options)
+    if error:
+        return error, 400
+    
+    try:
+        cache_key = audio_cache_key(stream, 'transcribe', upload["language"])
+        cached = cached_transcription(cache_key, upload)
+        if cached is not None:
+            return cached, 200
+        return run_transcription(stream, upload, cache_key), 200
+    except Exception as e:
+        error, status = openai_error(e)
+        return {"error": error}, status
+
+@app.route(BATCH_PATH, methods=['POST', 'OPTIONS'])
+def transcribe_batch():
+    """
+    Transcribe many recordings in one request: multipart 'audio' fields
+    (each a file or a zip/tar archive), or a zip/tar archive as the raw
+    request body with options in the query string. Streams one NDJSON
+    line per file as it finishes, then a summary line.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    
+    logger.info("📦 Received batch transcription request")
+    
+    if request.mimetype in TAR_CONTENT_TYPES + ZIP_CONTENT_TYPES:
+        # Raw archive: tar is read straight from the request stream, zip needs a seekable copy
+        options = request.args.to_dict()
+        extension = '.zip' if request.mimetype in ZIP_CONTENT_TYPES else '.tar'
+        try:
+            body = request.stream
+            if extension == '.zip':
+                body = spool(body, BATCH_MEMORY_THRESHOLD, BATCH_MAX_BYTES)
+        except RequestEntityTooLarge:
+            body = None
+        if body is None:
+            return jsonify({"error": f"Batch too large. Maximum size is {BATCH_MAX_BYTES // (1024 * 1024)}MB"}), 413
+        uploads = [(options.get('filename') or f"batch{extension}", body)]
+    else:
+        try:
+            with stage_timer("upload"):
+                files = request.files.getlist('audio')
+                options = request.form.to_dict()
+        except RequestEntityTooLarge:
+            return jsonify({"error": f"Batch too large. Maximum size is {BATCH_MAX_BYTES // (1024 * 1024)}MB"}), 413
+        uploads = [(audio_file.filename, audio_file.stream) for audio_file in files if audio_file.filename]
+        if not uploads:
+            return jsonify({"error": "No audio files provided"}), 400
+    
+    batch_files = iter_batch_files(
+        uploads,
+        spool_size=BATCH_MEMORY_THRESHOLD,
+        max_file_bytes=LONG_AUDIO_MAX_BYTES if LONG_AUDIO_ENABLED else WHISPER_MAX_BYTES,
+        max_files=BATCH_MAX_FILES
+    )
+    
+    def generate():
+        started = time.perf_counter()
+        counts = {"files": 0, "succeeded": 0, "failed": 0}
+        line = None
+        try:
+            # The per-file stage spans are recorded into this request's trace
+            for batch_file, future in run_batch(batch_files, bind(lambda f: transcribe_batch_file(f, options)),
+                                                max_workers=BATCH_WORKERS, max_pending=BATCH_MAX_PENDING):
                 try:
-                    for turn in translated_conversation:
-                        translation_response = client.chat.completions.create(
-                            model="gpt-4o-mini",
-                            messages=[
-                                {"role": "system", "content": "You are a professional medical translator. Translate the following text to English accurately. Return ONLY the translated text, nothing else."},
-                                {"role": "user", "content": turn['text']}
-                            ],
-                            temperature=0.3
-                        )
-                        turn['text_english'] = translation_response.choices[0].message.content.strip()
-                    logger.info("✅ Translation complete")
+                    payload, status = future.result()
                 except Exception as e:
-                    logger.error(f"Translation error: {e}")
-                    # Keep original text if translation fails
-                    for turn in translated_conversation:
-                        turn['text_english'] = turn['text']
+                    count_error(e)
+                    logger.error(f"Batch file error: {e}", exc_info=True)
+                    payload, status = {"error": f"Server error: {str(e)}"}, 500
+                counts["files"] += 1
+                counts["succeeded" if status == 200 else "failed"] += 1
+                line = {"index": batch_file.index, "filename": batch_file.filename, "status": status}
+                if status == 200:
+                    line["result"] = payload
+                else:
+                    line.update(payload)
+                yield json.dumps(line) + "\n"
+        except (TooManyFilesError, tarfile.TarError, zipfile.BadZipFile, RequestEntityTooLarge, EOFError, OSError) as e:
+            # The batch itself can't be read further (e.g. a truncated gzip or tar); results so far stand
+            logger.error(f"Batch read error: {e}")
+            if isinstance(e, RequestEntityTooLarge):
+                counts["error"] = f"Batch too large. Maximum size is {BATCH_MAX_BYTES // (1024 * 1024)}MB"
+            elif isinstance(e, EOFError):
+                counts["error"] = f"Batch archive is truncated: {e}"
             else:
-                # Already in English
-                for turn in translated_conversation:
-                    turn['text_english'] = turn['text']
-            
-            response_data = {
-                "success": True,
-                "text": transcript.text,
-                "language": detected_language,
-                "duration": getattr(transcript, 'duration', 0),
-                "conversation": conversation,
-                "conversation_english": translated_conversation,
-                "diarization_available": diarization_pipeline is not None,
-                "file_info": {
-                    "filename": audio_file.filename,
-                    "size": file_size,
-                    "format": file_extension
-                }
-            }
-            
-            # Add segments if available (legacy support)
-            if hasattr(transcript, 'segments'):
-                response_data["segments"] = [
-                    {
-                        "id": segment.id,
-                        "start": segment.start,
-                        "end": segment.end,
-                        "text": segment.text
-                    } for segment in transcript.segments
-                ]
-            
-            return jsonify(response_data)
-            
-        except AuthenticationError as e:
-            logger.error(f"OpenAI authentication error: {e}")
-            return jsonify({"error": "Invalid OpenAI API key. Please check your .env file."}), 401
-        except RateLimitError as e:
-            logger.error(f"OpenAI rate limit: {e}")
-            return jsonify({"error": "OpenAI API rate limit exceeded. Please try again later."}), 429
-        except APIError as e:
-            logger.error(f"OpenAI API error: {e}")
-            return jsonify({"error": f"OpenAI API error: {str(e)}"}), 500
+                counts["error"] = str(e)
         except Exception as e:
-            logger.error(f"OpenAI processing error: {e}")
-            return jsonify({"error": f"Transcription failed: {str(e)}"}), 500
-            
+            # The summary line is still sent, so clients always see how the batch ended
+            count_error(e)
+            logger.error(f"Batch error: {e}", exc_info=True)
+            counts["error"] = f"Server error: {str(e)}"
         finally:
-            # Clean up temp file
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
-                
+            for _, readable in uploads:
+                readable.close()
+        counts["seconds"] = round(time.perf_counter() - started, 3)
+        logger.info(f"✅ Batch complete: {counts['succeeded']}/{counts['files']} files succeeded")
+        yield json.dumps(dict(counts, done=True)) + "\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/jobs/transcribe', methods=['POST', 'OPTIONS'])
+def submit_transcription_job():
+    """Queue a transcription job and return its id immediately"""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    
+    try:
+        logger.info("📥 Received transcription job")
+        
+        audio_file, upload, error_response = validate_upload()
+        if error_response:
+            return error_response
+        
+        cache_key = audio_cache_key(audio_file.stream, 'transcribe', upload["language"])
+        cached = cached_transcription(cache_key, upload)
+        if cached is not None:
+            job = job_queue.completed("transcribe", cached)
+            return jsonify(job.to_dict()), 200
+        
+        audio_stream = detach_upload(audio_file)
+        
+        try:
+            # The job's stage spans are recorded into this request's trace
+            job = job_queue.submit(
+                "transcribe",
+                bind(run_transcription),
+                args=(audio_stream, upload, cache_key),
+                cleanup=audio_stream.close
+            )
+        except QueueFullError as e:
+            audio_stream.close()
+            logger.warning(f"⚠️ Job queue full, retry after {e.retry_after}s")
+            response = jsonify({
+                "error": "Server is busy. Please retry later.",
+                "retry_after": e.retry_after
+            })
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 429
+        
+        response = jsonify({
+            "success": True,
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/api/jobs/{job.id}",
+            "events_url": f"/api/jobs/{job.id}/events"
+        })
+        response.headers['Location'] = f"/api/jobs/{job.id}"
+        return response, 202
+        
     except Exception as e:
+        count_error(e)
         logger.error(f"Server error: {e}", exc_info=True)
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a job's status, stage history and (when complete) its result"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Subscribe to a job's progress as Server-Sent Events"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    
+    def generate():
+        version = -1
+        while True:
+            new_version = job.wait_for_change(version, timeout=15)
+            if new_version == version:
+                # Keep the connection (and the ngrok tunnel) alive
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            data = job.to_dict()
+            yield f"event: {data['status']}\ndata: {json.dumps(data)}\n\n"
+            if data["status"] in ("completed", "failed"):
+                break
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/translate', methods=['POST', 'OPTIONS'])
 def translate_audio():
     """Translate audio to English"""
@@ -363,145 +1134,434 @@ def translate_audio():
     try:
         logger.info("🌍 Received translation request")
         
-        if 'audio' not in request.files:
+        try:
+            with stage_timer("upload"):
+                files = request.files
+        except RequestEntityTooLarge as e:
+            return request_too_large(e)
+        
+        if 'audio' not in files:
             return jsonify({"error": "No audio file provided"}), 400
         
-        audio_file = request.files['audio']
+        audio_file = files['audio']
+        audio_file.stream.seek(0, os.SEEK_END)
+        metrics.inc("upload_bytes_total", audio_file.stream.tell(), endpoint=metrics_endpoint())
+        audio_file.stream.seek(0)
         
-        # Save file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
-            audio_file.save(tmp_file.name)
-            tmp_path = tmp_file.name
+        # Serve repeated uploads of the same audio from the transcript cache
+        cache_key = audio_cache_key(audio_file.stream, 'translate')
+        cached = transcript_cache.get(cache_key)
+        if cached is not None:
+            logger.info("⚡ Transcript cache hit")
+            cached["cached"] = True
+            return jsonify(cached)
         
         try:
-            # Translate with OpenAI Whisper
-            with open(tmp_path, 'rb') as audio:
-                logger.info("🌐 Translating with OpenAI Whisper...")
-                
-                translation = client.audio.translations.create(
+            # Translate with OpenAI Whisper, sending the in-memory upload as a named file
+            logger.info("🌐 Translating with OpenAI Whisper...")
+            
+            filename = audio_file.filename or 'audio.mp3'
+            audio_stream = audio_file.stream
+            preprocessing, offset_map = None, None
+            if AUDIO_NORMALIZE_ENABLED:
+                with stage_timer("normalize"):
+                    audio_stream, filename, preprocessing, offset_map = normalize_audio(
+                        audio_stream,
+                        filename,
+                        filename.split('.')[-1].lower(),
+                        target=AUDIO_NORMALIZE_FORMAT,
+                        bitrate=AUDIO_NORMALIZE_BITRATE,
+                        vad=VAD_OPTIONS if VAD_ENABLED else None
+                    )
+            
+            with stage_timer("whisper"):
+                translation = stage_clients.get("whisper").audio.translations.create(
                     model="whisper-1",
-                    file=audio,
+                    file=(filename, audio_stream),
                     response_format="verbose_json"
                 )
             
             logger.info(f"✅ Translation successful: {len(translation.text)} characters")
             
-            return jsonify({
-                "success": True,
-                "text": translation.text,
-                "language": "en",
-                "duration": getattr(translation, 'duration', 0),
-                "segments": []
-            })
+            response_data = translation_response(translation, preprocessing, offset_map)
+            transcript_cache.put(cache_key, response_data)
+            
+            return jsonify(response_data)
             
         except Exception as e:
+            count_error(e)
             logger.error(f"Translation error: {e}")
             return jsonify({"error": f"Translation failed: {str(e)}"}), 500
-        finally:
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
                 
     except Exception as e:
+        count_error(e)
         logger.error(f"Translation server error: {e}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@app.route('/api/stream/start', methods=['POST', 'OPTIONS'])
+def stream_start():
+    """Start a live streaming transcription session"""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    
+    data = request.get_json(silent=True) or request.form
+    language = (data.get('language') or '').strip()
+    file_extension = (data.get('format') or 'webm').strip().lower()
+    
+    if file_extension not in ['webm', 'ogg', 'mp4', 'wav']:
+        return jsonify({"error": f"Unsupported stream format: {file_extension}"}), 400
+    
+    session = stream_sessions.start(language, file_extension)
+    return jsonify({
+        "success": True,
+        "session_id": session.id,
+        "window_seconds": stream_sessions.window_ms / 1000.0
+    })
+
+@app.route('/api/stream/<session_id>/chunk', methods=['POST', 'OPTIONS'])
+def stream_chunk(session_id):
+    """Append a recorded timeslice; returns the conversation turns transcribed so far"""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    
+    session = stream_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired streaming session"}), 404
+    
+    # Accept multipart ('audio' field) or a raw request body
+    if 'audio' in request.files:
+        data = request.files['audio'].read()
+    else:
+        data = request.get_data()
+    metrics.inc("upload_bytes_total", len(data), endpoint=metrics_endpoint())
+    
+    try:
+        if not stream_sessions.append(session, data):
+            return jsonify({"error": "Recording too large for a streaming session"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    
+    return jsonify(session.status())
+
+@app.route('/api/stream/<session_id>', methods=['GET'])
+def stream_status(session_id):
+    """Poll the partial conversation of a streaming session"""
+    session = stream_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired streaming session"}), 404
+    return jsonify(session.status())
+
+@app.route('/api/stream/<session_id>/stop', methods=['POST', 'OPTIONS'])
+def stream_stop(session_id):
+    """Finish a streaming session: transcribe the remaining tail and return the full result"""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    
+    session = stream_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired streaming session"}), 404
+    
+    try:
+        logger.info(f"⏹️ Finishing streaming session {session_id}")
+        response_data = stream_sessions.finish(session)
+        if SOAP_SPECULATIVE_ENABLED and response_data.get("conversation"):
+            response_data["soap_key"] = soap_speculator.speculate(format_dialogue(response_data["conversation"]))
+        logger.info(f"✅ Streaming session complete: {response_data['streaming']['windows']} windows")
+        return jsonify(response_data)
+    except Exception as e:
+        error, status = openai_error(e)
+        return jsonify({"error": error}), status
+
+def generate_soap_notes(dialogue_text, messages=None):
+    """Run the fine-tuned SOAP model on a dialogue, or on prepared messages (an incremental update)"""
+    with stage_timer("soap"):
+        soap_response = stage_clients.get("soap").chat.completions.create(
+            model=SOAP_MODEL,
+            messages=messages or build_soap_messages(dialogue_text),
+            temperature=0.3
+        )
+    
+    soap_notes = soap_response.choices[0].message.content
+    
+    # Parse SOAP notes into sections
+    return {
+        "soap_notes": soap_notes,
+        "soap_sections": parse_soap_sections(soap_notes),
+        "dialogue": dialogue_text
+    }
+
+def cached_soap(data, dialogue_text, soap_key=None):
+    """
+    Return (soap_key, cached notes or None) for a SOAP request.
+    
+    soap_key defaults to the key of dialogue_text. Waits for speculative
+    generation of the same dialogue if it is still running. A soap_key
+    from the transcription that no longer matches the dialogue means it
+    was edited: that speculation is cancelled and dropped.
+    """
+    soap_key = soap_key or soap_cache_key(dialogue_text, SOAP_MODEL)
+    previous_key = data.get('soap_key')
+    if previous_key and previous_key != soap_key:
+        logger.info("✏️ Dialogue edited since transcription, invalidating its SOAP notes")
+        soap_speculator.invalidate(previous_key)
+    
+    if data.get('regenerate'):
+        soap_speculator.invalidate(soap_key)
+        return soap_key, None
+    
+    with span("soap_cache") as attrs:
+        result = soap_cache.get(soap_key)
+        source = "cache"
+        if result is None:
+            policy = stage_clients.policies["soap"]
+            result = soap_speculator.wait(soap_key, timeout=policy.timeout.read * policy.max_attempts)
+            source = "speculative"
+        attrs["source"] = source if result is not None else "miss"
+    if result is not None:
+        logger.info(f"⚡ SOAP notes served from {source}")
+        metrics.inc("soap_cache_total", source=source)
+    return soap_key, result
+
+def plan_soap_update(data, conversation):
+    """
+    Decide whether a SOAP request can revise the previous note instead of regenerating it.
+    
+    The client sends back the previous response's soap_sections (as
+    previous_soap_sections), soap_state and soap_key, plus either the
+    whole conversation or only new_turns. Returns (previous sections,
+    new turns, soap_state) for an incremental update, or None when the
+    note has to be generated from the whole dialogue: no previous note,
+    earlier turns edited (their soap_key no longer matches), or too much
+    of the note built incrementally (see SOAP_INCREMENTAL_MAX_DRIFT).
+    """
+    previous_sections = data.get('previous_soap_sections')
+    state = data.get('soap_state')
+    if not SOAP_INCREMENTAL_ENABLED or data.get('regenerate') or not isinstance(previous_sections, dict) or not isinstance(state, dict):
+        return None
+    turns, base_turns = state.get('turns'), state.get('base_turns')
+    if not isinstance(turns, int) or not isinstance(base_turns, int) or not 0 < base_turns <= turns:
+        return None
+    
+    if data.get('new_turns') is not None:
+        # The key of the whole dialogue is chained from the previous note's
+        if conversation is None and not isinstance(data.get('soap_key'), str):
+            return None
+        new_turns = data['new_turns']
+    else:
+        # The turns the previous note covered must be unchanged
+        if turns > len(conversation) or soap_cache_key(format_dialogue(conversation[:turns]), SOAP_MODEL) != data.get('soap_key'):
+            return None
+        new_turns = conversation[turns:]
+    if not new_turns:
+        return None
+    
+    drift = (turns + len(new_turns) - base_turns) / base_turns
+    if drift > SOAP_INCREMENTAL_MAX_DRIFT:
+        logger.info(f"🔄 SOAP drift {drift:.2f} over {SOAP_INCREMENTAL_MAX_DRIFT}, regenerating the full note")
+        return None
+    return previous_sections, new_turns, {"turns": turns + len(new_turns), "base_turns": base_turns}
+
+def prepare_soap_request(data):
+    """
+    Validate a SOAP request and look up cached notes.
+    
+    Returns (request, None), where request holds the dialogue, soap_key,
+    cached result (or None) and the model messages to send otherwise,
+    or (None, (error payload, HTTP status)). May wait for speculative
+    generation; shared with the ASGI app.
+    """
+    if not isinstance(data, dict) or ('conversation' not in data and data.get('new_turns') is None):
+        return None, ({"error": "No conversation data provided"}, 400)
+    
+    conversation, new_turns = data.get('conversation'), data.get('new_turns')
+    if conversation is not None and not (isinstance(conversation, list) and all(isinstance(turn, dict) for turn in conversation)):
+        return None, ({"error": "conversation must be a list of turns"}, 400)
+    if new_turns is not None and not (isinstance(new_turns, list) and all(
+            isinstance(turn, dict) and 'speaker' in turn and 'text' in turn for turn in new_turns)):
+        return None, ({"error": "new_turns must be a list of turns with speaker and text"}, 400)
+    
+    plan = plan_soap_update(data, conversation)
+    if conversation is None and plan is None:
+        return None, ({
+            "error": "Full conversation required to regenerate the SOAP note",
+            "full_regeneration_required": True
+        }, 409)
+    
+    if conversation is not None:
+        # Format the conversation as dialogue
+        dialogue_text = format_dialogue(conversation)
+        soap_key = None
+        turns = len(conversation)
+    else:
+        # Only the new turns: their dialogue, under the key of the whole dialogue
+        dialogue_text = format_dialogue(plan[1])
+        soap_key = extend_soap_cache_key(data['soap_key'], dialogue_text)
+        turns = plan[2]["turns"]
+    # A session update's soap_key is the previous note's: the dialogue grew rather than being edited
+    soap_key, result = cached_soap(dict(data, soap_key=None) if data.get('soap_state') else data, dialogue_text, soap_key)
+    
+    messages = None
+    if result is not None:
+        # Cached notes keep the state they were generated with; speculative ones are full generations
+        mode = result.get("mode", "full")
+        state = result.get("soap_state") or {"turns": turns, "base_turns": turns}
+    elif plan is not None:
+        previous_sections, new_turns, state = plan
+        messages = build_soap_update_messages(previous_sections, format_dialogue(new_turns))
+        mode = "incremental"
+    else:
+        messages = build_soap_messages(dialogue_text)
+        state = {"turns": turns, "base_turns": turns}
+        mode = "full"
+    
+    return {
+        "dialogue": dialogue_text,
+        "soap_key": soap_key,
+        "cached": result,
+        "messages": messages,
+        "mode": mode,
+        "soap_state": state
+    }, None
+
+def complete_soap_request(soap_request, result=None):
+    """Response payload for a prepared SOAP request; result is the newly generated notes, if any"""
+    cached = result is None
+    if cached:
+        result = soap_request["cached"]
+    else:
+        result = dict(result, mode=soap_request["mode"], soap_state=soap_request["soap_state"])
+        soap_cache.put(soap_request["soap_key"], result)
+        metrics.inc("soap_cache_total", source="incremental" if soap_request["mode"] == "incremental" else "generated")
+    
+    return {
+        "success": True,
+        "soap_notes": result["soap_notes"],
+        "soap_sections": result["soap_sections"],
+        "dialogue": soap_request["dialogue"],
+        "soap_key": soap_request["soap_key"],
+        "cached": cached,
+        "mode": soap_request["mode"],
+        "soap_state": soap_request["soap_state"]
+    }
+
 @app.route('/api/generate-soap', methods=['POST', 'OPTIONS'])
 def generate_soap():
-    """Generate SOAP notes from conversation using fine-tuned model"""
+    """Generate SOAP notes from conversation using fine-tuned model (or update the previous notes)"""
     if request.method == 'OPTIONS':
         return jsonify({}), 200
     
     try:
         logger.info("📋 Received SOAP generation request")
         
-        data = request.get_json()
-        if not data or 'conversation' not in data:
-            return jsonify({"error": "No conversation data provided"}), 400
-        
-        conversation = data['conversation']
-        
-        # Format the conversation as dialogue
-        dialogue_lines = []
-        for turn in conversation:
-            speaker = turn.get('speaker', 'Unknown')
-            # Use English translation if available, otherwise original text
-            text = turn.get('text_english', turn.get('text', ''))
-            dialogue_lines.append(f"{speaker}: {text}")
+        soap_request, error = prepare_soap_request(request.get_json(silent=True))
+        if error:
+            return jsonify(error[0]), error[1]
         
-        dialogue_text = "\n".join(dialogue_lines)
-        
-        logger.info(f"🤖 Generating SOAP notes using fine-tuned model...")
-        
-        # Use your fine-tuned model
-        soap_response = client.chat.completions.create(
-            model="ft:gpt-4o-mini-2024-07-18:nectar-technologies::CnLm29dC",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert medical professor assisting in the creation of medically accurate SOAP summaries. Please ensure the response follows the structured format: S:, O:, A:, P: without using markdown or special formatting the note should be clear and concise and very very comprehensive as well as medically accurate."
-                },
-                {
-                    "role": "user",
-                    "content": f"""Create a Medical SOAP note summary from the dialogue, following these guidelines:
-S (Subjective): Summarize the patient's reported symptoms, including chief complaint and relevant history.
-O (Objective): Highlight critical findings such as vital signs, lab results, and imaging.
-A (Assessment): Offer a concise assessment combining subjective and objective data.
-P (Plan): Outline the management plan, covering medication, diet, consultations, and education.
-
-### Dialogue:
-{dialogue_text}"""
-                }
-            ],
-            temperature=0.3
-        )
+        result = None
+        if soap_request["cached"] is None:
+            logger.info(f"🤖 {'Updating' if soap_request['mode'] == 'incremental' else 'Generating'} SOAP notes using fine-tuned model...")
+            result = generate_soap_notes(soap_request["dialogue"], soap_request["messages"])
+            logger.info("✅ SOAP notes generated successfully")
         
-        soap_notes = soap_response.choices[0].message.content
-        
-        # Parse SOAP notes into sections
-        soap_sections = {
-            "subjective": "",
-            "objective": "",
-            "assessment": "",
-            "plan": ""
-        }
-        
-        current_section = None
-        lines = soap_notes.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if line.startswith('S:') or line.startswith('Subjective:'):
-                current_section = 'subjective'
-                line = line.replace('S:', '').replace('Subjective:', '').strip()
-            elif line.startswith('O:') or line.startswith('Objective:'):
-                current_section = 'objective'
-                line = line.replace('O:', '').replace('Objective:', '').strip()
-            elif line.startswith('A:') or line.startswith('Assessment:'):
-                current_section = 'assessment'
-                line = line.replace('A:', '').replace('Assessment:', '').strip()
-            elif line.startswith('P:') or line.startswith('Plan:'):
-                current_section = 'plan'
-                line = line.replace('P:', '').replace('Plan:', '').strip()
-            
-            if current_section and line:
-                if soap_sections[current_section]:
-                    soap_sections[current_section] += ' ' + line
-                else:
-                    soap_sections[current_section] = line
-        
-        logger.info("✅ SOAP notes generated successfully")
-        
-        return jsonify({
-            "success": True,
-            "soap_notes": soap_notes,
-            "soap_sections": soap_sections,
-            "dialogue": dialogue_text
-        })
+        return jsonify(complete_soap_request(soap_request, result))
         
     except Exception as e:
+        count_error(e)
         logger.error(f"SOAP generation error: {e}", exc_info=True)
         return jsonify({"error": f"Failed to generate SOAP notes: {str(e)}"}), 500
 
+@app.route('/api/generate-soap/<soap_key>', methods=['DELETE', 'OPTIONS'])
+def cancel_soap(soap_key):
+    """Cancel speculative SOAP generation the client no longer needs (cached notes are kept)"""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    return jsonify({"success": True, "cancelled": soap_speculator.cancel(soap_key)})
+
+@app.route('/api/generate-soap/stream', methods=['POST', 'OPTIONS'])
+def generate_soap_stream():
+    """Stream SOAP note generation as Server-Sent Events, section by section"""
+    if request.method == 'OPTIONS':
+        return jsonify({}), 200
+    
+    logger.info("📋 Received streaming SOAP generation request")
+    
+    try:
+        soap_request, error = prepare_soap_request(request.get_json(silent=True))
+    except Exception as e:
+        count_error(e)
+        logger.error(f"SOAP generation error: {e}", exc_info=True)
+        return jsonify({"error": f"Failed to generate SOAP notes: {str(e)}"}), 500
+    if error:
+        return jsonify(error[0]), error[1]
+    dialogue_text = soap_request["dialogue"]
+    
+    def sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    
+    def replay():
+        # Cached or speculative notes: send every section at once
+        response_data = complete_soap_request(soap_request)
+        for section, text in response_data["soap_sections"].items():
+            yield sse("section", {"section": section})
+            yield sse("delta", {"section": section, "text": text})
+        yield sse("done", response_data)
+    
+    def generate():
+        parser = SoapStreamParser()
+        soap_notes = ""
+        
+        def relay(events):
+            for event in events:
+                if event[0] == "section":
+                    yield sse("section", {"section": event[1]})
+                else:
+                    yield sse("delta", {"section": event[1], "text": event[2]})
+        
+        started = time.perf_counter()
+        try:
+            logger.info("🤖 Streaming SOAP notes from fine-tuned model...")
+            # Spans can still be added here: the trace stays active until the stream ends
+            with span("soap"):
+                stream = stage_clients.get("soap").chat.completions.create(
+                    model=SOAP_MODEL,
+                    messages=soap_request["messages"],
+                    temperature=0.3,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+            
+                for chunk in stream:
+                    # The final chunk carries token usage and no choices
+                    if getattr(chunk, 'usage', None):
+                        record_token_usage("soap", SOAP_MODEL, chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    token = chunk.choices[0].delta.content or ""
+                    if not token:
+                        continue
+                    soap_notes += token
+                    yield from relay(parser.feed(token))
+            
+                yield from relay(parser.close())
+            
+            metrics.observe("stage_duration_seconds", time.perf_counter() - started, stage="soap")
+            logger.info("✅ SOAP notes streamed successfully")
+            yield sse("done", complete_soap_request(soap_request, {
+                "soap_notes": soap_notes,
+                "soap_sections": parse_soap_sections(soap_notes),
+                "dialogue": dialogue_text
+            }))
+        except Exception as e:
+            count_error(e)
+            logger.error(f"SOAP streaming error: {e}", exc_info=True)
+            yield sse("error", {"error": f"Failed to generate SOAP notes: {str(e)}"})
+    
+    return Response(
+        stream_with_context(replay() if soap_request["cached"] is not None else generate()),
+        mimetype='text/event-stream',
+        headers={'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/info', methods=['GET'])
 def api_info():
     """Get API information"""
@@ -511,10 +1571,19 @@ def api_info():
         "endpoints": {
             "transcribe": "/api/transcribe",
             "translate": "/api/translate",
-            "health": "/api/health"
+            "stream": "/api/stream/start",
+            "transcribe_batch": "/api/transcribe/batch",
+            "jobs": "/api/jobs/transcribe",
+            "generate_soap": "/api/generate-soap",
+            "generate_soap_stream": "/api/generate-soap/stream",
+            "cancel_soap": "/api/generate-soap/<soap_key>",
+            "health": "/api/health",
+            "ready": "/api/ready",
+            "metrics": "/api/metrics",
+            "traces": "/api/traces/<trace_id>"
         },
         "supported_formats": ["mp3", "mp4", "mpeg", "mpga", "m4a", "wav", "webm"],
-        "max_file_size": "25MB"
+        "max_file_size": f"{LONG_AUDIO_MAX_BYTES // (1024 * 1024)}MB" if LONG_AUDIO_ENABLED else "25MB"
     })
 
 # Error handlers
@@ -522,6 +1591,11 @@ def api_info():
 def not_found(error):
     return jsonify({"error": "Endpoint not found"}), 404
 
+@app.errorhandler(413)
+def request_too_large(error):
+    limit_mb = (app.config['MAX_CONTENT_LENGTH'] - 1024 * 1024) // (1024 * 1024)
+    return jsonify({"error": f"File too large. Maximum size is {limit_mb}MB"}), 413
+
 @app.errorhandler(500)
 def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
@@ -534,7 +1608,7 @@ if __name__ == '__main__':
     logger.info(f"📁 OpenAI API key configured: {'Yes' if api_key else 'No'}")
     logger.info(f"🌐 CORS enabled for all origins")
     
-    # For production, use waitress
+    # For production, use waitress (serve.py adds worker processes, preloading and draining)
     if os.getenv("FLASK_ENV") == "production":
         from waitress import serve
         serve(app, host=host, port=port)
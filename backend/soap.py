@@ -0,0 +1,192 @@
+"""
+SOAP note generation helpers: dialogue formatting, prompt, section parsing
+"""
+
+SOAP_MODEL = "ft:gpt-4o-mini-2024-07-18:nectar-technologies::CnLm29dC"
+
+SOAP_SYSTEM_PROMPT = "You are an expert medical professor assisting in the creation of medically accurate SOAP summaries. Please ensure the response follows the structured format: S:, O:, A:, P: without using markdown or special formatting the note should be clear and concise and very very comprehensive as well as medically accurate."
+
+SOAP_SECTIONS = ['subjective', 'objective', 'assessment', 'plan']
+
+# Line prefixes that start each section, checked in order
+SECTION_HEADERS = [
+    ('subjective', ('S:', 'Subjective:')),
+    ('objective', ('O:', 'Objective:')),
+    ('assessment', ('A:', 'Assessment:')),
+    ('plan', ('P:', 'Plan:'))
+]
+
+
+def format_dialogue(conversation):
+    """Format the conversation as dialogue"""
+    dialogue_lines = []
+    for turn in conversation:
+        speaker = turn.get('speaker', 'Unknown')
+        # Use English translation if available, otherwise original text
+        text = turn.get('text_english', turn.get('text', ''))
+        dialogue_lines.append(f"{speaker}: {text}")
+
+    return "\n".join(dialogue_lines)
+
+
+def build_soap_messages(dialogue_text):
+    """Chat messages for the fine-tuned SOAP model"""
+    return [
+        {
+            "role": "system",
+            "content": SOAP_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": f"""Create a Medical SOAP note summary from the dialogue, following these guidelines:
+S (Subjective): Summarize the patient's reported symptoms, including chief complaint and relevant history.
+O (Objective): Highlight critical findings such as vital signs, lab results, and imaging.
+A (Assessment): Offer a concise assessment combining subjective and objective data.
+P (Plan): Outline the management plan, covering medication, diet, consultations, and education.
+
+### Dialogue:
+{dialogue_text}"""
+        }
+    ]
+
+
+def format_soap_note(soap_sections):
+    """SOAP sections back in the S:/O:/A:/P: text format the model writes"""
+    return "\n".join(f"{prefixes[0]} {soap_sections.get(section, '')}" for section, prefixes in SECTION_HEADERS)
+
+
+def build_soap_update_messages(soap_sections, new_dialogue_text):
+    """Chat messages asking the SOAP model to revise an existing note with new dialogue only"""
+    return [
+        {
+            "role": "system",
+            "content": SOAP_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": f"""Update the Medical SOAP note summary of an ongoing consultation with the new dialogue below. Keep everything in the current note that is still accurate, add the new information to the right sections, and correct anything the new dialogue contradicts. Follow these guidelines:
+S (Subjective): Summarize the patient's reported symptoms, including chief complaint and relevant history.
+O (Objective): Highlight critical findings such as vital signs, lab results, and imaging.
+A (Assessment): Offer a concise assessment combining subjective and objective data.
+P (Plan): Outline the management plan, covering medication, diet, consultations, and education.
+Return the complete updated note.
+
+### Current SOAP note:
+{format_soap_note(soap_sections)}
+
+### New dialogue:
+{new_dialogue_text}"""
+        }
+    ]
+
+
+def match_section_header(line):
+    """Return (section, line without header) if line starts a section, else (None, line)"""
+    for section, prefixes in SECTION_HEADERS:
+        if line.startswith(prefixes[0]) or line.startswith(prefixes[1]):
+            return section, line.replace(prefixes[0], '').replace(prefixes[1], '').strip()
+    return None, line
+
+
+def parse_soap_sections(soap_notes):
+    """Parse SOAP notes into sections"""
+    soap_sections = {section: "" for section in SOAP_SECTIONS}
+
+    current_section = None
+    for line in soap_notes.split('\n'):
+        line = line.strip()
+        section, line = match_section_header(line)
+        if section:
+            current_section = section
+
+        if current_section and line:
+            if soap_sections[current_section]:
+                soap_sections[current_section] += ' ' + line
+            else:
+                soap_sections[current_section] = line
+
+    return soap_sections
+
+
+class SoapStreamParser:
+    """
+    Incremental S/O/A/P section parser for streamed model output.
+
+    feed() takes raw token text and returns a list of events:
+    ("section", name) when a section header appears, and
+    ("delta", name, text) for content belonging to the current section.
+    Text is held back only while the start of a line could still turn
+    out to be a section header.
+    """
+
+    def __init__(self):
+        self.current_section = None
+        self.line_buffer = ""
+        self.emitted = 0  # characters of line_buffer content already emitted
+        self.line_decided = False
+        self.section_has_content = {section: False for section in SOAP_SECTIONS}
+
+    @staticmethod
+    def _could_be_header(text):
+        return any(prefix.startswith(text) for _, prefixes in SECTION_HEADERS for prefix in prefixes)
+
+    def _emit_content(self, text, events):
+        if not self.current_section or not text:
+            return
+        if self.emitted == 0 and self.section_has_content[self.current_section]:
+            text = ' ' + text
+        self.section_has_content[self.current_section] = True
+        events.append(("delta", self.current_section, text))
+
+    def _decide_line(self, events):
+        """Resolve whether the buffered line start is a header"""
+        section, rest = match_section_header(self.line_buffer.lstrip())
+        if section:
+            self.current_section = section
+            events.append(("section", section))
+            self.line_buffer = rest
+        else:
+            self.line_buffer = self.line_buffer.lstrip()
+        self.line_decided = True
+
+    def feed(self, text):
+        events = []
+        for char in text:
+            if char == '\n':
+                self._finish_line(events)
+                continue
+            self.line_buffer += char
+            if not self.line_decided:
+                stripped = self.line_buffer.lstrip()
+                if stripped and not self._could_be_header(stripped):
+                    self._decide_line(events)
+        # Flush decided content accumulated during this feed
+        if self.line_decided:
+            pending = self.line_buffer[self.emitted:]
+            if self.emitted == 0:
+                pending = pending.lstrip()
+                self.line_buffer = pending
+            if pending:
+                self._emit_content(pending, events)
+                self.emitted = len(self.line_buffer)
+        return events
+
+    def _finish_line(self, events):
+        if not self.line_decided:
+            self._decide_line(events)
+        remainder = self.line_buffer[self.emitted:]
+        if self.emitted == 0:
+            remainder = remainder.strip()
+        else:
+            remainder = remainder.rstrip()
+        self._emit_content(remainder, events)
+        self.line_buffer = ""
+        self.emitted = 0
+        self.line_decided = False
+
+    def close(self):
+        """Flush any buffered partial line"""
+        events = []
+        if self.line_buffer:
+            self._finish_line(events)
+        return events
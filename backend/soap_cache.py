@@ -0,0 +1,156 @@
+"""
+SOAP note cache keyed by the formatted dialogue, with optional
+speculative generation in the background.
+
+Completed notes are stored in a disk-backed cache (shared by worker
+processes) under soap_cache_key(dialogue_text), so resubmitting an
+unchanged conversation returns instantly and an edited one misses.
+SoapSpeculator starts generation for a dialogue as soon as a
+transcription produces it; a later request for the same dialogue waits
+for that work instead of starting again. Speculative work is cancelled
+when the client discards it or edits the dialogue; a call already sent
+to OpenAI can't be aborted, so its result is discarded instead.
+"""
+import os
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def soap_cache_key(dialogue_text, model):
+    """Hash of the model and the exact dialogue the SOAP prompt is built from"""
+    return extend_soap_cache_key(hashlib.sha256(model.encode('utf-8')).hexdigest(), dialogue_text)
+
+
+def extend_soap_cache_key(soap_key, dialogue_text):
+    """
+    Key of a dialogue continued with dialogue_text, from the key of the
+    dialogue before it. Keys are chained line by line, so an update that
+    only sends the new turns still gets the key of the whole dialogue.
+    """
+    for line in dialogue_text.split("\n"):
+        soap_key = hashlib.sha256(f"{soap_key}\x1f{line}".encode('utf-8')).hexdigest()
+    return soap_key
+
+
+class SoapSpeculator:
+    """
+    Runs generate(dialogue_text) in a small thread pool and stores the
+    result in store under the dialogue's key. At most max_pending
+    dialogues are queued or running; further speculation is skipped.
+    """
+
+    def __init__(self, generate, store, model, workers=2, max_pending=8, on_outcome=None):
+        self.generate = generate
+        self.store = store
+        self.model = model
+        self.workers = workers
+        self.max_pending = max_pending
+        self.on_outcome = on_outcome or (lambda outcome: None)
+        self._pending = {}
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.counts = {"started": 0, "used": 0, "cancelled": 0, "skipped": 0, "failed": 0}
+
+    def _count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+        self.on_outcome(outcome)
+
+    def _get_executor(self):
+        # Pool threads don't survive into forked worker processes
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pending = {}
+                self._cancelled = set()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="soap-speculative")
+            return self._executor
+
+    def speculate(self, dialogue_text):
+        """Start generating notes for dialogue_text unless cached or already running; returns its key"""
+        key = soap_cache_key(dialogue_text, self.model)
+        if not self.store.enabled or self.store.get(key) is not None:
+            return key
+        executor = self._get_executor()
+        with self._lock:
+            if key in self._pending:
+                # Wanted again after a cancel: keep the result after all
+                self._cancelled.discard(key)
+                return key
+            if len(self._pending) >= self.max_pending:
+                skipped = True
+            else:
+                skipped = False
+                self._cancelled.discard(key)
+                self._pending[key] = executor.submit(self._run, key, dialogue_text)
+        if skipped:
+            logger.info("⏭️ Speculative SOAP skipped: too many pending")
+            self._count("skipped")
+        else:
+            logger.info(f"🔮 Speculative SOAP generation started ({key[:12]})")
+            self._count("started")
+        return key
+
+    def _run(self, key, dialogue_text):
+        try:
+            result = self.generate(dialogue_text)
+            with self._lock:
+                cancelled = key in self._cancelled
+            if cancelled:
+                logger.info(f"🗑️ Discarded cancelled speculative SOAP ({key[:12]})")
+            else:
+                # Stored before leaving _pending, so a request never finds neither
+                self.store.put(key, result)
+            return result
+        except Exception as e:
+            logger.warning(f"⚠️ Speculative SOAP generation failed: {e}")
+            self._count("failed")
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+                self._cancelled.discard(key)
+
+    def wait(self, key, timeout=None):
+        """Result of in-flight speculation for key, or None if there is none (or it failed)"""
+        with self._lock:
+            future = self._pending.get(key) if self._pid == os.getpid() else None
+            self._cancelled.discard(key)
+        if future is None:
+            return None
+        try:
+            result = future.result(timeout)
+        except Exception:
+            # Failed, cancelled or timed out: the caller generates the notes itself
+            return None
+        self._count("used")
+        return result
+
+    def cancel(self, key):
+        """Stop speculation for key: drop it if queued, discard its result if running"""
+        with self._lock:
+            future = self._pending.get(key) if self._pid == os.getpid() else None
+            if future is None:
+                return False
+            if future.cancel():
+                self._pending.pop(key, None)
+            else:
+                self._cancelled.add(key)
+        logger.info(f"🛑 Speculative SOAP cancelled ({key[:12]})")
+        self._count("cancelled")
+        return True
+
+    def invalidate(self, key):
+        """Cancel speculation for key and drop its cached notes"""
+        self.cancel(key)
+        self.store.delete(key)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, pending=len(self._pending) if self._pid == os.getpid() else 0)
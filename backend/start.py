@@ -14,7 +14,11 @@ load_dotenv()
 
 def start_ngrok_in_thread():
     """Start ngrok in a separate thread"""
-    time.sleep(3)  # Wait for Flask to start
+    from serve import wait_until_ready
+    
+    # Wait for Flask to start
+    if wait_until_ready("http://localhost:5000", timeout=60) is None:
+        print("\n⚠️  Server not ready after 60s, starting ngrok anyway\n")
     
     try:
         from pyngrok import ngrok
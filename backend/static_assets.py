@@ -0,0 +1,234 @@
+"""
+Precompressed, content-hashed serving of the frontend files.
+
+At startup every file in the frontend directory is read once, hashed and
+compressed (gzip, plus brotli when the Brotli package is installed).
+index.html is rewritten to reference content-hashed URLs
+(style.css -> style.<hash>.css), which are cached by browsers as
+immutable; index.html and unhashed URLs are revalidated with strong
+ETags and answered 304 when unchanged.
+
+StaticAssets.wsgi() wraps the Flask app so static GET/HEAD requests are
+answered before Flask runs: no request hooks, metrics, traces or CORS
+headers for them.
+"""
+import os
+import re
+import gzip
+import time
+import hashlib
+import logging
+import mimetypes
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Files referenced from index.html through content-hashed URLs
+HASHED_EXTENSIONS = (".js", ".css")
+# Smaller files, or ones that barely shrink, are only served uncompressed
+COMPRESS_MIN_BYTES = 512
+COMPRESS_MIN_SAVING = 0.1
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+class Asset:
+    """One file with its compressed variants and response headers"""
+
+    def __init__(self, path, body, content_type, digest, cache_control):
+        self.path = path
+        self.content_type = content_type
+        self.digest = digest
+        self.cache_control = cache_control
+        self.variants = {"identity": body}
+        if len(body) >= COMPRESS_MIN_BYTES:
+            compressed = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed["br"] = brotli.compress(body, quality=11)
+            for encoding, data in compressed.items():
+                if len(data) <= len(body) * (1 - COMPRESS_MIN_SAVING):
+                    self.variants[encoding] = data
+
+    def etag(self, encoding):
+        # Strong ETag per representation: the bytes differ between encodings
+        return f'"{self.digest}-{encoding}"' if encoding != "identity" else f'"{self.digest}"'
+
+    def choose_encoding(self, accept_encoding):
+        accepted = parse_accept_encoding(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and accepted.get(encoding, accepted.get("*", 0)) > 0:
+                return encoding
+        return "identity"
+
+
+def parse_accept_encoding(header):
+    """{coding: q} from an Accept-Encoding header"""
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses weak comparison
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+
+
+class StaticAssets:
+    """
+    In-memory table of the frontend's files, keyed by URL path.
+
+    With check_interval set (seconds; 0, the default, disables it), the
+    directory's modification times are checked at most that often and the
+    table is rebuilt when a file changed, so edits show up without a
+    restart during development. One thread at a time checks and rebuilds;
+    the others keep serving the current table.
+    """
+
+    def __init__(self, directory, index="index.html", extra_headers=None, check_interval=0):
+        self.directory = os.path.abspath(directory)
+        self.index = index
+        self.extra_headers = list((extra_headers or {}).items())
+        self.check_interval = check_interval
+        self._assets = {}
+        self._mtimes = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.build()
+
+    def _scan(self):
+        mtimes = {}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith("."):
+                    continue
+                full = os.path.join(root, name)
+                mtimes[os.path.relpath(full, self.directory).replace(os.sep, "/")] = os.stat(full).st_mtime_ns
+        return mtimes
+
+    def build(self):
+        """Read, hash and compress every file; rewrite index.html to the hashed URLs"""
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        started = time.perf_counter()
+        mtimes = self._scan()
+        assets = {}
+        hashed_urls = {}
+        for name in sorted(mtimes):
+            if name == self.index:
+                continue
+            with open(os.path.join(self.directory, name), "rb") as f:
+                body = f.read()
+            digest = hashlib.sha256(body).hexdigest()[:12]
+            content_type = guess_type(name)
+            assets["/" + name] = Asset(name, body, content_type, digest, REVALIDATE_CACHE_CONTROL)
+            stem, ext = os.path.splitext(name)
+            if ext in HASHED_EXTENSIONS:
+                hashed = f"{stem}.{digest}{ext}"
+                assets["/" + hashed] = Asset(hashed, body, content_type, digest, IMMUTABLE_CACHE_CONTROL)
+                hashed_urls[name] = hashed
+
+        if self.index in mtimes:
+            with open(os.path.join(self.directory, self.index), "rb") as f:
+                html = f.read().decode("utf-8")
+            for name, hashed in hashed_urls.items():
+                html = re.sub(rf'((?:src|href)=["\'])(?:\./)?{re.escape(name)}(["\'])', rf"\g<1>{hashed}\g<2>", html)
+            body = html.encode("utf-8")
+            index = Asset(self.index, body, "text/html; charset=utf-8",
+                          hashlib.sha256(body).hexdigest()[:12], REVALIDATE_CACHE_CONTROL)
+            assets["/"] = assets["/" + self.index] = index
+
+        with self._lock:
+            self._assets = assets
+            self._mtimes = mtimes
+            self._checked_at = time.monotonic()
+        files = [assets["/" + name] for name in mtimes]
+        raw = sum(len(asset.variants["identity"]) for asset in files)
+        smallest = sum(min(len(variant) for variant in asset.variants.values()) for asset in files)
+        logger.info(
+            f"📦 Static assets: {len(mtimes)} files, {raw / 1024:.0f} KiB -> {smallest / 1024:.0f} KiB compressed "
+            f"({'br+gzip' if brotli else 'gzip'}) in {time.perf_counter() - started:.2f}s"
+        )
+
+    def _refresh(self):
+        if not self.check_interval or time.monotonic() - self._checked_at < self.check_interval:
+            return
+        if not self._build_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return
+            self._checked_at = time.monotonic()
+            try:
+                changed = self._scan() != self._mtimes
+            except OSError:
+                return
+            if changed:
+                logger.info("🔄 Frontend files changed, rebuilding static assets")
+                self._build()
+        finally:
+            self._build_lock.release()
+
+    def get(self, path):
+        self._refresh()
+        return self._assets.get(path)
+
+    def respond(self, environ, start_response, asset):
+        encoding = asset.choose_encoding(environ.get("HTTP_ACCEPT_ENCODING"))
+        etag = asset.etag(encoding)
+        headers = [
+            ("ETag", etag),
+            ("Cache-Control", asset.cache_control),
+            ("Vary", "Accept-Encoding"),
+        ] + self.extra_headers
+        if etag_matches(environ.get("HTTP_IF_NONE_MATCH"), etag):
+            start_response("304 Not Modified", headers)
+            return [b""]
+        body = asset.variants[encoding]
+        headers += [("Content-Type", asset.content_type), ("Content-Length", str(len(body)))]
+        if encoding != "identity":
+            headers.append(("Content-Encoding", encoding))
+        start_response("200 OK", headers)
+        return [b"" if environ["REQUEST_METHOD"] == "HEAD" else body]
+
+    def wsgi(self, app, skip_prefixes=("/api/",)):
+        """WSGI middleware answering GET/HEAD for known files before the wrapped app sees them"""
+        def middleware(environ, start_response):
+            path = environ.get("PATH_INFO") or "/"
+            if environ["REQUEST_METHOD"] in ("GET", "HEAD") and not path.startswith(skip_prefixes):
+                asset = self.get(path)
+                if asset is not None:
+                    return self.respond(environ, start_response, asset)
+            return app(environ, start_response)
+        return middleware
+
+
+def guess_type(name):
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+        content_type += "; charset=utf-8"
+    return content_type
@@ -0,0 +1,369 @@
+"""
+Live streaming transcription sessions fed by MediaRecorder timeslices.
+
+The browser posts each timeslice as it is recorded. Only the first webm
+timeslice carries the container header, so slices cannot be decoded on
+their own: each session feeds them, once, into a long-running ffmpeg
+process that decodes the stream incrementally to 16 kHz mono PCM. A
+background worker transcribes every completed window, cut at a silence,
+while recording continues, and the PCM before the last cut is dropped.
+On stop only the audio after the last cut is left to process.
+"""
+import io
+import time
+import uuid
+import logging
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+from long_audio import find_cut_point
+from segmentation import segment_conversation
+from translation import translate_conversation
+
+logger = logging.getLogger(__name__)
+
+
+class StreamDecoder:
+    """
+    Incremental decoder for one recording: container bytes are written to
+    an ffmpeg process's stdin as they arrive, and a reader thread collects
+    the 16 kHz mono 16-bit PCM it outputs. Decoded audio is addressed in
+    milliseconds from the start of the recording; discard() drops the
+    part that has been transcribed.
+    """
+
+    SAMPLE_RATE = 16000
+    BYTES_PER_MS = SAMPLE_RATE * 2 // 1000
+
+    def __init__(self):
+        from pydub import AudioSegment
+
+        self._stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [AudioSegment.converter, "-hide_banner", "-loglevel", "error",
+             # Start decoding after the first timeslice instead of probing seconds of input
+             "-probesize", "32768", "-analyzeduration", "500000",
+             "-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(self.SAMPLE_RATE),
+             "-flush_packets", "1", "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self._stderr
+        )
+        self._pcm = bytearray()
+        self._start_ms = 0  # recording time of the first byte kept in _pcm
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, name="stream-decoder", daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        while True:
+            chunk = self.process.stdout.read1(65536)
+            if not chunk:
+                break
+            with self._lock:
+                self._pcm.extend(chunk)
+
+    def feed(self, data):
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            # ffmpeg exited on invalid input; the error is reported when the recording is finished
+            pass
+
+    def close(self, timeout=60):
+        """End the input and wait until everything written has been decoded"""
+        if not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        self._reader.join(timeout)
+        self.process.wait(timeout)
+
+    def kill(self):
+        self.process.kill()
+        self._reader.join(5)
+
+    def error(self):
+        self._stderr.seek(0)
+        return self._stderr.read().decode('utf-8', 'replace').strip()
+
+    def duration_ms(self):
+        with self._lock:
+            return self._start_ms + len(self._pcm) // self.BYTES_PER_MS
+
+    def audio(self, start_ms, end_ms=None):
+        """Decoded audio between two recording times (end defaults to everything decoded so far)"""
+        from pydub import AudioSegment
+
+        with self._lock:
+            begin = (start_ms - self._start_ms) * self.BYTES_PER_MS
+            end = len(self._pcm) if end_ms is None else (end_ms - self._start_ms) * self.BYTES_PER_MS
+            data = bytes(self._pcm[max(0, begin):end - end % 2])
+        return AudioSegment(data=data, sample_width=2, frame_rate=self.SAMPLE_RATE, channels=1)
+
+    def discard(self, end_ms):
+        """Drop the decoded audio before end_ms"""
+        with self._lock:
+            drop = min(len(self._pcm), (end_ms - self._start_ms) * self.BYTES_PER_MS)
+            if drop > 0:
+                del self._pcm[:drop]
+                self._start_ms += drop // self.BYTES_PER_MS
+
+
+class StreamSession:
+    """State of one live recording"""
+
+    def __init__(self, language='', file_extension='webm'):
+        self.id = uuid.uuid4().hex
+        self.language = language
+        self.file_extension = file_extension
+        self.decoder = None
+        self.received_bytes = 0
+        self.processed_ms = 0
+        self.duration_ms = 0
+        self.segments = []
+        self.conversation = []
+        self.languages = []
+        self.windows = 0
+        self.error = None
+        self.closed = False
+        self.created = time.time()
+        self.updated = self.created
+        self.lock = threading.Lock()
+        self.process_lock = threading.Lock()
+
+    def status(self):
+        with self.lock:
+            return {
+                "success": True,
+                "session_id": self.id,
+                "received_bytes": self.received_bytes,
+                "processed_seconds": self.processed_ms / 1000.0,
+                "windows": self.windows,
+                "conversation": list(self.conversation),
+                "error": self.error
+            }
+
+
+class StreamSessionManager:
+    """
+    Creates sessions, accepts timeslices and transcribes completed windows in the background.
+
+    get_client(stage) returns the OpenAI client for "whisper", "segmentation" or "translation".
+    """
+
+    def __init__(self, get_client, translation_memory=None, window_seconds=15, tail_guard_seconds=1,
+                 max_workers=2, max_bytes=100 * 1024 * 1024, idle_timeout=1800, word_timestamps=False,
+                 segmentation_mode="text"):
+        self.get_client = get_client
+        self.translation_memory = translation_memory
+        self.window_ms = int(window_seconds * 1000)
+        self.tail_guard_ms = int(tail_guard_seconds * 1000)
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self.word_timestamps = word_timestamps
+        self.segmentation_mode = segmentation_mode
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stream")
+
+    def start(self, language='', file_extension='webm'):
+        self._expire()
+        session = StreamSession(language, file_extension)
+        with self._lock:
+            self.sessions[session.id] = session
+        logger.info(f"🎙️ Streaming session started: {session.id}")
+        return session
+
+    def get(self, session_id):
+        self._expire()
+        with self._lock:
+            return self.sessions.get(session_id)
+
+    def append(self, session, data):
+        """Add a timeslice and schedule background processing. Returns False if the session is full."""
+        with session.lock:
+            if session.closed:
+                raise ValueError("Session already stopped")
+            if session.received_bytes + len(data) > self.max_bytes:
+                return False
+            if session.decoder is None:
+                session.decoder = StreamDecoder()
+            session.decoder.feed(data)
+            session.received_bytes += len(data)
+            session.updated = time.time()
+        self._executor.submit(self._process_available, session)
+        return True
+
+    def finish(self, session):
+        """Transcribe the remaining tail and return the full transcription payload"""
+        with session.lock:
+            session.closed = True
+        try:
+            with session.process_lock:
+                self._process(session, final=True)
+        finally:
+            with self._lock:
+                self.sessions.pop(session.id, None)
+            if session.decoder is not None:
+                session.decoder.kill()
+        return self._build_response(session)
+
+    def _expire(self):
+        """Drop sessions idle past idle_timeout; runs on every start() and get(), i.e. on each chunk"""
+        cutoff = time.time() - self.idle_timeout
+        with self._lock:
+            expired = [self.sessions.pop(sid) for sid, s in list(self.sessions.items()) if s.updated < cutoff]
+        # Kill decoders outside the manager lock: waiting on ffmpeg must not block other sessions
+        for session in expired:
+            logger.info(f"🧹 Dropping idle streaming session {session.id}")
+            with session.lock:
+                session.closed = True
+            if session.decoder is not None:
+                session.decoder.kill()
+
+    def _process_available(self, session):
+        # Skip if a window is already being transcribed; the next timeslice retries
+        if not session.process_lock.acquire(blocking=False):
+            return
+        try:
+            self._process(session, final=False)
+        except Exception as e:
+            logger.error(f"Streaming window failed: {e}")
+            with session.lock:
+                session.error = str(e)
+        finally:
+            session.process_lock.release()
+
+    def _process(self, session, final):
+        """Transcribe every completed window (or everything left, when final)"""
+        decoder = session.decoder
+        if decoder is None:
+            return
+        if final:
+            decoder.close()
+            if decoder.process.returncode:
+                raise RuntimeError(f"Could not decode the recording: {decoder.error()}")
+
+        # Only the audio after the last cut is still decoded and kept
+        while True:
+            start = session.processed_ms
+            audio = decoder.audio(start)
+            session.duration_ms = start + len(audio)
+            if final:
+                if len(audio) <= 0:
+                    break
+                end = len(audio)
+            else:
+                if len(audio) < self.window_ms + self.tail_guard_ms:
+                    break
+                end = find_cut_point(audio, self.window_ms, search_ms=min(3000, self.window_ms // 4))
+                if end <= 0 or end > len(audio) - self.tail_guard_ms:
+                    end = self.window_ms
+            self._transcribe_window(session, audio[:end], start, start + end)
+            decoder.discard(start + end)
+            if final:
+                break
+
+    def _transcribe_window(self, session, audio, start_ms, end_ms):
+        """Transcribe one window of audio, which starts start_ms into the recording"""
+        buffer = io.BytesIO()
+        audio.export(buffer, format="mp3", bitrate="64k")
+        buffer.seek(0)
+        buffer.name = f"{session.id}_{start_ms}.mp3"
+
+        whisper_params = {
+            "model": "whisper-1",
+            "file": buffer,
+            "response_format": "verbose_json"
+        }
+        if session.language:
+            whisper_params["language"] = session.language
+        if self.word_timestamps:
+            whisper_params["timestamp_granularities"] = ["segment", "word"]
+
+        logger.info(f"🎤 Streaming window {start_ms / 1000:.1f}s-{end_ms / 1000:.1f}s")
+        transcript = self.get_client("whisper").audio.transcriptions.create(**whisper_params)
+
+        offset = start_ms / 1000.0
+        segments = [SimpleNamespace(
+            id=0,
+            start=round(segment.start + offset, 3),
+            end=round(segment.end + offset, 3),
+            text=segment.text
+        ) for segment in (getattr(transcript, 'segments', None) or [])]
+
+        words = [SimpleNamespace(
+            word=word.word,
+            start=round(word.start + offset, 3),
+            end=round(word.end + offset, 3)
+        ) for word in (getattr(transcript, 'words', None) or [])]
+
+        window = SimpleNamespace(
+            text="".join(segment.text for segment in segments).strip(),
+            segments=segments,
+            words=words,
+            duration=end_ms / 1000.0
+        )
+
+        turns = []
+        if window.text:
+            with session.lock:
+                previous_turns = session.conversation[-3:]
+            turns = segment_conversation(self.get_client("segmentation"), window, previous_turns=previous_turns,
+                                         mode=self.segmentation_mode)
+            language = getattr(transcript, 'language', None) or session.language or 'en'
+            translate_conversation(self.get_client("translation"), turns, language, self.translation_memory)
+
+        with session.lock:
+            for segment in segments:
+                segment.id = len(session.segments)
+                session.segments.append(segment)
+            self._merge_turns(session.conversation, turns)
+            if getattr(transcript, 'language', None):
+                session.languages.append(transcript.language)
+            session.processed_ms = end_ms
+            session.windows += 1
+
+    @staticmethod
+    def _merge_turns(conversation, turns):
+        """Append window turns, joining a turn that continues the previous speaker"""
+        for turn in turns:
+            last = conversation[-1] if conversation else None
+            if last and last.get('speaker') == turn.get('speaker') and turn.get('speaker') != 'Unknown':
+                # Untranslated turns fall back to their original text, taken before it is joined
+                last['text_english'] = f"{last.get('text_english', last['text'])} {turn.get('text_english', turn['text'])}".strip()
+                last['text'] = f"{last['text']} {turn['text']}".strip()
+                last['end'] = turn.get('end', last.get('end', 0))
+            else:
+                conversation.append(turn)
+
+    def _build_response(self, session):
+        language = Counter(session.languages).most_common(1)[0][0] if session.languages else (session.language or 'en')
+        conversation = session.conversation
+        return {
+            "success": True,
+            "text": "".join(segment.text for segment in session.segments).strip(),
+            "language": language,
+            "duration": session.duration_ms / 1000.0,
+            "conversation": conversation,
+            "conversation_english": conversation,
+            "diarization_available": False,
+            "segments": [
+                {
+                    "id": segment.id,
+                    "start": segment.start,
+                    "end": segment.end,
+                    "text": segment.text
+                } for segment in session.segments
+            ],
+            "streaming": {
+                "session_id": session.id,
+                "windows": session.windows,
+                "received_bytes": session.received_bytes
+            }
+        }
@@ -0,0 +1,267 @@
+"""
+Per-request tracing: one trace id per request, with timed spans around
+pipeline stages and OpenAI calls, kept in an in-memory ring buffer.
+
+The active trace lives in a context variable, so span() anywhere below a
+request handler records into that request's trace and is a no-op outside
+one. Thread pools don't inherit context variables; wrap work submitted to
+them with bind() to keep its spans in the submitting request's trace.
+
+RequestProfiler optionally runs cProfile or tracemalloc for a sampled
+fraction of requests and attaches the report to the trace.
+"""
+import io
+import re
+import time
+import uuid
+import random
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# (active trace, id of the enclosing span or None)
+_current = contextvars.ContextVar("trace", default=(None, None))
+
+TRACE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+class Trace:
+    """Spans of one request, timed in milliseconds from the request start"""
+
+    def __init__(self, trace_id, name, upstream_id=None):
+        self.id = trace_id
+        self.name = name
+        self.upstream_id = upstream_id
+        self.started_at = time.time()
+        self.status = None
+        self.duration = None
+        self.profile = None
+        self.spans = []
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        return time.perf_counter() - self._started
+
+    def begin(self, name, parent=None, attrs=None):
+        with self._lock:
+            span = {
+                "id": len(self.spans),
+                "parent": parent,
+                "name": name,
+                "start_ms": round(self.elapsed() * 1000, 1),
+                "duration_ms": None,
+                "thread": threading.current_thread().name,
+                "attrs": attrs or {}
+            }
+            self.spans.append(span)
+        return span
+
+    def end(self, span, started):
+        span["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    def finish(self, status=None):
+        if self.duration is None:
+            self.duration = self.elapsed()
+        if status is not None:
+            self.status = status
+
+    def server_timing(self):
+        """Server-Timing header value: finished top-level spans summed by name, plus the total so far"""
+        durations = {}
+        with self._lock:
+            for span in self.spans:
+                if span["parent"] is None and span["duration_ms"] is not None:
+                    durations[span["name"]] = durations.get(span["name"], 0.0) + span["duration_ms"]
+        entries = [f"{name};dur={duration:.1f}" for name, duration in durations.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def summary(self):
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "upstream_id": self.upstream_id,
+            "started_at": self.started_at,
+            "status": self.status,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "span_count": len(self.spans)
+        }
+
+    def to_dict(self):
+        """Waterfall: spans in start order, each with its nesting depth"""
+        with self._lock:
+            spans = [dict(span) for span in self.spans]
+        for span in spans:
+            # Parents begin before their children, so their depth is already known
+            span["depth"] = 0 if span["parent"] is None else spans[span["parent"]]["depth"] + 1
+        data = self.summary()
+        data["spans"] = sorted(spans, key=lambda span: span["start_ms"])
+        data["profile"] = self.profile
+        return data
+
+
+class TraceStore:
+    """Ring buffer of the most recent traces, looked up by id"""
+
+    def __init__(self, capacity=200):
+        self.capacity = capacity
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace):
+        with self._lock:
+            self._traces[trace.id] = trace
+            self._traces.move_to_end(trace.id)
+            while len(self._traces) > self.capacity:
+                self._traces.popitem(last=False)
+
+    def get(self, trace_id):
+        with self._lock:
+            return self._traces.get(trace_id)
+
+    def recent(self, limit=50):
+        with self._lock:
+            traces = list(self._traces.values())[-limit:]
+        return [trace.summary() for trace in reversed(traces)]
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+def upstream_trace_id(requested):
+    """
+    A well-formed incoming X-Trace-Id (e.g. from a proxy), else None. It is
+    only recorded on the trace: reusing it as the trace id would let a
+    client overwrite or read another request's trace in the store.
+    """
+    if requested and TRACE_ID_PATTERN.match(requested):
+        return requested
+    return None
+
+
+def start_trace(trace_id, name, upstream_id=None):
+    """Create a trace and make it the active one in this context"""
+    trace = Trace(trace_id, name, upstream_id)
+    _current.set((trace, None))
+    return trace
+
+
+def end_trace():
+    _current.set((None, None))
+
+
+def current_trace():
+    return _current.get()[0]
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time the with-block as a span of the active trace; yields the span's attrs dict (or {})"""
+    trace, parent = _current.get()
+    if trace is None:
+        yield {}
+        return
+    record = trace.begin(name, parent, attrs)
+    token = _current.set((trace, record["id"]))
+    started = time.perf_counter()
+    try:
+        yield record["attrs"]
+    except BaseException as e:
+        record["attrs"]["error"] = e.__class__.__name__
+        raise
+    finally:
+        trace.end(record, started)
+        _current.reset(token)
+
+
+def bind(func):
+    """Wrap func so it records into the caller's trace (and under its current span) in another thread"""
+    state = _current.get()
+    if state[0] is None:
+        return func
+
+    def bound(*args, **kwargs):
+        token = _current.set(state)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return bound
+
+
+class RequestProfiler:
+    """
+    Profiles a sampled fraction of requests.
+
+    mode "cprofile": top functions by cumulative time, for the request
+    thread only (work in pool threads shows up as waiting); one request is
+    profiled at a time. mode "tracemalloc": top allocation sites that grew
+    during the request; tracing memory allocations slows every thread
+    while a sampled request runs.
+    """
+
+    def __init__(self, sample_rate=0.0, mode="cprofile", top=25):
+        if mode not in ("cprofile", "tracemalloc"):
+            raise ValueError(f"Unknown profiler mode: {mode}")
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.top = top
+        self._lock = threading.Lock()
+        self._active = 0
+
+    def start(self):
+        """Begin profiling if this request is sampled; returns a handle for stop(), or None"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        if self.mode == "cprofile":
+            with self._lock:
+                if self._active:
+                    return None
+                self._active = 1
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler (e.g. a debugger) owns the hook
+                with self._lock:
+                    self._active = 0
+                return None
+            return profiler
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self._active += 1
+        return tracemalloc.take_snapshot()
+
+    def stop(self, handle):
+        """Stop profiling and return the report"""
+        started = time.perf_counter()
+        if self.mode == "cprofile":
+            handle.disable()
+            with self._lock:
+                self._active = 0
+            output = io.StringIO()
+            pstats.Stats(handle, stream=output).sort_stats("cumulative").print_stats(self.top)
+            report = output.getvalue()
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            report = "\n".join(
+                [f"traced memory: current {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB"] +
+                [str(stat) for stat in snapshot.compare_to(handle, "lineno")[:self.top]]
+            )
+            with self._lock:
+                self._active -= 1
+                if not self._active:
+                    tracemalloc.stop()
+        logger.info(f"🔬 Profiled request ({self.mode}, report took {time.perf_counter() - started:.2f}s)")
+        return {"mode": self.mode, "report": report}
@@ -0,0 +1,138 @@
+"""
+Content-addressed, disk-backed cache for transcription responses
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def audio_cache_key(stream, endpoint, language=''):
+    """Hash the audio bytes plus endpoint and language, then rewind the stream"""
+    digest = hashlib.sha256()
+    digest.update(f"{endpoint}\x1f{language or ''}\x1f".encode('utf-8'))
+    stream.seek(0)
+    while True:
+        chunk = stream.read(HASH_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+class TranscriptCache:
+    """Stores whole response payloads as JSON files with size- and TTL-based eviction"""
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024, ttl_seconds=7 * 24 * 3600, enabled=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """Return the cached payload for key, or None on a miss or expired entry"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if self.ttl_seconds and age > self.ttl_seconds:
+                os.unlink(path)
+                raise FileNotFoundError(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+            # Refresh mtime so eviction is least-recently-used
+            os.utime(path, None)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return payload
+
+    def put(self, key, payload):
+        """Store payload under key, then evict expired and oldest entries"""
+        if not self.enabled:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"⚠️ Could not write transcript cache entry: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+        self._evict()
+
+    def delete(self, key):
+        """Drop the entry for key, if any"""
+        if self.enabled:
+            self._remove(self._path(key))
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.json') and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            try:
+                entries = self._entries()
+            except OSError:
+                return
+            now = time.time()
+            live = []
+            for mtime, size, path in entries:
+                if self.ttl_seconds and now - mtime > self.ttl_seconds:
+                    self._remove(path)
+                else:
+                    live.append((mtime, size, path))
+            total = sum(size for _, size, _ in live)
+            live.sort()
+            while live and total > self.max_bytes:
+                _, size, path = live.pop(0)
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        entries = self._entries() if self.enabled and os.path.isdir(self.directory) else []
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,325 @@
+"""
+Batched conversation translation with a persistent translation memory
+"""
+import os
+import json
+import time
+import atexit
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from alignment import normalize_tokens
+from tracing import bind
+
+logger = logging.getLogger(__name__)
+
+TRANSLATION_MODEL = "gpt-4o-mini"
+TRANSLATION_SYSTEM_PROMPT = (
+    "You are a professional medical translator. You will receive a JSON object with a "
+    "\"turns\" array of {\"id\", \"text\"} items. Translate every text to English accurately. "
+    "Respond with valid JSON only, in the form {\"translations\": [{\"id\": <same id>, \"text\": <English text>}]}. "
+    "Keep every id exactly as given and do not merge, split or skip turns."
+)
+
+
+def normalize_text(text):
+    """Normalize text for translation memory lookups"""
+    return " ".join((text or "").split()).lower()
+
+
+class TranslationMemory:
+    """
+    LRU-bounded translation memory keyed by (source language, normalized text).
+
+    save() writes the file only when entries were added, and at most once
+    per save_interval seconds; flush() (also run at exit) writes any
+    remaining changes.
+    """
+
+    def __init__(self, path=None, max_entries=5000, save_interval=30):
+        self.path = path
+        self.max_entries = max_entries
+        self.save_interval = save_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._changes = 0
+        self._last_save = 0.0
+        self.hits = 0
+        self.misses = 0
+        self._load()
+        if path:
+            atexit.register(self.flush)
+
+    @staticmethod
+    def _key(language, text):
+        return f"{language}\x1f{normalize_text(text)}"
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for key, value in data.get("entries", []):
+                self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            logger.info(f"📚 Loaded {len(self._entries)} translation memory entries")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load translation memory: {e}")
+
+    def save(self, force=False):
+        """Persist the memory to disk (atomic replace) if it changed and save_interval has passed"""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._changes or (not force and time.monotonic() - self._last_save < self.save_interval):
+                return
+            data = {"entries": list(self._entries.items())}
+            changes, self._changes = self._changes, 0
+            self._last_save = time.monotonic()
+        # Unique per writer: threads and worker processes may save at the same time
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not save translation memory: {e}")
+            with self._lock:
+                self._changes += changes
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def flush(self):
+        """Write any unsaved entries now"""
+        self.save(force=True)
+
+    def get(self, language, text):
+        key = self._key(language, text)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, language, text, translation):
+        key = self._key(language, text)
+        with self._lock:
+            if self._entries.get(key) != translation:
+                self._changes += 1
+            self._entries[key] = translation
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+def translation_request(items):
+    """Chat completion arguments for one batch of (id, text) items"""
+    payload = {"turns": [{"id": item_id, "text": text} for item_id, text in items]}
+    return {
+        "model": TRANSLATION_MODEL,
+        "messages": [
+            {"role": "system", "content": TRANSLATION_SYSTEM_PROMPT},
+            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
+        ],
+        "temperature": 0.3,
+        "response_format": {"type": "json_object"}
+    }
+
+
+def _request_translations(client, items):
+    """Send one batched translation request, return {id: translated_text}"""
+    return parse_translations(client.chat.completions.create(**translation_request(items)), items)
+
+
+def parse_translations(response, items):
+    """{id: translated_text} for the items a translation response answered"""
+    try:
+        parsed = json.loads(response.choices[0].message.content)
+    except (json.JSONDecodeError, TypeError):
+        logger.warning("Batched translation returned invalid JSON")
+        return {}
+
+    translations = parsed.get("translations", []) if isinstance(parsed, dict) else parsed
+    if isinstance(translations, dict):
+        # Accept {"0": "text", ...} as well
+        translations = [{"id": k, "text": v} for k, v in translations.items()]
+
+    results = {}
+    wanted = {item_id for item_id, _ in items}
+    for entry in translations or []:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            item_id = int(entry.get("id"))
+        except (TypeError, ValueError):
+            continue
+        text = entry.get("text")
+        if item_id in wanted and isinstance(text, str) and text.strip():
+            results[item_id] = text.strip()
+    return results
+
+
+def translate_turns(client, turns, source_language, memory=None, max_attempts=3, batch_size=40, max_workers=4):
+    """
+    Translate all conversation turns to English, setting turn['text_english'].
+
+    Turns found in the translation memory cost no API call. The remaining
+    unique texts are sent as numbered batches of at most batch_size, up
+    to max_workers at a time, so a long consult can't outgrow one reply;
+    only ids missing from the replies are asked for again. Turns that
+    still have no translation keep their original text.
+    """
+    unique_texts, turn_index = plan_translation(turns, source_language, memory)
+
+    translated = {}
+    pending = list(enumerate(unique_texts))
+    attempts = 0
+    while pending and attempts < max_attempts:
+        attempts += 1
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        logger.info(f"🌐 Batched translation: {len(pending)} turns in {len(batches)} batches (attempt {attempts})")
+        if len(batches) == 1:
+            translated.update(_request_translations(client, batches[0]))
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+                for results in executor.map(bind(lambda batch: _request_translations(client, batch)), batches):
+                    translated.update(results)
+        pending = [(i, text) for i, text in pending if i not in translated]
+
+    if pending:
+        logger.warning(f"⚠️ {len(pending)} turns left untranslated after {attempts} attempts")
+
+    apply_translations(turns, unique_texts, turn_index, translated, source_language, memory)
+    if memory and translated:
+        memory.save()
+
+    return turns
+
+
+def plan_translation(turns, source_language, memory=None):
+    """
+    Fill turns found in the translation memory; returns the remaining
+    unique texts and, per turn, the index of its text (None if filled)
+    """
+    unique_texts = []
+    index_by_text = {}
+    turn_index = []
+
+    for turn in turns:
+        text = turn.get('text', '')
+        cached = memory.get(source_language, text) if memory else None
+        if cached is not None:
+            turn['text_english'] = cached
+            turn_index.append(None)
+            continue
+        key = normalize_text(text)
+        if key not in index_by_text:
+            index_by_text[key] = len(unique_texts)
+            unique_texts.append(text)
+        turn_index.append(index_by_text[key])
+    return unique_texts, turn_index
+
+
+def apply_translations(turns, unique_texts, turn_index, translated, source_language, memory=None):
+    """Set text_english from {text index: translation} and remember new translations"""
+    for i, text in enumerate(unique_texts):
+        if i in translated and memory:
+            memory.put(source_language, text, translated[i])
+
+    for turn, index in zip(turns, turn_index):
+        if index is not None:
+            turn['text_english'] = translated.get(index, turn.get('text', ''))
+
+
+def is_english(language):
+    """Whisper reports the language as a code ("en") or a name ("english")"""
+    return (language or '').strip().lower() in ('en', 'english')
+
+
+def translate_conversation(client, conversation, detected_language, memory=None, batch_size=40, max_workers=4):
+    """
+    Translate conversation to English if not already in English.
+
+    Returns the conversation list with 'text_english' set on every turn.
+    """
+    translated_conversation = conversation.copy()
+
+    if detected_language and not is_english(detected_language):
+        logger.info(f"🌐 Translating from {detected_language} to English...")
+        try:
+            translate_turns(client, translated_conversation, detected_language, memory,
+                            batch_size=batch_size, max_workers=max_workers)
+            logger.info("✅ Translation complete")
+        except Exception as e:
+            logger.error(f"Translation error: {e}")
+            # Keep original text if translation fails
+            for turn in translated_conversation:
+                turn['text_english'] = turn['text']
+    else:
+        # Already in English
+        for turn in translated_conversation:
+            turn['text_english'] = turn['text']
+
+    return translated_conversation
+
+
+def translate_segments(client, segments, source_language, memory=None, batch_size=40, max_workers=4):
+    """
+    Translate Whisper segments before speaker turns exist (so translation
+    can run alongside segmentation), in the same bounded batches as turns.
+    Returns the English text of each segment, or None if a request failed.
+    """
+    items = [{"text": segment.text.strip()} for segment in segments]
+    try:
+        translate_turns(client, items, source_language, memory, batch_size=batch_size, max_workers=max_workers)
+    except Exception as e:
+        logger.error(f"Segment translation error: {e}")
+        return None
+    return [item['text_english'] for item in items]
+
+
+def join_segment_translations(conversation, segments, segment_translations, tolerance=0.15):
+    """
+    Set turn['text_english'] from the translations of the Whisper segments
+    that make up each aligned turn.
+
+    Each segment goes to the turn containing its midpoint. A turn is only
+    accepted when its segments account for its words (within tolerance);
+    otherwise a segment straddles a speaker change or missed the turn, and
+    the turn is returned for translating on its own.
+    """
+    starts = [turn.get('start', 0) for turn in conversation]
+    assigned = [[] for _ in conversation]
+    for segment, translation in zip(segments, segment_translations):
+        midpoint = (segment.start + segment.end) / 2
+        index = bisect.bisect_right(starts, midpoint) - 1
+        if index >= 0 and midpoint <= conversation[index].get('end', 0):
+            assigned[index].append((segment, translation))
+
+    leftover = []
+    for turn, parts in zip(conversation, assigned):
+        turn_words = len(normalize_tokens(turn.get('text', '')))
+        segment_words = sum(len(normalize_tokens(segment.text)) for segment, _ in parts)
+        if parts and turn_words and abs(segment_words - turn_words) <= max(1, tolerance * turn_words):
+            turn['text_english'] = " ".join(translation for _, translation in parts if translation)
+        else:
+            leftover.append(turn)
+    return leftover
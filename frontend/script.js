@@ -18,6 +18,7 @@ const recordingIndicator = document.getElementById('recordingIndicator');
 const resultText = document.getElementById('resultText');
 const languageBadge = document.getElementById('languageBadge');
 const durationBadge = document.getElementById('durationBadge');
+const timingBadge = document.getElementById('timingBadge');
 const segmentsContainer = document.getElementById('segmentsContainer');
 const segmentsCount = document.getElementById('segmentsCount');
 const conversationContainer = document.getElementById('conversationContainer');
@@ -46,6 +47,9 @@ let currentAudioBlob = null;
 let audioStream = null;
 let backendConnected = false;
 let currentConversation = null; // Store conversation for SOAP generation
+let currentSoapKey = null; // Server-side key of SOAP notes being generated speculatively
+let streamSessionId = null; // Live streaming transcription session
+let streamUploads = Promise.resolve(); // Keeps timeslice uploads in order
 
 // Initialize application
 document.addEventListener('DOMContentLoaded', () => {
@@ -268,10 +272,17 @@ async function startRecording() {
         mediaRecorder = new MediaRecorder(audioStream);
         audioChunks = [];
         
+        // Start a live transcription session (falls back to upload-after-stop if unavailable).
+        // It heads the upload chain: timeslices wait for the session id instead of being dropped,
+        // and the first one carries the WebM header the server needs.
+        streamSessionId = null;
+        streamUploads = startStreamSession();
+        
         // Handle data available
         mediaRecorder.addEventListener('dataavailable', (event) => {
             if (event.data.size > 0) {
                 audioChunks.push(event.data);
+                sendStreamChunk(event.data);
             }
         });
         
@@ -288,7 +299,8 @@ async function startRecording() {
             recordedAudio.src = audioUrl;
             recordedAudio.style.display = 'block';
             
-            showToast('✅ Recording saved. Ready to transcribe.', 'success');
+            // Waits for the session start and queued timeslices; falls back to upload if there is no session
+            finishStreamSession();
         });
         
         // Start recording
@@ -342,6 +354,148 @@ function stopRecording() {
     }
 }
 
+// Start a live streaming transcription session
+async function startStreamSession() {
+    try {
+        const response = await fetch(`${BACKEND_URL}/api/stream/start`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'ngrok-skip-browser-warning': '1'
+            },
+            body: JSON.stringify({
+                language: languageSelect.value,
+                format: 'webm'
+            })
+        });
+        const result = await response.json();
+        
+        // A recording stopped or cleared before the session started is uploaded after stop instead
+        if (response.ok && result.success && mediaRecorder && mediaRecorder.state !== 'inactive') {
+            streamSessionId = result.session_id;
+            console.log('Streaming session started:', streamSessionId);
+        }
+    } catch (error) {
+        console.warn('Live transcription unavailable, will upload after recording:', error);
+    }
+}
+
+// Send one recorded timeslice and show the turns transcribed so far
+function sendStreamChunk(chunk) {
+    streamUploads = streamUploads.then(async () => {
+        if (!streamSessionId) {
+            return;
+        }
+        
+        try {
+            const response = await fetch(`${BACKEND_URL}/api/stream/${streamSessionId}/chunk`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/octet-stream',
+                    'ngrok-skip-browser-warning': '1'
+                },
+                body: chunk
+            });
+            const result = await response.json();
+            
+            if (response.ok && result.conversation && result.conversation.length > 0) {
+                document.getElementById('transcriptionSection').style.display = 'block';
+                displayConversation(result.conversation);
+            } else if (!response.ok) {
+                console.warn('Streaming chunk rejected:', result.error);
+                streamSessionId = null;
+            }
+        } catch (error) {
+            console.warn('Streaming chunk failed:', error);
+            streamSessionId = null;
+        }
+    });
+}
+
+// Finish the streaming session: only the last few seconds remain to process
+async function finishStreamSession() {
+    loadingContainer.style.display = 'block';
+    
+    try {
+        // Wait for queued timeslices (including the final one) to be uploaded
+        await streamUploads;
+        if (!streamSessionId) {
+            showToast('✅ Recording saved. Ready to transcribe.', 'success');
+            return;
+        }
+        
+        const sessionId = streamSessionId;
+        streamSessionId = null;
+        
+        const response = await fetch(`${BACKEND_URL}/api/stream/${sessionId}/stop`, {
+            method: 'POST',
+            headers: {
+                'ngrok-skip-browser-warning': '1'
+            }
+        });
+        const result = await response.json();
+        
+        if (response.ok && result.success) {
+            displayTranscriptionResult(result, 'transcribe');
+        } else {
+            showToast(`❌ Live transcription failed: ${result.error || 'Unknown error'}. Click transcribe to retry.`, 'error');
+        }
+    } catch (error) {
+        console.error('Streaming stop error:', error);
+        showToast('✅ Recording saved. Ready to transcribe.', 'success');
+    } finally {
+        loadingContainer.style.display = 'none';
+    }
+}
+
+// Update UI with transcription results
+function displayTranscriptionResult(result, action) {
+    resultText.value = result.text;
+    
+    // Update badges
+    languageBadge.textContent = `Language: ${result.language || 'auto-detected'}`;
+    if (result.duration) {
+        durationBadge.textContent = `Duration: ${result.duration.toFixed(2)}s`;
+    }
+    
+    // Update diarization status
+    diarizationBadge.textContent = `Diarization: ${result.diarization_available ? 'Active' : 'Basic'}`;
+    diarizationBadge.style.background = result.diarization_available ? 
+        'linear-gradient(135deg, var(--sky-blue) 0%, var(--light-blue) 100%)' : 
+        'rgba(0, 119, 182, 0.3)';
+    
+    // Display conversation if available
+    if (result.conversation && result.conversation.length > 0) {
+        displayConversation(result.conversation);
+        currentSoapKey = result.soap_key || null;
+        
+        // Automatically generate SOAP notes after transcription
+        if (action === 'transcribe') {
+            console.log('Auto-generating SOAP notes...');
+            setTimeout(() => generateSOAPNotes(), 500); // Small delay for better UX
+        }
+    } else {
+        conversationContainer.innerHTML = '<p class="empty-state">No conversation detected</p>';
+        conversationCount.textContent = '0 turns';
+    }
+    
+    // Update segments (legacy)
+    if (result.segments && result.segments.length > 0) {
+        updateSegments(result.segments);
+    } else {
+        segmentsContainer.innerHTML = '<p class="empty-state">No segment data available</p>';
+        segmentsCount.textContent = '0 segments';
+    }
+    
+    // Show transcription section
+    document.getElementById('transcriptionSection').style.display = 'block';
+    
+    showToast(
+        `✅ ${action === 'transcribe' ? 'Transcription' : 'Translation'} successful!`,
+        'success'
+    );
+}
+
 // Process audio (transcribe or translate)
 async function processAudio(action) {
     // Validate
@@ -407,51 +561,15 @@ async function processAudio(action) {
         const result = await response.json();
         console.log('Response data:', result);
         
+        // Server-side stage breakdown (Server-Timing header, if the backend sends it)
+        displayServerTiming(
+            parseServerTiming(response.headers.get('Server-Timing')),
+            response.headers.get('X-Trace-Id')
+        );
+        
         if (response.ok && result.success) {
             // Update UI with results
-            resultText.value = result.text;
-            
-            // Update badges
-            languageBadge.textContent = `Language: ${result.language || 'auto-detected'}`;
-            if (result.duration) {
-                durationBadge.textContent = `Duration: ${result.duration.toFixed(2)}s`;
-            }
-            
-            // Update diarization status
-            diarizationBadge.textContent = `Diarization: ${result.diarization_available ? 'Active' : 'Basic'}`;
-            diarizationBadge.style.background = result.diarization_available ? 
-                'linear-gradient(135deg, var(--sky-blue) 0%, var(--light-blue) 100%)' : 
-                'rgba(0, 119, 182, 0.3)';
-            
-            // Display conversation if available
-            if (result.conversation && result.conversation.length > 0) {
-                displayConversation(result.conversation);
-                
-                // Automatically generate SOAP notes after transcription
-                if (action === 'transcribe') {
-                    console.log('Auto-generating SOAP notes...');
-                    setTimeout(() => generateSOAPNotes(), 500); // Small delay for better UX
-                }
-            } else {
-                conversationContainer.innerHTML = '<p class="empty-state">No conversation detected</p>';
-                conversationCount.textContent = '0 turns';
-            }
-            
-            // Update segments (legacy)
-            if (result.segments && result.segments.length > 0) {
-                updateSegments(result.segments);
-            } else {
-                segmentsContainer.innerHTML = '<p class="empty-state">No segment data available</p>';
-                segmentsCount.textContent = '0 segments';
-            }
-            
-            // Show transcription section
-            document.getElementById('transcriptionSection').style.display = 'block';
-            
-            showToast(
-                `✅ ${action === 'transcribe' ? 'Transcription' : 'Translation'} successful!`,
-                'success'
-            );
+            displayTranscriptionResult(result, action);
             
         } else {
             const errorMsg = result.error || 'Unknown error';
@@ -476,6 +594,37 @@ async function processAudio(action) {
     }
 }
 
+// Parse a Server-Timing header into [{name, duration}] (milliseconds)
+function parseServerTiming(header) {
+    if (!header) return [];
+    
+    return header.split(',').map(entry => {
+        const [name, ...params] = entry.trim().split(';');
+        const dur = params.find(param => param.trim().startsWith('dur='));
+        return { name: name.trim(), duration: dur ? parseFloat(dur.trim().slice(4)) : 0 };
+    }).filter(entry => entry.name);
+}
+
+// Show the server total in the timing badge, with the per-stage breakdown as its tooltip
+function displayServerTiming(timings, traceId) {
+    const total = timings.find(entry => entry.name === 'total');
+    if (!total) {
+        timingBadge.textContent = 'Server: --';
+        timingBadge.title = '';
+        return;
+    }
+    
+    const stages = timings.filter(entry => entry.name !== 'total');
+    timingBadge.textContent = `Server: ${(total.duration / 1000).toFixed(2)}s`;
+    timingBadge.title = stages
+        .map(entry => `${entry.name}: ${(entry.duration / 1000).toFixed(2)}s`)
+        .concat(traceId ? [`trace: ${traceId}`] : [])
+        .join('\n');
+    
+    console.log(`Server timing (trace ${traceId || 'n/a'}):`);
+    console.table(timings);
+}
+
 // Display conversation with speaker diarization
 function displayConversation(conversation) {
     conversationContainer.innerHTML = '';
@@ -535,12 +684,23 @@ function formatTime(seconds) {
 
 // Clear all inputs and results
 function clearAll() {
+    // Speculative SOAP generation for the discarded conversation is no longer needed
+    if (currentSoapKey) {
+        fetch(`${BACKEND_URL}/api/generate-soap/${currentSoapKey}`, {
+            method: 'DELETE',
+            headers: { 'ngrok-skip-browser-warning': '1' }
+        }).catch(() => {});
+        currentSoapKey = null;
+    }
+    
     currentAudioBlob = null;
     currentConversation = null;
     audioFileInput.value = '';
     resultText.value = '';
     languageBadge.textContent = 'Language: --';
     durationBadge.textContent = 'Duration: --';
+    timingBadge.textContent = 'Server: --';
+    timingBadge.title = '';
     diarizationBadge.textContent = 'Diarization: --';
     segmentsContainer.innerHTML = '<p class="empty-state">No segments available yet</p>';
     segmentsCount.textContent = '0 segments';
@@ -557,7 +717,8 @@ function clearAll() {
     soapAssessment.textContent = '';
     soapPlan.textContent = '';
     
-    // Stop recording if active
+    // Stop recording if active (and abandon any live transcription session)
+    streamSessionId = null;
     if (mediaRecorder && mediaRecorder.state !== 'inactive') {
         mediaRecorder.stop();
     }
@@ -650,6 +811,12 @@ async function generateSOAPNotes() {
     try {
         showToast('🤖 Generating SOAP notes with AI...', 'info');
         
+        // Prefer the streaming endpoint so sections appear as they are written
+        const streamed = await generateSOAPNotesStreaming();
+        if (streamed) {
+            return;
+        }
+        
         const response = await fetch(`${BACKEND_URL}/api/generate-soap`, {
             method: 'POST',
             headers: {
@@ -657,25 +824,15 @@ async function generateSOAPNotes() {
                 'ngrok-skip-browser-warning': '1'
             },
             body: JSON.stringify({
-                conversation: currentConversation
+                conversation: currentConversation,
+                soap_key: currentSoapKey
             })
         });
         
         const result = await response.json();
         
         if (response.ok && result.success) {
-            // Display SOAP notes
-            soapSubjective.textContent = result.soap_sections.subjective || 'N/A';
-            soapObjective.textContent = result.soap_sections.objective || 'N/A';
-            soapAssessment.textContent = result.soap_sections.assessment || 'N/A';
-            soapPlan.textContent = result.soap_sections.plan || 'N/A';
-            
-            // Show SOAP section (first)
-            document.getElementById('soapSection').style.display = 'block';
-            
-            // Scroll to top to show SOAP notes first
-            window.scrollTo({ top: 0, behavior: 'smooth' });
-            
+            displaySOAPSections(result.soap_sections);
             showToast('✅ SOAP notes generated successfully!', 'success');
         } else {
             showToast(`❌ Failed to generate SOAP notes: ${result.error}`, 'error');
@@ -686,6 +843,100 @@ async function generateSOAPNotes() {
     }
 }
 
+// Display final SOAP sections
+function displaySOAPSections(sections) {
+    soapSubjective.textContent = sections.subjective || 'N/A';
+    soapObjective.textContent = sections.objective || 'N/A';
+    soapAssessment.textContent = sections.assessment || 'N/A';
+    soapPlan.textContent = sections.plan || 'N/A';
+    
+    // Show SOAP section (first)
+    document.getElementById('soapSection').style.display = 'block';
+    
+    // Scroll to top to show SOAP notes first
+    window.scrollTo({ top: 0, behavior: 'smooth' });
+}
+
+// Stream SOAP notes over Server-Sent Events; returns false if streaming is unavailable
+async function generateSOAPNotesStreaming() {
+    const sectionElements = {
+        subjective: soapSubjective,
+        objective: soapObjective,
+        assessment: soapAssessment,
+        plan: soapPlan
+    };
+    
+    const response = await fetch(`${BACKEND_URL}/api/generate-soap/stream`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+            'ngrok-skip-browser-warning': '1'
+        },
+        body: JSON.stringify({
+            conversation: currentConversation,
+            soap_key: currentSoapKey
+        })
+    });
+    
+    if (!response.ok || !response.body || !response.body.getReader) {
+        return false;
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let started = false;
+    
+    const handleEvent = (eventName, data) => {
+        if (eventName === 'section') {
+            if (!started) {
+                Object.values(sectionElements).forEach(el => el.textContent = '');
+                document.getElementById('soapSection').style.display = 'block';
+                window.scrollTo({ top: 0, behavior: 'smooth' });
+                started = true;
+            }
+        } else if (eventName === 'delta') {
+            sectionElements[data.section].textContent += data.text;
+        } else if (eventName === 'done') {
+            displaySOAPSections(data.soap_sections);
+            showToast('✅ SOAP notes generated successfully!', 'success');
+        } else if (eventName === 'error') {
+            showToast(`❌ Failed to generate SOAP notes: ${data.error}`, 'error');
+        }
+    };
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        
+        // SSE events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let eventName = 'message';
+            let dataLines = [];
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    eventName = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+            if (dataLines.length > 0) {
+                handleEvent(eventName, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+    
+    return true;
+}
+
 // Copy SOAP Notes
 function copySOAPNotes() {
     const soapText = `SUBJECTIVE:\n${soapSubjective.textContent}\n\nOBJECTIVE:\n${soapObjective.textContent}\n\nASSESSMENT:\n${soapAssessment.textContent}\n\nPLAN:\n${soapPlan.textContent}`;